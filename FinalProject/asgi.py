@@ -3,6 +3,10 @@ ASGI config for FinalProject project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve the project with an ASGI server (e.g. ``uvicorn FinalProject.asgi:application``)
+for the real-time endpoints: the server-sent events stream of
+``client.views.shipment_events`` keeps one long-lived async request per watcher.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 """
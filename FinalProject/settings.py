@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -46,13 +49,14 @@ INSTALLED_APPS = [
     'manager',
 ]
 AUTH_USER_MODEL = 'authentication.User'
+AUTHENTICATION_BACKENDS = ['authentication.backends.ProfileBackend']
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'authentication.middleware.ProfileMiddleware',  # AuthenticationMiddleware + cached user/profile
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -68,6 +72,8 @@ SESSION_COOKIE_SECURE = False  # Set to True in production with HTTPS
 SESSION_COOKIE_HTTPONLY = True
 SESSION_COOKIE_AGE = 1209600  # Two weeks
 SESSION_COOKIE_SAMESITE = 'Lax'
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'  # Sessions read from the 'sessions' cache
+SESSION_CACHE_ALIAS = 'sessions'
 
 ROOT_URLCONF = 'FinalProject.urls'
 
@@ -102,9 +108,71 @@ DATABASES = {
 }
 
 
+# Caches
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+# Named caches, used through common/caching.py. CACHE_BACKEND selects the
+# backend of all of them:
+#   locmem - one cache per process (development, single worker)
+#   file   - shared by the processes of one host, under CACHE_FILE_DIR
+#   redis  - a Redis-compatible server at CACHE_REDIS_URL, shared by every host
+#            (needs the redis package)
+
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', 'redis://127.0.0.1:6379/0')
+CACHE_FILE_DIR = os.environ.get('CACHE_FILE_DIR', str(BASE_DIR / '.cache'))
+
+
+def _cache(alias, max_entries):
+    if CACHE_BACKEND == 'locmem':
+        config = {
+            'BACKEND': 'common.cache_backends.LocMemCache',
+            'LOCATION': alias,
+            'OPTIONS': {'MAX_ENTRIES': max_entries},
+        }
+    elif CACHE_BACKEND == 'file':
+        config = {
+            'BACKEND': 'common.cache_backends.FileBasedCache',
+            'LOCATION': os.path.join(CACHE_FILE_DIR, alias),
+            'OPTIONS': {'MAX_ENTRIES': max_entries},
+        }
+    elif CACHE_BACKEND == 'redis':
+        # Redis evicts by its own maxmemory policy
+        config = {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+        }
+    else:
+        raise ImproperlyConfigured(f"Unknown CACHE_BACKEND {CACHE_BACKEND!r} (locmem, file or redis)")
+    config['KEY_PREFIX'] = alias
+    return config
+
+
+CACHES = {
+    'default': _cache('default', 20000),  # ETAs, geofences, public tracking, cache statistics
+    'refdata': _cache('refdata', 100),  # Reference data version stamp
+    'sessions': _cache('sessions', 20000),  # Sessions, resolved session users, device token revocations
+    'dashboards': _cache('dashboards', 1000),  # Manager analytics
+    'ratelimit': _cache('ratelimit', 20000),  # Throttling counters, unknown usernames
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
+# Password hashing: PBKDF2-SHA256 with an iteration count measured on the
+# production hardware (`python manage.py benchmark_hashers`). Django's own
+# default (1,200,000 in 6.0) is the floor: lower values are ignored by the
+# hasher. Stored hashes with another count are re-hashed on the next
+# successful login.
+PASSWORD_HASHERS = [
+    'authentication.hashers.TunedPBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+PASSWORD_PBKDF2_ITERATIONS = 1200000
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -142,3 +210,89 @@ STATICFILES_DIRS = [BASE_DIR / 'static']
 
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Trip reconstruction (common/trips.py)
+TRIP_MAX_PING_ACCURACY_M = 100  # Ignore breadcrumbs less accurate than this
+TRIP_MAX_SPEED_KMH = 160  # Segments faster than this are treated as GPS jumps
+
+# Geofence arrival detection (common/geofence.py)
+GEOFENCE_ENTER_PINGS = 2  # Consecutive pings inside a stop radius before "arrived"
+GEOFENCE_EXIT_PINGS = 2  # Consecutive pings outside the exit radius before "departed"
+GEOFENCE_EXIT_FACTOR = 1.25  # Exit radius = stop radius x factor (hysteresis)
+GEOFENCE_TOUR_CACHE_SECONDS = 30  # How long a driver's current tour is cached
+GEOFENCE_STATE_SECONDS = 3600  # Debounce streaks and stop version stamp of a tour are dropped after this long unchanged
+GEOFENCE_MAX_TOURS = 1000  # Compiled tours each process keeps in memory (most recently compiled)
+
+# Live ETA engine (common/eta.py)
+ETA_DEFAULT_SPEED_KMH = 30  # Used until a driver has completed tours with GPS data
+ETA_DEFAULT_SERVICE_MINUTES = 5  # Time spent at a stop when there is no history
+ETA_ROAD_FACTOR = 1.3  # Road distance / straight-line distance
+ETA_MIN_RECOMPUTE_SECONDS = 30  # Minimum delay between two ping-driven recomputations of a tour
+ETA_CACHE_SECONDS = 900
+ETA_PROFILE_CACHE_SECONDS = 3600
+
+# Real-time shipment tracking stream (client.views.shipment_events, ASGI only:
+# under WSGI the page does not open it). Changes are pushed instantly to the
+# watchers of the process that made them (common/pubsub.py is in-process);
+# watchers on other processes catch up every keepalive (a cache read, and a query
+# only when the shipment's stamp shows another process published an event).
+SSE_KEEPALIVE_SECONDS = 15
+
+# Reference data cache (common/refdata.py)
+REFDATA_CHECK_SECONDS = 2  # How often a process compares its tariff tables with the shared version stamp
+REFDATA_LOCAL_RELOAD_SECONDS = 30  # With the locmem backend (stamp not shared): how often a process reloads them
+REFDATA_MISSING_SECONDS = 30  # How long an id still unknown after a reload is not looked up again
+
+# Pricing engine (common/pricing.py)
+PRICING_MAX_BATCH = 10000  # Parcels accepted per batch quote request
+
+# Request-scoped user/profile resolution (authentication/middleware.py)
+AUTH_USER_CACHE_SECONDS = 300  # How long a session keeps its resolved user and profile
+
+# Driver app device tokens (authentication/tokens.py)
+DRIVER_TOKEN_SECONDS = 900  # Lifetime of a device token; the app refreshes it before expiry
+DRIVER_TOKEN_DENYLIST_CHECK_SECONDS = 2  # How often a process checks for new revocations
+
+# Login service (authentication/login.py)
+LOGIN_IP_ATTEMPTS = 20  # Login attempts allowed per client IP ...
+LOGIN_IP_WINDOW_SECONDS = 60  # ... per window
+LOGIN_USER_FAILURES = 5  # Failed attempts allowed per username ...
+LOGIN_USER_WINDOW_SECONDS = 300  # ... per window
+LOGIN_UNKNOWN_USER_CACHE_SECONDS = 300  # How long an unknown username is answered without a query
+LOGIN_MAX_CONCURRENT_HASHES = 4  # Password checks running at once per process
+LOGIN_HASH_WAIT_SECONDS = 5  # Wait for a free slot before answering 'busy'
+
+# Public tracking API (common/tracking.py)
+PUBLIC_TRACKING_REQUESTS = 60  # Lookups allowed per client IP ...
+PUBLIC_TRACKING_WINDOW_SECONDS = 60  # ... per window
+PUBLIC_TRACKING_CACHE_SECONDS = 86400  # Cached payloads are rewritten on every tracking change
+PUBLIC_TRACKING_UNKNOWN_CACHE_SECONDS = 60  # How long an unknown number is answered without a query
+PUBLIC_TRACKING_MAX_EVENTS = 20  # Latest tracking events included in the timeline
+PUBLIC_TRACKING_MAX_AGE = 30  # Cache-Control max-age of tracking responses (browsers, proxies)
+
+# Cache layer (common/caching.py)
+CACHE_NAMESPACE_VERSIONS = {}  # namespace -> version; bump one to drop everything that namespace cached
+CACHE_STATS_FLUSH_SECONDS = 10  # How often a process adds its cache statistics to the shared totals
+
+# Stale-while-revalidate cache (common/swr.py), used by the manager analytics
+ANALYTICS_CACHE_SOFT_SECONDS = 300  # Analytics older than this are recomputed in the background ...
+ANALYTICS_CACHE_HARD_SECONDS = 3600  # ... and served stale meanwhile, up to this age
+SWR_LOCK_SECONDS = 60  # Longest expected recomputation; its lock expires after this
+SWR_WAIT_SECONDS = 10  # How long a request waits for another process to fill a missing entry
+SWR_POLL_SECONDS = 0.1
+
+# Approximate counts of paginated lists (common/counting.py)
+APPROX_COUNT_THRESHOLD = 1000  # Lists up to this size are counted exactly
+APPROX_COUNT_SAMPLE = 10000  # Latest rows sampled to estimate larger totals
+APPROX_COUNT_SOFT_SECONDS = 300  # Maintained counts older than this are recounted in the background ...
+APPROX_COUNT_HARD_SECONDS = 3600  # ... and served meanwhile, up to this age
+
+# Code autocomplete (common/typeahead.py)
+TYPEAHEAD_DAYS = 365  # Shipments and invoices created within this many days are suggested
+TYPEAHEAD_SYNC_SECONDS = 5  # How often a process indexes the rows created by other processes
+TYPEAHEAD_RELOAD_SECONDS = 3600  # How often a process rebuilds its index (drops deleted and old codes)
+TYPEAHEAD_LIMIT = 10  # Suggestions per query
+
+# History archive (common/archive.py)
+ARCHIVE_AFTER_MONTHS = 6  # Tracking events of shipments delivered this long ago, and older audit logs, are archived
+ARCHIVE_BATCH_SIZE = 1000  # Rows moved per transaction
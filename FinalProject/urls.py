@@ -17,6 +17,7 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import include, path
 from authentication import views as auth_views
+from common import views as common_views
 from django.views.generic import TemplateView
 
 urlpatterns = [
@@ -37,4 +38,7 @@ urlpatterns = [
     path('manager/', include('manager.urls')),
     path('client/', include('client.urls')),
     path('driver/', include('driver.urls')),
+
+    # Public tracking API (no login)
+    path('api/track/<str:shipment_number>/', common_views.public_tracking, name='public_tracking'),
 ]
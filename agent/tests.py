@@ -1,3 +1,99 @@
+import json
+from decimal import Decimal
+
 from django.test import TestCase
 
-# Create your tests here.
+from authentication.models import User
+from common import ledger
+from common.models import Client, DeliveryTour
+from common.tests import legacy_amount, make_fixtures, make_shipment, page_queries
+
+
+class AgentTestCase(TestCase):
+    def setUp(self):
+        self.fixtures = make_fixtures()
+        self.user = User(username='agent', role='agent')
+        self.user.set_unusable_password()
+        self.user.save()
+        self.client.force_login(self.user)
+
+
+# ==================== BATCH QUOTES ====================
+
+class QuoteApiTests(AgentTestCase):
+    def quote(self, payload):
+        return self.client.post('/agent/api/quotes/', json.dumps(payload), content_type='application/json')
+
+    def test_quotes_every_parcel(self):
+        destination, service_type = self.fixtures.destination, self.fixtures.service_type
+
+        response = self.quote({'parcels': [
+            {'destination': destination.pk, 'service_type': service_type.pk, 'weight': '3.5', 'volume': '0.02'},
+            {'destination': 9999, 'service_type': service_type.pk, 'weight': '1', 'volume': '0'},
+        ]})
+
+        self.assertEqual(response.status_code, 200)
+        quotes = response.json()['quotes']
+        self.assertEqual(
+            Decimal(quotes[0]['amount']),
+            legacy_amount(destination, service_type, Decimal('3.5'), Decimal('0.02'))
+        )
+        self.assertIn('error', quotes[1])
+
+    def test_rejects_invalid_batches(self):
+        self.assertEqual(self.quote({'parcels': [{'destination': 1}]}).status_code, 400)
+        self.assertEqual(self.quote({'parcels': [], 'at': 'yesterday'}).status_code, 400)
+        with self.settings(PRICING_MAX_BATCH=1):
+            parcel = {'destination': 1, 'service_type': 1, 'weight': '1', 'volume': '0'}
+            self.assertEqual(self.quote({'parcels': [parcel, parcel]}).status_code, 400)
+
+
+# ==================== LIST PROJECTIONS ====================
+
+class ShipmentListTests(AgentTestCase):
+    def test_queries_do_not_grow_with_the_rows(self):
+        queries = page_queries(self.client, '/agent/shipments/')
+        for shipment in range(5):
+            make_shipment(self.fixtures)
+
+        self.assertEqual(len(page_queries(self.client, '/agent/shipments/')), len(queries))
+        self.assertFalse([sql for sql in queries if '"description"' in sql and 'FROM "shipments"' in sql])
+
+
+# ==================== DELIVERY TOURS ====================
+
+class CreateDeliveryTourTests(AgentTestCase):
+    def test_counters_count_each_assigned_shipment_once(self):
+        shipments = [make_shipment(self.fixtures) for shipment in range(2)]
+
+        response = self.client.post('/agent/tours/create/', {
+            'driver': self.fixtures.driver.pk, 'vehicle': self.fixtures.vehicle.pk, 'date': '2030-01-02',
+            'notes': 'Morning round', 'shipments': [shipment.pk for shipment in shipments],
+        })
+
+        tour = DeliveryTour.objects.exclude(pk=self.fixtures.tour.pk).get()
+        self.assertRedirects(response, f'/agent/tours/{tour.pk}/', fetch_redirect_response=False)
+        self.assertEqual((tour.total_shipments, tour.total_weight), (2, Decimal('5.00')))
+        self.assertEqual((str(tour.date), tour.notes, tour.created_by), ('2030-01-02', 'Morning round', self.user))
+
+
+# ==================== CLIENTS ====================
+
+class DeleteClientTests(AgentTestCase):
+    def test_clients_with_account_history_are_kept(self):
+        client = self.fixtures.client
+        ledger.adjust(client, Decimal('10.00'), 'Opening balance')
+
+        response = self.client.post(f'/agent/clients/{client.pk}/delete/', follow=True)
+
+        self.assertContains(response, 'has account history (ledger entries) and cannot be deleted')
+        self.assertTrue(Client.objects.filter(pk=client.pk).exists())
+
+    def test_clients_without_history_are_deleted(self):
+        client = Client.objects.create(
+            name='New', email='new@example.com', phone='1', address='a', city='Oran', postal_code='31000'
+        )
+
+        self.client.post(f'/agent/clients/{client.pk}/delete/')
+
+        self.assertFalse(Client.objects.filter(pk=client.pk).exists())
@@ -23,6 +23,7 @@ urlpatterns = [
 
     # Section 2: Shipments & Tracking
     path('shipments/create/', views.create_shipment, name='create_shipment'),
+    path('api/quotes/', views.quote_shipments, name='quote_shipments'),
     path('shipments/', views.ShipmentListView.as_view(), name='shipment_list'),
     path('shipments/<int:pk>/', views.ShipmentDetailView.as_view(), name='shipment_detail'),
     path('shipments/<int:shipment_id>/tracking/add/', views.add_tracking_event, name='add_tracking'),
@@ -46,4 +47,8 @@ urlpatterns = [
     # Section 5: Claims
     path('claims/', views.manage_claims, name='claims'),
     path('claims/<int:claim_id>/update/', views.update_claim_status, name='update_claim'),
+
+    # Search
+    path('api/search/', views.search_records, name='search'),
+    path('api/codes/', views.suggest_codes, name='suggest_codes'),
 ]
\ No newline at end of file
@@ -1,27 +1,32 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.http import JsonResponse
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.views.generic import TemplateView, ListView, DetailView, CreateView, UpdateView
 from django.contrib import messages
-from django.core.paginator import Paginator
+from django.utils.decorators import method_decorator
 from django.utils import timezone
-from django.db.models import Q, Count, Sum
+from django.utils.dateparse import parse_datetime
+from django.conf import settings
+from django.db.models import ProtectedError, Q, Count, Sum
 from common.models import (
     Client, Driver, Vehicle, Destination, ServiceType, Shipment,
     Invoice, Payment, Incident, Claim, Favorite, DeliveryTour,
     TrackingEvent, TourShipment, InvoiceLine
 )
+from common import archive, eta, ledger, pricing, refdata, search, typeahead
+from common.conditional import conditional_page, shipment_validators
+from common.pagination import CursorPaginationMixin, paginate
+from common.projections import ProjectionMixin
+from authentication.decorators import role_required
 from decimal import Decimal
 from datetime import timedelta
 import json
 
 # ==================== DASHBOARD ====================
 
+@role_required('agent')
 def agent_dashboard(request):
     """Agent dashboard with system overview"""
-    if not request.user.is_authenticated or request.user.role != 'agent':
-        return redirect('/auth/agent/login/')
-
     # Get recent activities
     context = {
         'recent_shipments': Shipment.objects.all().order_by('-created_at')[:5],
@@ -36,46 +41,45 @@ def agent_dashboard(request):
 
 # ==================== SECTION 0: FAVORITES ====================
 
+@role_required('agent')
 def manage_favorites(request):
     """AG-00-01 to AG-00-04: Manage favorite features"""
-    if not request.user.is_authenticated or request.user.role != 'agent':
-        return redirect('/auth/agent/login/')
-
     if request.method == 'POST':
         action = request.POST.get('action')
         feature = request.POST.get('feature')
 
         if action == 'add':
             Favorite.objects.get_or_create(
-                user_id=request.session['user_id'],
+                user_id=request.user.id,
                 feature=feature,
-                defaults={'order': Favorite.objects.filter(user_id=request.session['user_id']).count()}
+                defaults={'order': Favorite.objects.filter(user_id=request.user.id).count()}
             )
         elif action == 'remove':
-            Favorite.objects.filter(user_id=request.session['user_id'], feature=feature).delete()
+            Favorite.objects.filter(user_id=request.user.id, feature=feature).delete()
         elif action == 'reorder':
             order_data = json.loads(request.POST.get('order_data', '{}'))
             for feature, order in order_data.items():
-                Favorite.objects.filter(user_id=request.session['user_id'], feature=feature).update(order=order)
+                Favorite.objects.filter(user_id=request.user.id, feature=feature).update(order=order)
 
         return JsonResponse({'success': True})
 
-    favorites = Favorite.objects.filter(user_id=request.session['user_id']).order_by('order')
+    favorites = Favorite.objects.filter(user_id=request.user.id).order_by('order')
     return render(request, 'agent/favorites.html', {'favorites': favorites})
 
 # ==================== SECTION 1: TABLES (CRUD) ====================
 
+@method_decorator(role_required('agent'), name='dispatch')
 class ClientListView(ListView):
     """AG-01-01: View Client table"""
     model = Client
     template_name = 'agent/client_list.html'
     paginate_by = 20
 
-    def dispatch(self, request, *args, **kwargs):
-        if 'user_id' not in request.session or request.session.get('user_role') != 'agent':
-            return redirect('/auth/agent/login/')
-        return super().dispatch(request, *args, **kwargs)
+    def get_queryset(self):
+        # Balances from the clients' ledgers (common/ledger.py)
+        return ledger.with_balance(super().get_queryset())
 
+@method_decorator(role_required('agent'), name='dispatch')
 class ClientCreateView(CreateView):
     """AG-01-01: Create Client"""
     model = Client
@@ -83,15 +87,11 @@ class ClientCreateView(CreateView):
     fields = ['name', 'email', 'phone', 'address', 'city', 'postal_code', 'country']
     success_url = reverse_lazy('agent:client_list')
 
-    def dispatch(self, request, *args, **kwargs):
-        if 'user_id' not in request.session or request.session.get('user_role') != 'agent':
-            return redirect('/auth/agent/login/')
-        return super().dispatch(request, *args, **kwargs)
-
     def form_valid(self, form):
         messages.success(self.request, 'Client created successfully!')
         return super().form_valid(form)
 
+@method_decorator(role_required('agent'), name='dispatch')
 class ClientUpdateView(UpdateView):
     """AG-01-01: Update Client"""
     model = Client
@@ -99,41 +99,42 @@ class ClientUpdateView(UpdateView):
     fields = ['name', 'email', 'phone', 'address', 'city', 'postal_code', 'country']
     success_url = reverse_lazy('agent:client_list')
 
-    def dispatch(self, request, *args, **kwargs):
-        if 'user_id' not in request.session or request.session.get('user_role') != 'agent':
-            return redirect('/auth/agent/login/')
-        return super().dispatch(request, *args, **kwargs)
-
     def form_valid(self, form):
         messages.success(self.request, 'Client updated successfully!')
         return super().form_valid(form)
 
+@role_required('agent')
 def delete_client(request, pk):
     """AG-01-01: Delete Client"""
-    if 'user_id' not in request.session or request.session.get('user_role') != 'agent':
-        return redirect('/auth/agent/login/')
-
     client = get_object_or_404(Client, pk=pk)
-    client.delete()
+    try:
+        client.delete()
+    except ProtectedError:
+        messages.error(request, 'This client has account history (ledger entries) and cannot be deleted.')
+        return redirect('agent:client_list')
     messages.success(request, 'Client deleted successfully!')
     return redirect('agent:client_list')
 
 # Similar CRUD views for Driver, Vehicle, Destination, ServiceType
+@method_decorator(role_required('agent'), name='dispatch')
 class DriverListView(ListView):
     model = Driver
     template_name = 'agent/driver_list.html'
     paginate_by = 20
 
+@method_decorator(role_required('agent'), name='dispatch')
 class VehicleListView(ListView):
     model = Vehicle
     template_name = 'agent/vehicle_list.html'
     paginate_by = 20
 
+@method_decorator(role_required('agent'), name='dispatch')
 class DestinationListView(ListView):
     model = Destination
     template_name = 'agent/destination_list.html'
     paginate_by = 20
 
+@method_decorator(role_required('agent'), name='dispatch')
 class ServiceTypeListView(ListView):
     model = ServiceType
     template_name = 'agent/service_type_list.html'
@@ -141,11 +142,9 @@ class ServiceTypeListView(ListView):
 
 # ==================== SECTION 2: SHIPMENTS & TRACKING ====================
 
+@role_required('agent')
 def create_shipment(request):
     """AG-02-01: Create shipment with automatic pricing"""
-    if 'user_id' not in request.session or request.session.get('user_role') != 'agent':
-        return redirect('/auth/agent/login/')
-
     if request.method == 'POST':
         client_id = request.POST.get('client')
         service_type_id = request.POST.get('service_type')
@@ -154,23 +153,14 @@ def create_shipment(request):
         volume = Decimal(request.POST.get('volume', 0))
         description = request.POST.get('description', '')
 
-        # Simple pricing calculation (in real app, this would use the Pricing model)
-        # Base rate + weight rate + volume rate
-        base_rate = Decimal('10.0')  # Base delivery rate
-        weight_rate = Decimal('2.0')  # Per kg
-        volume_rate = Decimal('5.0')  # Per cubic meter
-
-        amount = base_rate + (weight * weight_rate) + (volume * volume_rate)
-
-        # Create shipment
+        # Create shipment (amount is priced by Shipment.save() from the tariff in effect)
         shipment = Shipment.objects.create(
             client_id=client_id,
             service_type_id=service_type_id,
             destination_id=destination_id,
             weight=weight,
             volume=volume,
-            description=description,
-            amount=amount
+            description=description
         )
 
         # Create initial tracking event
@@ -183,10 +173,10 @@ def create_shipment(request):
         messages.success(request, f'Shipment {shipment.shipment_number} created successfully!')
         return redirect('agent:shipment_detail', pk=shipment.id)
 
-    # GET request
+    # GET request (service types and destinations come from the in-memory reference data)
     clients = Client.objects.all()
-    service_types = ServiceType.objects.filter(is_active=True)
-    destinations = Destination.objects.filter(is_active=True)
+    service_types = refdata.active_service_types()
+    destinations = refdata.active_destinations()
 
     return render(request, 'agent/create_shipment.html', {
         'clients': clients,
@@ -194,25 +184,60 @@ def create_shipment(request):
         'destinations': destinations
     })
 
-class ShipmentListView(ListView):
+@role_required('agent', api=True)
+def quote_shipments(request):
+    """AG-02-02: Batch price quote (JSON: {"parcels": [{destination, service_type, weight, volume}], "at": ISO date})"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    try:
+        data = json.loads(request.body)
+        parcels = data['parcels']
+        at = parse_datetime(data['at']) if data.get('at') else None
+        if data.get('at') and at is None:
+            raise ValueError('Invalid date')
+        if at is not None and timezone.is_naive(at):
+            at = timezone.make_aware(at)
+        if len(parcels) > getattr(settings, 'PRICING_MAX_BATCH', 10000):
+            return JsonResponse({'error': 'Too many parcels'}, status=400)
+        amounts = pricing.quote_batch(
+            [int(parcel['destination']) for parcel in parcels],
+            [int(parcel['service_type']) for parcel in parcels],
+            [str(parcel['weight']) for parcel in parcels],
+            [str(parcel['volume']) for parcel in parcels],
+            at=at
+        )
+    except (KeyError, TypeError, ValueError, ArithmeticError):
+        return JsonResponse({'error': 'Invalid parcels'}, status=400)
+
+    return JsonResponse({
+        'tariff_version': pricing.version_at(at),
+        'quotes': [
+            {'amount': str(amount)} if amount is not None else {'error': 'Unknown destination or service type'}
+            for amount in amounts
+        ]
+    })
+
+@method_decorator(role_required('agent'), name='dispatch')
+class ShipmentListView(ProjectionMixin, CursorPaginationMixin, ListView):
     """AG-02-06: View shipment journal"""
     model = Shipment
     template_name = 'agent/shipment_list.html'
     paginate_by = 25
-
-    def dispatch(self, request, *args, **kwargs):
-        if 'user_id' not in request.session or request.session.get('user_role') != 'agent':
-            return redirect('/auth/agent/login/')
-        return super().dispatch(request, *args, **kwargs)
+    list_fields = (
+        'shipment_number', 'status', 'weight', 'created_at',
+        'client__name', 'destination__city', 'destination__country',
+    )
 
     def get_queryset(self):
-        queryset = Shipment.objects.select_related('client', 'destination', 'service_type')
+        queryset = Shipment.objects.all()
 
         # Filters
         status = self.request.GET.get('status')
         client_id = self.request.GET.get('client')
         date_from = self.request.GET.get('date_from')
         date_to = self.request.GET.get('date_to')
+        query = self.request.GET.get('search')
 
         if status:
             queryset = queryset.filter(status=status)
@@ -222,29 +247,26 @@ class ShipmentListView(ListView):
             queryset = queryset.filter(created_at__date__gte=date_from)
         if date_to:
             queryset = queryset.filter(created_at__date__lte=date_to)
+        if query:
+            queryset = search.matching(queryset, query)
 
-        return queryset.order_by('-created_at')
+        return self.project(queryset.order_by('-created_at'))
 
+@method_decorator(role_required('agent'), name='dispatch')
+@method_decorator(conditional_page(shipment_validators), name='get')
 class ShipmentDetailView(DetailView):
     """AG-02-07: View shipment tracking"""
     model = Shipment
     template_name = 'agent/shipment_detail.html'
 
-    def dispatch(self, request, *args, **kwargs):
-        if 'user_id' not in request.session or request.session.get('user_role') != 'agent':
-            return redirect('/auth/agent/login/')
-        return super().dispatch(request, *args, **kwargs)
-
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['tracking_history'] = self.object.tracking_events.all().order_by('-timestamp')
+        context['tracking_history'] = archive.tracking_history(self.object.pk)
         return context
 
+@role_required('agent')
 def add_tracking_event(request, shipment_id):
     """AG-02-09: Add tracking event manually"""
-    if 'user_id' not in request.session or request.session.get('user_role') != 'agent':
-        return redirect('/auth/agent/login/')
-
     shipment = get_object_or_404(Shipment, id=shipment_id)
 
     if request.method == 'POST':
@@ -265,6 +287,7 @@ def add_tracking_event(request, shipment_id):
             if status == 'delivered':
                 shipment.actual_delivery_date = timezone.now()
             shipment.save()
+            eta.on_shipment_status_change(shipment.id)
 
         messages.success(request, 'Tracking event added successfully!')
         return redirect('agent:shipment_detail', pk=shipment_id)
@@ -273,23 +296,23 @@ def add_tracking_event(request, shipment_id):
 
 # ==================== DELIVERY TOURS ====================
 
+@role_required('agent')
 def create_delivery_tour(request):
     """AG-02-10: Create delivery tour"""
-    if 'user_id' not in request.session or request.session.get('user_role') != 'agent':
-        return redirect('/auth/agent/login/')
-
     if request.method == 'POST':
         driver_id = request.POST.get('driver')
         vehicle_id = request.POST.get('vehicle')
-        planned_date = request.POST.get('planned_date')
+        date = request.POST.get('date')
+        notes = request.POST.get('notes', '')
         shipment_ids = request.POST.getlist('shipments')
 
-        # Create tour
+        # Create tour (total_shipments is counted as the shipments are assigned)
         tour = DeliveryTour.objects.create(
             driver_id=driver_id,
             vehicle_id=vehicle_id,
-            planned_date=planned_date,
-            total_shipments=len(shipment_ids)
+            date=date,
+            notes=notes,
+            created_by=request.user
         )
 
         # Assign shipments to tour
@@ -318,24 +341,18 @@ def create_delivery_tour(request):
         'available_shipments': available_shipments
     })
 
+@method_decorator(role_required('agent'), name='dispatch')
 class DeliveryTourListView(ListView):
     """AG-02-14: View tours journal"""
     model = DeliveryTour
     template_name = 'agent/tour_list.html'
     paginate_by = 20
 
-    def dispatch(self, request, *args, **kwargs):
-        if 'user_id' not in request.session or request.session.get('user_role') != 'agent':
-            return redirect('/auth/agent/login/')
-        return super().dispatch(request, *args, **kwargs)
-
 # ==================== INVOICING ====================
 
+@role_required('agent')
 def create_invoice(request):
     """AG-03-01: Generate invoice from shipments"""
-    if 'user_id' not in request.session or request.session.get('user_role') != 'agent':
-        return redirect('/auth/agent/login/')
-
     if request.method == 'POST':
         client_id = request.POST.get('client')
         shipment_ids = request.POST.getlist('shipments')
@@ -386,6 +403,7 @@ def create_invoice(request):
     clients = Client.objects.all()
     return render(request, 'agent/create_invoice.html', {'clients': clients})
 
+@role_required('agent', api=True)
 def get_client_shipments(request):
     """AJAX: Get shipments for a client that can be invoiced"""
     client_id = request.GET.get('client_id')
@@ -408,13 +426,68 @@ def get_client_shipments(request):
 
     return JsonResponse({'shipments': data})
 
+# ==================== SEARCH ====================
+
+@role_required('agent', api=True)
+def search_records(request):
+    """AJAX: Ranked search over shipments, clients and claims"""
+    query = request.GET.get('q', '')
+    limit = min(int(request.GET.get('limit', 10)) if request.GET.get('limit', '').isdigit() else 10, 50)
+
+    shipments = search.search(Shipment.objects.select_related('client'), query, limit)
+    clients = search.search(Client.objects.all(), query, limit)
+    claims = search.search(Claim.objects.select_related('client'), query, limit)
+
+    return JsonResponse({
+        'query': query,
+        'shipments': [{
+            'id': shipment.id,
+            'shipment_number': shipment.shipment_number,
+            'client': shipment.client.name,
+            'recipient_name': shipment.recipient_name,
+            'status': shipment.get_status_display(),
+            'url': reverse('agent:shipment_detail', args=[shipment.id])
+        } for shipment in shipments],
+        'clients': [{
+            'id': client.id,
+            'client_id': client.client_id,
+            'name': client.name,
+            'email': client.email,
+            'url': reverse('agent:client_edit', args=[client.id])
+        } for client in clients],
+        'claims': [{
+            'id': claim.id,
+            'claim_number': claim.claim_number,
+            'subject': claim.subject,
+            'client': claim.client.name,
+            'status': claim.get_status_display(),
+            'url': reverse('agent:update_claim', args=[claim.id])
+        } for claim in claims],
+    })
+
+# Detail page of each kind of code suggested (invoices have none yet)
+TYPEAHEAD_URLS = {
+    'shipment': 'agent:shipment_detail',
+    'client': 'agent:client_edit',
+}
+
+@role_required('agent', api=True)
+def suggest_codes(request):
+    """AJAX: Autocomplete of shipment (EXP), client (CLT) and invoice (FAC) codes"""
+    suggestions = typeahead.suggest(request.GET.get('q', ''))
+
+    return JsonResponse({'suggestions': [{
+        'kind': kind,
+        'code': code,
+        'id': pk,
+        'url': reverse(TYPEAHEAD_URLS[kind], args=[pk]) if kind in TYPEAHEAD_URLS else None
+    } for kind, code, pk in suggestions]})
+
 # ==================== INCIDENTS ====================
 
+@role_required('agent')
 def report_incident(request):
     """AG-04-01: Report incident"""
-    if 'user_id' not in request.session or request.session.get('user_role') != 'agent':
-        return redirect('/auth/agent/login/')
-
     if request.method == 'POST':
         shipment_id = request.POST.get('shipment')
         tour_id = request.POST.get('tour')
@@ -445,32 +518,33 @@ def report_incident(request):
 
 # ==================== CLAIMS ====================
 
+@role_required('agent')
 def manage_claims(request):
     """AG-05-01 to AG-05-05: Claims management"""
-    if 'user_id' not in request.session or request.session.get('user_role') != 'agent':
-        return redirect('/auth/agent/login/')
-
-    claims = Claim.objects.all().order_by('-filed_date')
+    claims = Claim.objects.select_related('client').order_by('-filed_date')
 
     # Filter by status if provided
     status = request.GET.get('status')
     if status:
         claims = claims.filter(status=status)
 
-    paginator = Paginator(claims, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Full-text search (common/search.py)
+    query = request.GET.get('search')
+    if query:
+        claims = search.matching(claims, query)
+
+    paginator, page_obj = paginate(request, claims, 20, ordering=('-filed_date', '-id'))
 
     return render(request, 'agent/claims.html', {
         'page_obj': page_obj,
+        'object_list': page_obj.object_list,
+        'is_paginated': page_obj.has_other_pages(),
         'status_filter': status
     })
 
+@role_required('agent')
 def update_claim_status(request, claim_id):
     """AG-05-03: Update claim status"""
-    if 'user_id' not in request.session or request.session.get('user_role') != 'agent':
-        return redirect('/auth/agent/login/')
-
     claim = get_object_or_404(Claim, id=claim_id)
 
     if request.method == 'POST':
@@ -3,6 +3,7 @@ from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin
 from django import forms
 from django.core.exceptions import ValidationError
 from .models import User
+from .tokens import revoke_user_tokens
 from common.models import Client, Driver, Manager, Agent
 
 class UserAdminForm(forms.ModelForm):
@@ -98,6 +99,7 @@ class CustomUserAdmin(DjangoUserAdmin):
     add_form = UserAdminForm  # Use our custom form for add view too
     list_display = ['username', 'role', 'get_profile', 'is_staff']
     list_filter = ['role', 'is_staff']
+    actions = ['revoke_device_tokens']
     
     fieldsets = (
         ('Credentials', {
@@ -120,4 +122,10 @@ class CustomUserAdmin(DjangoUserAdmin):
         elif obj.agent_profile:
             return f"Agent: {obj.agent_profile.first_name} {obj.agent_profile.last_name}"
         return "No Profile"
-    get_profile.short_description = "Profile"
\ No newline at end of file
+    get_profile.short_description = "Profile"
+
+    @admin.action(description="Revoke driver app device tokens")
+    def revoke_device_tokens(self, request, queryset):
+        """Lost or replaced phone: every device token issued so far stops working"""
+        for user in queryset.filter(role='driver'):
+            revoke_user_tokens(user.pk)
@@ -0,0 +1,21 @@
+"""
+Authentication backend - authentication/backends.py
+Loads the session user together with its role profile in one joined query.
+"""
+
+from django.contrib.auth.backends import ModelBackend
+
+from authentication.models import User
+
+PROFILE_FIELDS = ['client_profile', 'driver_profile', 'manager_profile', 'agent_profile']
+
+
+class ProfileBackend(ModelBackend):
+    """ModelBackend whose get_user() also fetches the client/driver/manager/agent profile"""
+
+    def get_user(self, user_id):
+        try:
+            user = User.objects.select_related(*PROFILE_FIELDS).get(pk=user_id)
+        except User.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
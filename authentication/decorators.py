@@ -0,0 +1,113 @@
+"""
+View decorators - authentication/decorators.py
+Role guards shared by the agent, client, driver and manager portals.
+"""
+
+from functools import wraps
+from inspect import iscoroutinefunction
+from urllib.parse import quote
+
+from django.contrib.auth import alogout, logout
+from django.http import JsonResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.shortcuts import redirect
+from django.views.decorators.csrf import csrf_exempt
+
+from authentication.middleware import get_profile
+from authentication.tokens import averify_token, bearer_token, token_user, verify_token
+
+# Roles whose portal cannot work without the matching profile
+MISSING_PROFILE_MESSAGES = {
+    'client': 'Profile not found. Please contact support.',
+    'driver': 'No driver profile assigned',
+}
+
+
+def _csrf_failure(request):
+    """CSRF check of CsrfViewMiddleware, for views exempted from it"""
+    return CsrfViewMiddleware(lambda request: None).process_view(request, None, (), {})
+
+
+def role_required(role, api=False, device_token=False):
+    """
+    Restrict a view to users of one role.
+
+    Anonymous users and other roles are redirected to the role's login page,
+    or get a JSON 401 when `api` is set. Clients and drivers without a profile
+    are logged out (JSON 404 for API views). The role profile is available to
+    the view as request.profile.
+
+    With `device_token`, requests carrying an 'Authorization: Bearer' driver
+    device token (authentication/tokens.py) are authenticated from the token
+    alone, without touching the session. The view is then exempt from the
+    CSRF middleware and CSRF is enforced here for session requests only.
+    """
+    login_url = f'/auth/{role}/login/'
+
+    def token_denied(request, payload):
+        if payload is None:
+            return JsonResponse({'error': 'Invalid or expired token'}, status=401)
+        request.user, request.profile = token_user(payload)
+        if request.user.role != role:
+            return JsonResponse({'error': 'Not authenticated'}, status=401)
+        return None
+
+    def check(request, user):
+        """Response denying access (or None) and whether the session must be logged out"""
+        if not user.is_authenticated or user.role != role:
+            if api:
+                return JsonResponse({'error': 'Not authenticated'}, status=401), False
+            return redirect(login_url), False
+
+        request.profile = get_profile(user)
+        if request.profile is None and role in MISSING_PROFILE_MESSAGES:
+            if api:
+                return JsonResponse({'error': f'{role.title()} not found'}, status=404), False
+            return redirect(f'{login_url}?error={quote(MISSING_PROFILE_MESSAGES[role])}'), True
+        return None, False
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                if device_token:
+                    token = bearer_token(request)
+                    if token is not None:
+                        denied = token_denied(request, await averify_token(token))
+                        if denied is not None:
+                            return denied
+                        return await view(request, *args, **kwargs)
+                    denied = _csrf_failure(request)
+                    if denied is not None:
+                        return denied
+
+                denied, logout_user = check(request, await request.auser())
+                if logout_user:
+                    await alogout(request)
+                if denied is not None:
+                    return denied
+                return await view(request, *args, **kwargs)
+            return csrf_exempt(async_wrapper) if device_token else async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if device_token:
+                token = bearer_token(request)
+                if token is not None:
+                    denied = token_denied(request, verify_token(token))
+                    if denied is not None:
+                        return denied
+                    return view(request, *args, **kwargs)
+                denied = _csrf_failure(request)
+                if denied is not None:
+                    return denied
+
+            denied, logout_user = check(request, request.user)
+            if logout_user:
+                logout(request)
+            if denied is not None:
+                return denied
+            return view(request, *args, **kwargs)
+        return csrf_exempt(wrapper) if device_token else wrapper
+
+    return decorator
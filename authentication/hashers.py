@@ -0,0 +1,20 @@
+"""
+Password hashers - authentication/hashers.py
+"""
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class TunedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2-SHA256 with the iteration count from settings.PASSWORD_PBKDF2_ITERATIONS
+    (see `manage.py benchmark_hashers`). It keeps the pbkdf2_sha256 algorithm
+    name, so existing hashes verify unchanged and are re-hashed with the
+    configured count on the user's next successful login. The count never goes
+    below Django's own default, so a stale setting cannot weaken new hashes.
+    """
+
+    @property
+    def iterations(self):
+        return max(getattr(settings, 'PASSWORD_PBKDF2_ITERATIONS', 0), PBKDF2PasswordHasher.iterations)
@@ -0,0 +1,138 @@
+"""
+Login service - authentication/login.py
+One login pipeline for the four role portals and the driver app tokens.
+
+- Attempts are throttled per client IP and failures per username
+  (common/ratelimit.py).
+- Unknown usernames are remembered for a while, so repeated attempts against
+  them cost no query. They still run one password hash (like Django's
+  ModelBackend), so that the response time does not tell unknown usernames
+  from wrong passwords.
+- Password hashing runs under a process-wide semaphore: a burst of logins
+  at shift start waits for a slot (or is turned away) instead of occupying
+  every worker with PBKDF2.
+- Hashes are verified with the hasher configured in PASSWORD_HASHERS; hashes
+  made with other parameters are upgraded transparently by check_password().
+"""
+
+import hashlib
+import threading
+
+from django.conf import settings
+from django.contrib.auth import login
+from django.shortcuts import redirect, render
+
+from authentication.models import User
+from common import ratelimit
+from common.caching import get_cache
+
+UNKNOWN_USER_KEY = 'unknown-user:{}'
+
+cache = get_cache('login', alias='ratelimit')
+
+INVALID_CREDENTIALS = {
+    'agent': 'Invalid credentials or not an agent',
+    'manager': 'Invalid credentials or not a manager',
+    'client': 'Invalid credentials.',
+    'driver': 'Invalid credentials or not a driver',
+}
+MISSING_PROFILE = 'Driver profile not assigned to this user'
+THROTTLED = 'Too many login attempts. Please try again later.'
+BUSY = 'The server is busy. Please try again in a moment.'
+
+
+class LoginError(Exception):
+    """Login refused; `status` is set when the refusal is not about the credentials (throttled, busy)"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+_hash_slots = threading.BoundedSemaphore(_setting('LOGIN_MAX_CONCURRENT_HASHES', 4))
+
+
+def _username_key(username):
+    # Submitted usernames may contain anything: keep cache keys short and safe
+    return hashlib.sha256(username.encode()).hexdigest()[:32]
+
+
+def forget_unknown_user(username):
+    """A user with this username now exists (called from authentication/signals.py)"""
+    cache.delete(UNKNOWN_USER_KEY.format(_username_key(username)))
+
+
+def authenticate_credentials(request, username, password, role):
+    """
+    Check a username/password for a role portal.
+    Returns the user or raises LoginError.
+    """
+    username = (username or '').strip()
+    username_key = _username_key(username)
+    invalid = INVALID_CREDENTIALS[role]
+
+    ip_attempts = ratelimit.hit('login-ip', ratelimit.client_ip(request), _setting('LOGIN_IP_WINDOW_SECONDS', 60))
+    if ip_attempts > _setting('LOGIN_IP_ATTEMPTS', 20):
+        raise LoginError(THROTTLED, status=429)
+    if ratelimit.count('login-user', username_key) >= _setting('LOGIN_USER_FAILURES', 5):
+        raise LoginError(THROTTLED, status=429)
+
+    if not username or not password:
+        raise LoginError(invalid)
+
+    if cache.get(UNKNOWN_USER_KEY.format(username_key)):
+        user = None
+    else:
+        user = User.objects.filter(username=username).first()
+        if user is None:
+            cache.set(UNKNOWN_USER_KEY.format(username_key), True, _setting('LOGIN_UNKNOWN_USER_CACHE_SECONDS', 300))
+
+    if not _hash_slots.acquire(timeout=_setting('LOGIN_HASH_WAIT_SECONDS', 5)):
+        raise LoginError(BUSY, status=503)
+    try:
+        if user is None:
+            # Same cost as a wrong password (see ModelBackend.authenticate)
+            User().set_password(password)
+            raise LoginError(invalid)
+        valid = user.check_password(password)
+    finally:
+        _hash_slots.release()
+
+    if not valid or not user.is_active or user.role != role:
+        ratelimit.hit('login-user', username_key, _setting('LOGIN_USER_WINDOW_SECONDS', 300))
+        raise LoginError(invalid)
+    if role == 'driver' and not user.driver_profile_id:
+        raise LoginError(MISSING_PROFILE)
+
+    ratelimit.reset('login-user', username_key)
+    return user
+
+
+def role_login(request, role):
+    """Login view of a role portal: authentication/<role>_login.html, then the role dashboard"""
+    template = f'authentication/{role}_login.html'
+
+    if request.method == 'POST':
+        try:
+            user = authenticate_credentials(
+                request,
+                request.POST.get('username'),
+                request.POST.get('password'),
+                role
+            )
+        except LoginError as error:
+            return render(request, template, {'error': error.message}, status=error.status or 200)
+
+        login(request, user)
+        request.session['user_id'] = user.id
+        request.session['user_role'] = user.role
+        if role == 'driver':
+            request.session['driver_id'] = user.driver_profile_id
+        return redirect(user.get_dashboard_url())
+
+    return render(request, template, {'error': request.GET.get('error') if role == 'client' else None})
@@ -0,0 +1,52 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, get_hasher
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Measure PBKDF2 on this machine and suggest PASSWORD_PBKDF2_ITERATIONS for a target login cost"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target-ms', type=float, default=100,
+                            help="Wanted time for one password check, in milliseconds")
+        parser.add_argument('--minimum', type=int, default=PBKDF2PasswordHasher.iterations,
+                            help="Never suggest fewer iterations than this (default: Django's own default, "
+                                 "which the hasher never goes below)")
+        parser.add_argument('--samples', type=int, default=5,
+                            help="Hashes measured per point")
+
+    def handle(self, *args, **options):
+        hasher = PBKDF2PasswordHasher()
+        probe = 100000
+        timings = []
+        for _ in range(max(1, options['samples'])):
+            started = time.perf_counter()
+            hasher.encode('benchmark-password', hasher.salt(), probe)
+            timings.append(time.perf_counter() - started)
+        per_iteration = min(timings) / probe
+
+        configured = get_hasher('default')
+        current = getattr(configured, 'iterations', None)
+        if current:
+            self.stdout.write(
+                f"Configured: {configured.algorithm} with {current} iterations "
+                f"= {current * per_iteration * 1000:.0f} ms per check"
+            )
+
+        suggested = int(options['target_ms'] / 1000 / per_iteration) // 10000 * 10000
+        if suggested < options['minimum']:
+            self.stdout.write(self.style.WARNING(
+                f"{options['target_ms']:.0f} ms only allows {suggested} iterations here; "
+                f"keeping the minimum of {options['minimum']}."
+            ))
+            suggested = options['minimum']
+
+        logins_per_core = 1 / (suggested * per_iteration)
+        self.stdout.write(self.style.SUCCESS(
+            f"PASSWORD_PBKDF2_ITERATIONS = {suggested}  "
+            f"# {suggested * per_iteration * 1000:.0f} ms per check, about {logins_per_core:.0f} logins/s per core"
+        ))
+        if getattr(settings, 'PASSWORD_PBKDF2_ITERATIONS', None) == suggested:
+            self.stdout.write("Settings already use this value.")
@@ -0,0 +1,99 @@
+"""
+Authentication middleware - authentication/middleware.py
+Resolves the logged-in user and its role profile once per session instead of
+once per request.
+
+The user (loaded with its profile by ProfileBackend) is cached per session key
+together with the user's generation number. Saving or deleting the user or its
+profile bumps the generation (see authentication/signals.py), so the next
+request of every session of that user reloads it.
+"""
+
+import time
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+
+from common.caching import get_cache
+
+SESSION_USER_KEY = 'session-user:{}'
+GENERATION_KEY = 'user-generation:{}'
+
+cache = get_cache('auth', alias='sessions')
+
+
+def invalidate_user(user_id):
+    """Drop the cached copy of a user (and its profile) from every session"""
+    try:
+        cache.incr(GENERATION_KEY.format(user_id))
+    except ValueError:
+        cache.set(GENERATION_KEY.format(user_id), time.time_ns(), None)
+
+
+def get_profile(user):
+    """Client, Driver, Manager or Agent profile matching the user's role (None if unassigned)"""
+    if not user.is_authenticated:
+        return None
+    return getattr(user, f'{user.role}_profile', None)
+
+
+def _resolve_user(request):
+    session = request.session
+    user_id = session.get(auth.SESSION_KEY)
+    if user_id is None or session.session_key is None:
+        return auth.get_user(request)
+
+    key = SESSION_USER_KEY.format(session.session_key)
+    generation_key = GENERATION_KEY.format(user_id)
+    cached = cache.get_many([key, generation_key])
+    generation = cached.get(generation_key)
+    if generation is None:
+        # No generation yet (or evicted): start one so older entries cannot match
+        cache.add(generation_key, time.time_ns(), None)
+        generation = cache.get(generation_key)
+
+    entry = cached.get(key)
+    if entry is not None:
+        cached_generation, user = entry
+        if (
+            cached_generation == generation
+            and str(user.pk) == str(user_id)
+            and constant_time_compare(session.get(auth.HASH_SESSION_KEY, ''), user.get_session_auth_hash())
+        ):
+            return user
+
+    # Full check (backend, session hash) and one joined query through ProfileBackend
+    user = auth.get_user(request)
+    if user.is_authenticated:
+        cache.set(key, (generation, user), getattr(settings, 'AUTH_USER_CACHE_SECONDS', 300))
+    return user
+
+
+def get_user(request):
+    if not hasattr(request, '_cached_user'):
+        request._cached_user = _resolve_user(request)
+    return request._cached_user
+
+
+async def aget_user(request):
+    if not hasattr(request, '_cached_user'):
+        request._cached_user = await sync_to_async(_resolve_user)(request)
+    return request._cached_user
+
+
+class ProfileMiddleware(AuthenticationMiddleware):
+    """
+    Replaces AuthenticationMiddleware: sets request.user / request.auser from
+    the per-session cache and request.profile to the user's role profile.
+    """
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: get_user(request))
+        request.auser = partial(aget_user, request)
+        request.profile = SimpleLazyObject(lambda: get_profile(request.user))
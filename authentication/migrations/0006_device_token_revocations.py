@@ -0,0 +1,31 @@
+# Generated by Django 6.0.1 on 2026-10-19 00:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0005_alter_user_agent_profile_alter_user_client_profile_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceTokenRevocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jti', models.CharField(blank=True, db_index=True, max_length=32)),
+                ('revoked_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='device_token_revocations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Device Token Revocation',
+                'verbose_name_plural': 'Device Token Revocations',
+                'db_table': 'device_token_revocations',
+                'ordering': ['-revoked_at'],
+            },
+        ),
+    ]
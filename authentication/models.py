@@ -50,4 +50,23 @@ class User(AbstractUser):
             'driver': ['driver'],
         }
         allowed_apps = role_app_mapping.get(self.role, [])
-        return app_name in allowed_apps
\ No newline at end of file
+        return app_name in allowed_apps
+
+class DeviceTokenRevocation(models.Model):
+    """
+    Revoked driver device token (see authentication/tokens.py).
+    With a blank jti, every token of the user issued before revoked_at is revoked.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='device_token_revocations')
+    jti = models.CharField(max_length=32, blank=True, db_index=True)
+    revoked_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        db_table = 'device_token_revocations'
+        ordering = ['-revoked_at']
+        verbose_name = 'Device Token Revocation'
+        verbose_name_plural = 'Device Token Revocations'
+
+    def __str__(self):
+        return f"{self.user.username} - {self.jti or 'all tokens'}"
@@ -0,0 +1,70 @@
+"""
+Signal handlers - authentication/signals.py
+Connected in AuthenticationConfig.ready()
+"""
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from authentication import tokens
+from authentication.login import forget_unknown_user
+from authentication.middleware import invalidate_user
+from authentication.models import User
+from common.models import Agent, Client, Driver, Manager
+
+# Fields written on every location ping; not worth reloading the cached driver for
+LOCATION_FIELDS = {'current_latitude', 'current_longitude', 'location_accuracy', 'last_location_timestamp'}
+
+PROFILE_MODELS = {
+    Client: 'client_profile',
+    Driver: 'driver_profile',
+    Manager: 'manager_profile',
+    Agent: 'agent_profile',
+}
+
+
+@receiver(post_save, sender=User, dispatch_uid='auth_user_saved')
+@receiver(post_delete, sender=User, dispatch_uid='auth_user_deleted')
+def refresh_cached_user(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+    forget_unknown_user(instance.username)
+
+
+def refresh_cached_profile(sender, instance, update_fields=None, **kwargs):
+    """A profile changed: reload the user owning it on its next request"""
+    if update_fields and set(update_fields) <= LOCATION_FIELDS:
+        return
+    field = PROFILE_MODELS[sender]
+    for user_id in User.objects.filter(**{field: instance.pk}).values_list('pk', flat=True):
+        invalidate_user(user_id)
+
+
+for model, field in PROFILE_MODELS.items():
+    post_save.connect(refresh_cached_profile, sender=model, dispatch_uid=f'auth_{field}_saved')
+    post_delete.connect(refresh_cached_profile, sender=model, dispatch_uid=f'auth_{field}_deleted')
+
+
+@receiver(pre_save, sender=User, dispatch_uid='auth_user_deactivating')
+@receiver(pre_save, sender=Driver, dispatch_uid='auth_driver_deactivating')
+def note_deactivation(sender, instance, update_fields=None, **kwargs):
+    """Only saves of inactive rows pay for a lookup of the previous state"""
+    if instance.is_active or instance.pk is None or (update_fields and 'is_active' not in update_fields):
+        instance._deactivated = False
+        return
+    instance._deactivated = sender.objects.filter(pk=instance.pk, is_active=True).exists()
+
+
+@receiver(post_save, sender=User, dispatch_uid='auth_user_deactivated')
+@receiver(post_save, sender=Driver, dispatch_uid='auth_driver_deactivated')
+def revoke_device_tokens(sender, instance, **kwargs):
+    """A deactivated driver (user or profile) loses its device tokens at once, not when they expire"""
+    if not getattr(instance, '_deactivated', False):
+        return
+    if sender is User:
+        user_ids = [instance.pk] if instance.role == 'driver' else []
+    else:
+        user_ids = list(User.objects.filter(driver_profile=instance).values_list('pk', flat=True))
+    for user_id in user_ids:
+        # After commit: other processes must find the revocation when they reload the denylist
+        transaction.on_commit(lambda user_id=user_id: tokens.revoke_user_tokens(user_id))
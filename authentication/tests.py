@@ -1,3 +1,271 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from authentication import tokens
+from authentication.hashers import TunedPBKDF2PasswordHasher
+from authentication.models import DeviceTokenRevocation, User
+from common.models import Client
+from common.tests import make_fixtures, make_shipment, reset_caches
+
+FAST_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
+def make_user(username, role, password='pw', **fields):
+    return User.objects.create_user(username, password=password, role=role, **fields)
+
+
+# ==================== SESSION USER AND ROLE GUARDS ====================
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class ProfileMiddlewareTests(TestCase):
+    def setUp(self):
+        self.fixtures = make_fixtures(shipments=1)
+        self.user = make_user('client', 'client', client_profile=self.fixtures.client)
+        self.client.force_login(self.user)
+
+    def user_queries(self, path):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in context.captured_queries if '"users"' in query['sql']]
+
+    def test_user_and_profile_are_loaded_once_per_session(self):
+        self.assertEqual(len(self.user_queries('/client/dashboard/')), 1)
+        self.assertEqual(self.user_queries('/client/dashboard/'), [])
+
+    def test_profile_changes_reach_the_session(self):
+        self.client.get('/client/dashboard/')
+        self.fixtures.client.city = 'Constantine'
+        self.fixtures.client.save()
+
+        response = self.client.get('/client/profile/')
+
+        self.assertContains(response, 'value="Constantine"')
+
+    def test_password_change_ends_other_sessions(self):
+        self.client.get('/client/dashboard/')
+        self.user.set_password('new password')
+        self.user.save()
+
+        response = self.client.get('/client/dashboard/')
+
+        self.assertRedirects(response, '/auth/client/login/', fetch_redirect_response=False)
+
+    def test_other_roles_are_turned_away(self):
+        self.client.force_login(make_user('agent', 'agent'))
+        shipment = self.fixtures.shipments[0]
+
+        self.assertRedirects(self.client.get('/client/dashboard/'), '/auth/client/login/', fetch_redirect_response=False)
+        response = self.client.get(f'/client/api/shipments/{shipment.pk}/eta/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_clients_only_see_their_own_shipments(self):
+        other = make_shipment(self.fixtures, client=Client.objects.create(
+            name='Other', email='other@example.com', phone='1', address='a', city='Oran', postal_code='31000'
+        ))
+
+        response = self.client.get(f'/client/api/shipments/{other.pk}/eta/')
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_users_without_profile_are_logged_out(self):
+        self.client.force_login(make_user('orphan', 'client'))
+
+        response = self.client.get('/client/dashboard/')
+
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].startswith('/auth/client/login/?error='))
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+
+# ==================== DRIVER DEVICE TOKENS ====================
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class DeviceTokenTests(TestCase):
+    def setUp(self):
+        self.fixtures = make_fixtures(shipments=0)
+        self.user = make_user('driver', 'driver', driver_profile=self.fixtures.driver)
+
+    def token(self):
+        response = self.client.post('/auth/driver/token/', {'username': 'driver', 'password': 'pw'})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['token']
+
+    def post(self, path, token, **data):
+        return self.client.post(path, data, headers={'authorization': f'Bearer {token}'})
+
+    def ping(self, token):
+        return self.post('/driver/location/update/', token, latitude='36.7', longitude='3.0')
+
+    def test_token_authenticates_the_driver_api(self):
+        self.assertEqual(self.ping(self.token()).status_code, 200)
+        self.assertEqual(self.ping('forged').status_code, 401)
+
+    def test_tampered_and_expired_tokens_are_refused(self):
+        token = self.token()
+        self.assertIsNone(tokens.verify_token(token[:-2] + ('AA' if not token.endswith('AA') else 'BB')))
+        with self.settings(DRIVER_TOKEN_SECONDS=-1):
+            self.assertIsNone(tokens.verify_token(token))
+
+    def test_revoked_token_is_refused_and_others_still_work(self):
+        revoked, kept = self.token(), self.token()
+
+        self.assertEqual(self.post('/auth/driver/token/revoke/', revoked).status_code, 200)
+
+        self.assertEqual(self.ping(revoked).status_code, 401)
+        self.assertEqual(self.ping(kept).status_code, 200)
+
+    def test_revocations_from_other_processes_are_seen_within_the_check_interval(self):
+        token = self.token()
+        self.assertEqual(self.ping(token).status_code, 200)
+        payload = tokens.verify_token(token)
+
+        # Another worker revoked it: only the table changed, not this process's memory
+        DeviceTokenRevocation.objects.create(
+            user=self.user, jti=payload['j'], expires_at=timezone.now() + timedelta(minutes=15)
+        )
+        tokens._denylist['checked_at'] = None
+
+        self.assertEqual(self.ping(token).status_code, 401)
+
+    def test_revoking_all_tokens_of_a_user(self):
+        token = self.token()
+
+        tokens.revoke_user_tokens(self.user.pk)
+
+        self.assertEqual(self.ping(token).status_code, 401)
+
+    def test_refresh_requires_an_active_driver(self):
+        token = self.token()
+        self.assertEqual(self.post('/auth/driver/token/refresh/', token).status_code, 200)
+
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertEqual(self.post('/auth/driver/token/refresh/', token).status_code, 401)
+
+    def test_whole_second_revocations(self):
+        tokens.revoke_user_tokens(self.user.pk)
+        revoked_at = timezone.now().replace(microsecond=700000)
+        DeviceTokenRevocation.objects.filter(user=self.user).update(revoked_at=revoked_at)
+        tokens._denylist['checked_at'] = None
+        second = int(revoked_at.timestamp())
+
+        def revoked(iat):
+            return tokens._is_revoked({'u': self.user.pk, 'j': 'jti', 'i': iat}, tokens._current_denylist())
+
+        self.assertTrue(revoked(second - 1))
+        # Issued within the second of the revocation: possibly before it, so revoked
+        self.assertTrue(revoked(second))
+        self.assertFalse(revoked(second + 1))
+
+    def test_deactivating_the_driver_user_revokes_its_tokens(self):
+        token = self.token()
+
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+
+        self.assertIsNone(tokens.verify_token(token))
+        self.assertEqual(self.ping(token).status_code, 401)
+
+    def test_deactivating_the_driver_profile_revokes_its_tokens(self):
+        token = self.token()
+        driver = self.fixtures.driver
+
+        driver.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            driver.save()
+        self.assertIsNone(tokens.verify_token(token))
+
+        # Saving it again while inactive does not revoke anything more
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            driver.save()
+        self.assertEqual(callbacks, [])
+        self.assertEqual(DeviceTokenRevocation.objects.filter(user=self.user).count(), 1)
+
+
+# ==================== LOGIN THROTTLING ====================
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class LoginTests(TestCase):
+    def setUp(self):
+        reset_caches()
+        self.user = make_user('agent', 'agent')
+
+    def login(self, username='agent', password='pw', **extra):
+        return self.client.post('/auth/agent/login/', {'username': username, 'password': password}, **extra)
+
+    def test_valid_credentials_log_in(self):
+        response = self.login()
+
+        self.assertRedirects(response, self.user.get_dashboard_url(), fetch_redirect_response=False)
+        self.assertEqual(self.client.session['user_role'], 'agent')
+
+    def test_other_roles_are_refused(self):
+        make_user('manager', 'manager')
+
+        response = self.login('manager')
+
+        self.assertContains(response, 'Invalid credentials or not an agent')
+
+    def test_unknown_usernames_are_remembered_but_still_hashed(self):
+        self.login('nobody')
+
+        with CaptureQueriesContext(connection) as context, \
+                mock.patch.object(User, 'set_password', autospec=True) as set_password:
+            response = self.login('nobody')
+
+        self.assertContains(response, 'Invalid credentials or not an agent')
+        self.assertFalse([query for query in context.captured_queries if '"users"' in query['sql']])
+        set_password.assert_called_once()
+
+    def test_new_users_are_no_longer_unknown(self):
+        self.login('newcomer')
+        user = make_user('newcomer', 'agent')
+
+        self.assertRedirects(self.login('newcomer'), user.get_dashboard_url(), fetch_redirect_response=False)
+
+    @override_settings(LOGIN_USER_FAILURES=3)
+    def test_failures_per_username_are_throttled(self):
+        for attempt in range(3):
+            self.assertEqual(self.login(password='wrong').status_code, 200)
+
+        response = self.login()
+
+        self.assertEqual(response.status_code, 429)
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+    @override_settings(LOGIN_USER_FAILURES=3)
+    def test_successful_login_clears_the_failures(self):
+        self.login(password='wrong')
+        self.login(password='wrong')
+        self.login()
+        self.client.logout()
+
+        self.login(password='wrong')
+        self.login(password='wrong')
+
+        self.assertEqual(self.login().status_code, 302)
+
+    @override_settings(LOGIN_IP_ATTEMPTS=3)
+    def test_attempts_per_ip_are_throttled(self):
+        for attempt in range(3):
+            self.login(f'user{attempt}', REMOTE_ADDR='10.0.0.1')
+
+        self.assertEqual(self.login(REMOTE_ADDR='10.0.0.1').status_code, 429)
+        self.assertEqual(self.login(REMOTE_ADDR='10.0.0.2').status_code, 302)
+
+    @override_settings(PASSWORD_PBKDF2_ITERATIONS=1000)
+    def test_hasher_never_goes_below_the_django_default(self):
+        self.assertEqual(TunedPBKDF2PasswordHasher().iterations, PBKDF2PasswordHasher.iterations)
+
+    @override_settings(PASSWORD_PBKDF2_ITERATIONS=PBKDF2PasswordHasher.iterations + 1)
+    def test_hasher_uses_the_configured_iterations(self):
+        self.assertEqual(TunedPBKDF2PasswordHasher().iterations, PBKDF2PasswordHasher.iterations + 1)
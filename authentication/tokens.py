@@ -0,0 +1,181 @@
+"""
+Driver device tokens - authentication/tokens.py
+Signed, short-lived bearer tokens for the driver app's JSON API.
+
+A token carries the user and driver ids and is verified with the signing key
+only: no session or user query per request. Revoked tokens are checked
+against a denylist kept in process memory, reloaded from
+DeviceTokenRevocation when its version stamp changes (compared at most every
+DRIVER_TOKEN_DENYLIST_CHECK_SECONDS). The stamp is kept in the 'sessions'
+cache when that cache is shared between processes; with the locmem backend
+each worker would only see its own revocations, so the stamp is then the
+latest DeviceTokenRevocation id and time, read from the table.
+
+Issue and revocation times are compared in whole epoch seconds. Revoking
+every token of a user at second S revokes the tokens issued strictly before
+S + 1: a token issued within the second of the revocation is revoked too, as
+its order relative to the revocation is unknown. Deactivating a driver user
+or driver profile revokes their tokens (authentication/signals.py).
+"""
+
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.db.models import Max
+from django.utils import timezone
+
+from authentication.models import DeviceTokenRevocation, User
+from common.caching import get_cache
+from common.models import Driver
+
+TOKEN_SALT = 'authentication.driver-device-token'
+DENYLIST_VERSION_KEY = 'device-denylist:version'
+
+cache = get_cache('auth', alias='sessions')
+
+_lock = threading.Lock()
+_denylist = {
+    'version': None,
+    'checked_at': None,
+    'jtis': frozenset(),
+    'users': {},  # user_id -> epoch second: the user's tokens issued before it (iat < second) are revoked
+}
+
+
+def token_lifetime():
+    return getattr(settings, 'DRIVER_TOKEN_SECONDS', 900)
+
+
+def bearer_token(request):
+    """Token from an 'Authorization: Bearer <token>' header (None if absent)"""
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token.strip():
+        return None
+    return token.strip()
+
+
+def issue_token(user):
+    """Signed device token for a driver user"""
+    return signing.dumps({
+        'u': user.pk,
+        'n': user.username,
+        'd': user.driver_profile_id,
+        'j': secrets.token_hex(8),
+        'i': int(time.time()),
+    }, salt=TOKEN_SALT)
+
+
+def _load_denylist(version):
+    jtis = set()
+    users = {}
+    for user_id, jti, revoked_at in DeviceTokenRevocation.objects.filter(
+        expires_at__gt=timezone.now()
+    ).values_list('user_id', 'jti', 'revoked_at'):
+        if jti:
+            jtis.add(jti)
+        else:
+            users[user_id] = max(users.get(user_id, 0), int(revoked_at.timestamp()) + 1)
+    with _lock:
+        _denylist.update(version=version, checked_at=time.monotonic(), jtis=frozenset(jtis), users=users)
+
+
+def _denylist_due():
+    checked_at = _denylist['checked_at']
+    interval = getattr(settings, 'DRIVER_TOKEN_DENYLIST_CHECK_SECONDS', 2)
+    return checked_at is None or time.monotonic() - checked_at >= interval
+
+
+def _version():
+    if not cache.shared:
+        # Revocations only add rows: the latest id and time change with each one
+        stamp = DeviceTokenRevocation.objects.aggregate(id=Max('pk'), at=Max('revoked_at'))
+        return stamp['id'], stamp['at']
+    version = cache.get(DENYLIST_VERSION_KEY)
+    if version is None:
+        cache.add(DENYLIST_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(DENYLIST_VERSION_KEY)
+    return version
+
+
+def _current_denylist():
+    if _denylist_due():
+        version = _version()
+        if version != _denylist['version']:
+            _load_denylist(version)
+        else:
+            with _lock:
+                _denylist['checked_at'] = time.monotonic()
+    return _denylist
+
+
+def _is_revoked(payload, denylist):
+    return payload['j'] in denylist['jtis'] or payload['i'] < denylist['users'].get(payload['u'], 0)
+
+
+def _signed_payload(token):
+    try:
+        return signing.loads(token, salt=TOKEN_SALT, max_age=token_lifetime())
+    except signing.BadSignature:
+        return None
+
+
+def verify_token(token):
+    """Payload of a valid, unexpired and unrevoked token (None otherwise)"""
+    payload = _signed_payload(token)
+    if payload is None or _is_revoked(payload, _current_denylist()):
+        return None
+    return payload
+
+
+async def averify_token(token):
+    """Async variant of verify_token(); only leaves the event loop to reload the denylist"""
+    payload = _signed_payload(token)
+    if payload is None:
+        return None
+    denylist = await sync_to_async(_current_denylist)() if _denylist_due() else _denylist
+    if _is_revoked(payload, denylist):
+        return None
+    return payload
+
+
+def token_user(payload):
+    """
+    User and Driver built from a token, without a query. They only carry the
+    ids (and username) and must not be saved as a whole.
+    """
+    user = User(pk=payload['u'], username=payload['n'], role='driver', driver_profile_id=payload['d'])
+    driver = Driver(pk=payload['d'])
+    for instance in (user, driver):
+        instance._state.adding = False
+        instance._state.db = 'default'
+    return user, driver
+
+
+def _bump_version():
+    try:
+        cache.incr(DENYLIST_VERSION_KEY)
+    except ValueError:
+        cache.set(DENYLIST_VERSION_KEY, time.time_ns(), None)
+    with _lock:
+        _denylist['checked_at'] = None
+
+
+def revoke_token(payload):
+    """Revoke one device token"""
+    expires_at = datetime.fromtimestamp(payload['i'] + token_lifetime(), tz=dt_timezone.utc)
+    DeviceTokenRevocation.objects.create(user_id=payload['u'], jti=payload['j'], expires_at=expires_at)
+    _bump_version()
+
+
+def revoke_user_tokens(user_id):
+    """Revoke every device token issued to a user so far"""
+    DeviceTokenRevocation.objects.create(
+        user_id=user_id,
+        expires_at=timezone.now() + timedelta(seconds=token_lifetime())
+    )
+    _bump_version()
@@ -9,4 +9,9 @@ urlpatterns = [
     path('driver/login/', views.driver_login, name='driver_login'),
 
     path('logout/', views.logout_view, name='logout'),
+
+    # Driver app device tokens
+    path('driver/token/', views.driver_token, name='driver_token'),
+    path('driver/token/refresh/', views.refresh_driver_token, name='refresh_driver_token'),
+    path('driver/token/revoke/', views.revoke_driver_token, name='revoke_driver_token'),
 ]
\ No newline at end of file
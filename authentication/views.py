@@ -1,124 +1,27 @@
 from django.shortcuts import render, redirect
 from django.contrib import messages
 from django.contrib.auth import logout
-from django.http import HttpResponseRedirect
+from django.http import HttpResponseRedirect, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from authentication.login import LoginError, authenticate_credentials, role_login
 from authentication.models import User
+from authentication.tokens import bearer_token, issue_token, revoke_token, token_lifetime, verify_token
 
 def agent_login(request):
-    if request.method == 'POST':
-        username = request.POST.get('username')
-        password = request.POST.get('password')
-
-        # Check against authentication User model
-        try:
-            user = User.objects.get(username=username)
-            if user.check_password(password) and user.role == 'agent':
-                # Use Django's login for admin compatibility
-                from django.contrib.auth import login
-                login(request, user)
-                request.session['user_id'] = user.id
-                request.session['user_role'] = user.role
-                return redirect('/agent/dashboard/')
-            else:
-                return render(request, 'authentication/agent_login.html', {
-                    'error': 'Invalid credentials or not an agent'
-                })
-        except User.DoesNotExist:
-            return render(request, 'authentication/agent_login.html', {
-                'error': 'Invalid credentials or not an agent'
-            })
-
-    from django.middleware.csrf import get_token
-    csrf_token = get_token(request)
-    return render(request, 'authentication/agent_login.html', {'csrf_token': csrf_token})
+    return role_login(request, 'agent')
 
 
 def manager_login(request):
-    if request.method == 'POST':
-        username = request.POST.get('username')
-        password = request.POST.get('password')
-
-        try:
-            user = User.objects.get(username=username)
-            if user.check_password(password) and user.role == 'manager':
-                from django.contrib.auth import login
-                login(request, user)
-                request.session['user_id'] = user.id
-                request.session['user_role'] = user.role
-                return redirect('/manager/dashboard/')
-            else:
-                return render(request, 'authentication/manager_login.html', {
-                    'error': 'Invalid credentials or not a manager'
-                })
-        except User.DoesNotExist:
-            return render(request, 'authentication/manager_login.html', {
-                'error': 'Invalid credentials or not a manager'
-            })
-
-    from django.middleware.csrf import get_token
-    csrf_token = get_token(request)
-    return render(request, 'authentication/manager_login.html', {'csrf_token': csrf_token})
+    return role_login(request, 'manager')
 
 
 def client_login(request):
-    if request.method == 'POST':
-        username = request.POST.get('username')
-        password = request.POST.get('password')
-
-        try:
-            user = User.objects.get(username=username)
-            if user.check_password(password) and user.role == 'client':
-                from django.contrib.auth import login
-                login(request, user)
-                request.session['user_id'] = user.id
-                request.session['user_role'] = user.role
-                return redirect('/client/dashboard/')
-            else:
-                return render(request, 'authentication/client_login.html', {
-                    'error': 'Invalid credentials.'
-                })
-        except User.DoesNotExist:
-            return render(request, 'authentication/client_login.html', {
-                'error': 'Invalid credentials.'
-            })
-
-    error_message = request.GET.get('error')
-    from django.middleware.csrf import get_token
-    csrf_token = get_token(request)
-    return render(request, 'authentication/client_login.html', {'error': error_message, 'csrf_token': csrf_token})
+    return role_login(request, 'client')
 
 
 def driver_login(request):
-    if request.method == 'POST':
-        username = request.POST.get('username')
-        password = request.POST.get('password')
-
-        try:
-            user = User.objects.get(username=username)
-            if user.check_password(password) and user.role == 'driver':
-                # Check if driver profile is assigned
-                if not user.driver_profile:
-                    return render(request, 'authentication/driver_login.html', {
-                        'error': 'Driver profile not assigned to this user'
-                    })
-                from django.contrib.auth import login
-                login(request, user)
-                request.session['user_id'] = user.id
-                request.session['user_role'] = user.role
-                request.session['driver_id'] = user.driver_profile.id
-                return redirect('/driver/dashboard/')
-            else:
-                return render(request, 'authentication/driver_login.html', {
-                    'error': 'Invalid credentials or not a driver'
-                })
-        except User.DoesNotExist:
-            return render(request, 'authentication/driver_login.html', {
-                'error': 'Invalid credentials or not a driver'
-            })
-
-    from django.middleware.csrf import get_token
-    csrf_token = get_token(request)
-    return render(request, 'authentication/driver_login.html', {'csrf_token': csrf_token})
+    return role_login(request, 'driver')
 
 
 def logout_view(request):
@@ -127,3 +30,54 @@ def logout_view(request):
     return redirect('/')
 
 
+# ==================== DRIVER APP DEVICE TOKENS ====================
+
+def _token_response(user):
+    return JsonResponse({'token': issue_token(user), 'expires_in': token_lifetime()})
+
+
+@csrf_exempt
+@require_POST
+def driver_token(request):
+    """Issue a device token to the driver app (username/password)"""
+    try:
+        user = authenticate_credentials(
+            request,
+            request.POST.get('username'),
+            request.POST.get('password'),
+            'driver'
+        )
+    except LoginError as error:
+        return JsonResponse({'error': error.message}, status=error.status or 401)
+    return _token_response(user)
+
+
+@csrf_exempt
+@require_POST
+def refresh_driver_token(request):
+    """Exchange a valid device token for a fresh one (the user must still be an active driver)"""
+    payload = verify_token(bearer_token(request) or '')
+    if payload is None:
+        return JsonResponse({'error': 'Invalid or expired token'}, status=401)
+
+    user = User.objects.filter(
+        pk=payload['u'],
+        role='driver',
+        is_active=True,
+        driver_profile_id=payload['d']
+    ).first()
+    if user is None:
+        return JsonResponse({'error': 'Invalid or expired token'}, status=401)
+    return _token_response(user)
+
+
+@csrf_exempt
+@require_POST
+def revoke_driver_token(request):
+    """Revoke the device token of the request (driver app logout)"""
+    payload = verify_token(bearer_token(request) or '')
+    if payload is None:
+        return JsonResponse({'error': 'Invalid or expired token'}, status=401)
+
+    revoke_token(payload)
+    return JsonResponse({'success': True})
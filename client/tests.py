@@ -1,3 +1,184 @@
-from django.test import TestCase
+import json
+from contextlib import asynccontextmanager
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from authentication.models import User
+from client import views
+from common.models import Client, Invoice, Payment, TrackingEvent
+from common.pubsub import Broker, shipment_topic
+from common.tests import make_fixtures, make_shipment, page_queries
+
+
+class ClientTestCase(TestCase):
+    """A client portal user logged in with the fixtures' client"""
+
+    def setUp(self):
+        self.fixtures = make_fixtures(shipments=1)
+        self.user = User.objects.create_user('client', role='client', client_profile=self.fixtures.client)
+        self.client.force_login(self.user)
+
+
+# ==================== CONDITIONAL GET ====================
+
+class ConditionalPageTests(ClientTestCase):
+    def setUp(self):
+        super().setUp()
+        self.shipment = self.fixtures.shipments[0]
+        self.invoice = Invoice.objects.create(
+            client=self.fixtures.client, due_date=timezone.localdate() + timedelta(days=30),
+            tva_rate=Decimal('19.00'), status='issued'
+        )
+
+    def test_unchanged_shipment_page_answers_not_modified(self):
+        path = f'/client/shipments/{self.shipment.pk}/'
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        self.assertEqual(self.client.get(path, headers={'if-none-match': response['ETag']}).status_code, 304)
+        self.assertEqual(
+            self.client.get(path, headers={'if-modified-since': response['Last-Modified']}).status_code, 304
+        )
+
+    def test_new_tracking_event_changes_the_shipment_page(self):
+        path = f'/client/shipments/{self.shipment.pk}/'
+        etag = self.client.get(path)['ETag']
+
+        TrackingEvent.objects.create(shipment=self.shipment, status='in_transit', location='Blida')
+
+        response = self.client.get(path, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Blida')
+
+    def test_new_payment_changes_the_invoice_page(self):
+        path = f'/client/invoices/{self.invoice.pk}/'
+        response = self.client.get(path)
+        self.assertEqual(self.client.get(path, headers={'if-none-match': response['ETag']}).status_code, 304)
+
+        Payment.objects.create(
+            invoice=self.invoice, amount=Decimal('10.00'), payment_date=timezone.localdate(), payment_method='cash'
+        )
+
+        self.assertEqual(self.client.get(path, headers={'if-none-match': response['ETag']}).status_code, 200)
+
+    def test_other_clients_pages_are_not_found(self):
+        other = make_shipment(self.fixtures, client=Client.objects.create(
+            name='Other', email='other@example.com', phone='1', address='a', city='Oran', postal_code='31000'
+        ))
+
+        self.assertEqual(self.client.get(f'/client/shipments/{other.pk}/', headers={'if-none-match': '*'}).status_code, 404)
+
+
+# ==================== CODE AUTOCOMPLETE ====================
+
+class SuggestCodesTests(ClientTestCase):
+    def test_only_the_clients_own_shipments_and_invoices(self):
+        make_shipment(self.fixtures, client=Client.objects.create(
+            name='Other', email='other@example.com', phone='1', address='a', city='Oran', postal_code='31000'
+        ))
+        shipment = self.fixtures.shipments[0]
+
+        suggestions = self.client.get('/client/api/codes/', {'q': 'exp'}).json()['suggestions']
+
+        self.assertEqual(suggestions, [{
+            'kind': 'shipment', 'code': shipment.shipment_number, 'id': shipment.pk,
+            'url': f'/client/shipments/{shipment.pk}/'
+        }])
+        self.assertEqual(self.client.get('/client/api/codes/', {'q': 'CLT'}).json()['suggestions'], [])
+
+
+# ==================== LIST PROJECTIONS ====================
+
+class ShipmentListTests(ClientTestCase):
+    def test_queries_do_not_grow_with_the_rows(self):
+        queries = page_queries(self.client, '/client/shipments/')
+        for shipment in range(5):
+            make_shipment(self.fixtures)
+
+        self.assertEqual(len(page_queries(self.client, '/client/shipments/')), len(queries))
+
+
+# ==================== LIVE TRACKING ====================
+
+@override_settings(SSE_KEEPALIVE_SECONDS=0.05)
+class ShipmentEventsTests(ClientTestCase):
+    def setUp(self):
+        super().setUp()
+        self.shipment = self.fixtures.shipments[0]
+        self.url = reverse('client:shipment_events', args=[self.shipment.id])
+        self.first = TrackingEvent.objects.create(shipment=self.shipment, status='pending', location='Alger')
+        self.second = TrackingEvent.objects.create(shipment=self.shipment, status='in_transit', location='Blida')
+
+    def add_event(self, publish=True):
+        # Without publish: the event was written by another process (this one never sees it committed)
+        with self.captureOnCommitCallbacks(execute=publish):
+            return TrackingEvent.objects.create(shipment=self.shipment, status='out_for_delivery', location='Oran')
+
+    @asynccontextmanager
+    async def open_stream(self, **headers):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(self.url, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        try:
+            yield response.streaming_content
+        finally:
+            # What a disconnecting browser does: the view's generator leaves the broker
+            await response._iterator.aclose()
+
+    @staticmethod
+    def parse(chunk):
+        fields = dict(line.split(': ', 1) for line in chunk.decode().strip().split('\n'))
+        if 'data' in fields:
+            fields['data'] = json.loads(fields['data'])
+        return fields
+
+    def test_wsgi_answers_no_content(self):
+        self.assertEqual(self.client.get(self.url).status_code, 204)
+
+    async def test_pushes_events_published_by_this_process(self):
+        async with self.open_stream() as stream:
+            self.assertTrue((await anext(stream)).startswith(b'retry: '))
+            self.assertEqual(self.parse(await anext(stream))['event'], 'eta')
+
+            event = await sync_to_async(self.add_event)()
+
+            message = self.parse(await anext(stream))
+            self.assertEqual(message['event'], 'tracking')
+            self.assertEqual(message['id'], str(event.id))
+            self.assertEqual(message['data']['status'], 'out_for_delivery')
+
+    async def test_keepalive_queries_only_when_the_stamp_moved(self):
+        async with self.open_stream() as stream:
+            await anext(stream)
+            await anext(stream)
+
+            with mock.patch('client.views._events_after', wraps=views._events_after) as events_after:
+                self.assertEqual(await anext(stream), b': keepalive\n\n')
+                self.assertEqual(await anext(stream), b': keepalive\n\n')
+                events_after.assert_not_called()
+
+                event = await sync_to_async(self.add_event)(publish=False)
+                # The other process's broker only shares the stamp with this one
+                await sync_to_async(Broker().publish)(shipment_topic(self.shipment.id), 'tracking', {}, event.id)
+                # The stamp moved: the next keepalive catches up from the database
+                message = self.parse(await anext(stream))
+            self.assertEqual(message['id'], str(event.id))
+            events_after.assert_called_once_with(self.shipment.id, self.second.id)
+
+    async def test_resumes_after_last_event_id(self):
+        async with self.open_stream(**{'Last-Event-ID': str(self.first.id)}) as stream:
+            await anext(stream)
+
+            message = self.parse(await anext(stream))
+            self.assertEqual((message['event'], message['id']), ('tracking', str(self.second.id)))
+            self.assertEqual(message['data']['location'], 'Blida')
+            self.assertEqual(self.parse(await anext(stream))['event'], 'eta')
@@ -11,10 +11,14 @@ urlpatterns = [
     path('shipments/', views.shipment_list, name='shipment_list'),
     path('shipments/<int:shipment_id>/', views.shipment_detail, name='shipment_detail'),
     path('track/', views.track_shipment, name='track_shipment'),
+    path('api/codes/', views.suggest_codes, name='suggest_codes'),
+    path('api/shipments/<int:shipment_id>/eta/', views.shipment_eta, name='shipment_eta'),
+    path('api/shipments/<int:shipment_id>/events/', views.shipment_events, name='shipment_events'),
 
     # Invoices
     path('invoices/', views.invoice_list, name='invoice_list'),
     path('invoices/<int:invoice_id>/', views.invoice_detail, name='invoice_detail'),
+    path('statement/', views.account_statement, name='statement'),
 
     # Claims
     path('claims/', views.claim_list, name='claim_list'),
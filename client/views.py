@@ -1,123 +1,218 @@
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
-from django.contrib.auth import logout
-from django.http import JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.contrib import messages
-from django.core.paginator import Paginator
+from django.urls import reverse
 from django.utils import timezone
+from django.utils.dateparse import parse_date
+from common import archive, client_stats, ledger, typeahead
+from common.conditional import conditional_page, invoice_validators, shipment_validators
+from common.pagination import paginate
+from common.projections import project
 from common.models import Client, Shipment, Invoice, Payment, Claim, TrackingEvent
+from common.eta import eta_payload, get_eta
+from common.pubsub import broker, shipment_topic
+from common.signals import tracking_event_payload
+from authentication.decorators import role_required
 from authentication.models import User
 
 def get_client_from_request(request):
     """Helper function to get client from authenticated user"""
-    if not request.user.is_authenticated:
-        return None
-
-    try:
-        return Client.objects.get(auth_user=request.user)
-    except Client.DoesNotExist:
+    if not request.user.is_authenticated or request.user.role != 'client':
         return None
+    return request.user.client_profile
 
 # ==================== CLIENT DASHBOARD ====================
 
+@role_required('client')
 def client_dashboard(request):
     """CL-01: View own profile & balance, CL-02: Track shipments, CL-04: View invoices"""
-    if not request.user.is_authenticated or request.user.role != 'client':
-        return redirect('/auth/client/login/')
-
-    try:
-        client = Client.objects.get(auth_user=request.user)
-    except Client.DoesNotExist:
-        logout(request)
-        return redirect('/auth/client/login/?error=Profile%20not%20found.%20Please%20contact%20support.')
+    client = request.profile
 
     # Get dashboard data
     recent_shipments = Shipment.objects.filter(client=client).select_related('destination').order_by('-created_at')[:10]
-    active_shipments = Shipment.objects.filter(
-        client=client,
-        status__in=['in_transit', 'at_sorting_center', 'out_for_delivery']
-    )
-    pending_invoices = Invoice.objects.filter(client=client, status__in=['issued', 'partially_paid', 'overdue'])
+    pending_invoices = Invoice.objects.filter(
+        client=client, status__in=client_stats.OPEN_INVOICE_STATUSES
+    )[:5]
 
-    # Calculate statistics
-    total_shipments = Shipment.objects.filter(client=client).count()
-    delivered_shipments = Shipment.objects.filter(client=client, status='delivered').count()
-    from django.db.models import Sum
-    total_spent = Payment.objects.filter(invoice__client=client).aggregate(
-        total=Sum('amount')
-    )['total'] or 0
+    # Statistics: the client's counters row instead of counting and summing (common/client_stats.py)
+    stats = client_stats.get_stats(client.pk)
 
     context = {
         'client': client,
         'recent_shipments': recent_shipments,
-        'active_shipments': active_shipments,
+        'active_shipments': stats.active_shipments,
         'pending_invoices': pending_invoices,
-        'total_shipments': total_shipments,
-        'delivered_shipments': delivered_shipments,
-        'in_transit_shipments': total_shipments - delivered_shipments,
-        'total_spent': total_spent,
-        'pending_amount': sum(invoice.balance_due for invoice in pending_invoices)
+        'open_invoices': stats.open_invoices,
+        'total_shipments': stats.total_shipments,
+        'delivered_shipments': stats.delivered_shipments,
+        'in_transit_shipments': stats.total_shipments - stats.delivered_shipments,
+        'total_spent': stats.total_paid,
+        'pending_amount': stats.open_balance
     }
 
     return render(request, 'client/dashboard.html', context)
 
 # ==================== SHIPMENT TRACKING ====================
 
+# Fields shown by client/shipment_list.html (common/projections.py)
+SHIPMENT_LIST_FIELDS = (
+    'shipment_number', 'status', 'created_at', 'estimated_delivery',
+    'recipient_name', 'recipient_phone', 'destination__city', 'destination__country',
+)
+
+@role_required('client')
 def shipment_list(request):
     """CL-03: View shipment history"""
-    if not request.user.is_authenticated or request.user.role != 'client':
-        return redirect('/auth/client/login/')
-
-    try:
-        client = Client.objects.get(auth_user=request.user)
-    except Client.DoesNotExist:
-        logout(request)
-        return redirect('/auth/client/login/?error=Profile%20not%20found.%20Please%20contact%20support.')
+    client = request.profile
 
-    shipments = Shipment.objects.filter(client=client).select_related('destination').order_by('-created_at')
+    shipments = project(
+        Shipment.objects.filter(client=client).order_by('-created_at'),
+        SHIPMENT_LIST_FIELDS
+    )
 
     # Pagination
-    paginator = Paginator(shipments, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator, page_obj = paginate(request, shipments, 20)
 
     return render(request, 'client/shipment_list.html', {
         'client': client,
         'page_obj': page_obj
     })
 
+def _shipment_validators(request, shipment_id):
+    return shipment_validators(request, shipment_id, client=request.profile)
+
+@role_required('client')
+@conditional_page(_shipment_validators)
 def shipment_detail(request, shipment_id):
     """CL-02: Track shipments (real-time)"""
-    if not request.user.is_authenticated or request.user.role != 'client':
-        return redirect('/auth/client/login/')
-
-    try:
-        client = Client.objects.get(auth_user=request.user)
-    except Client.DoesNotExist:
-        logout(request)
-        return redirect('/auth/client/login/?error=Profile%20not%20found.%20Please%20contact%20support.')
+    client = request.profile
 
     shipment = get_object_or_404(Shipment.objects.select_related('destination', 'client'), id=shipment_id, client=client)
-    tracking_history = TrackingEvent.objects.filter(shipment=shipment).order_by('-timestamp')
+    tracking_history = archive.tracking_history(shipment.id)
 
     return render(request, 'client/shipment_detail.html', {
         'client': client,
         'shipment': shipment,
-        'tracking_history': tracking_history
+        'tracking_history': tracking_history,
+        'eta': get_eta(shipment.id),
+        'live_events': _live_events(request)
     })
 
+@role_required('client', api=True)
+def shipment_eta(request, shipment_id):
+    """CL-02: Live ETA of a shipment (JSON, read from the ETA cache)"""
+    if not Shipment.objects.filter(id=shipment_id, client=request.profile).exists():
+        return JsonResponse({'error': 'Shipment not found'}, status=404)
+
+    return JsonResponse(eta_payload(shipment_id, get_eta(shipment_id)))
+
+def _live_events(request):
+    # A stream holds its connection open: only served by an ASGI server
+    return isinstance(request, ASGIRequest)
+
+def _sse_message(event, data, event_id=None):
+    lines = [f'event: {event}']
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+def _events_after(shipment_id, last_id):
+    return TrackingEvent.objects.filter(shipment_id=shipment_id, id__gt=last_id).order_by('id')
+
+@role_required('client', api=True)
+async def shipment_events(request, shipment_id):
+    """CL-02: Real-time tracking stream (server-sent events, served through ASGI)
+
+    Pushes new tracking events and ETA changes for one shipment. The stream is
+    fed by the in-process pub/sub broker, which only reaches the watchers of
+    the process that made the change: every keepalive period the stream also
+    reads the topic's stamp and the ETA from the shared cache, and only queries
+    the tracking events written by other processes when the stamp moved.
+    Under WSGI it answers 204, which tells EventSource not to reconnect.
+    """
+    if not _live_events(request):
+        return HttpResponse(status=204)
+    if not await Shipment.objects.filter(id=shipment_id, client=request.profile).aexists():
+        return JsonResponse({'error': 'Shipment not found'}, status=404)
+
+    topic = shipment_topic(shipment_id)
+    # Read before the events: anything published after this moves the stamp
+    stamp = await sync_to_async(broker.stamp)(topic)
+
+    # Replay what a reconnecting browser missed (EventSource sends Last-Event-ID)
+    missed = []
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    if last_event_id.isdigit():
+        missed = [tracking_event_payload(event) async for event in _events_after(shipment_id, int(last_event_id))]
+        last_id = missed[-1]['id'] if missed else int(last_event_id)
+    else:
+        last_id = await TrackingEvent.objects.filter(shipment_id=shipment_id).order_by('-id').values_list(
+            'id', flat=True
+        ).afirst() or 0
+
+    keepalive = getattr(settings, 'SSE_KEEPALIVE_SECONDS', 15)
+    subscription = broker.subscribe(topic)
+
+    async def stream():
+        nonlocal last_id, stamp
+        try:
+            yield f'retry: {keepalive * 1000}\n\n'
+            for payload in missed:
+                yield _sse_message('tracking', payload, payload['id'])
+            eta = eta_payload(shipment_id, await sync_to_async(get_eta)(shipment_id))
+            yield _sse_message('eta', eta)
+
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscription.get(), timeout=keepalive)
+                except asyncio.TimeoutError:
+                    # Changes made by other processes never reach this broker
+                    caught_up = False
+                    current_stamp = await sync_to_async(broker.stamp)(topic)
+                    if current_stamp != stamp:
+                        stamp = current_stamp
+                        async for event in _events_after(shipment_id, last_id):
+                            payload = tracking_event_payload(event)
+                            last_id = payload['id']
+                            caught_up = True
+                            yield _sse_message('tracking', payload, payload['id'])
+                    current = eta_payload(shipment_id, await sync_to_async(get_eta)(shipment_id))
+                    if current != eta:
+                        eta = current
+                        caught_up = True
+                        yield _sse_message('eta', eta)
+                    if not caught_up:
+                        yield ': keepalive\n\n'
+                    continue
+                if message['event'] == 'tracking':
+                    if message['id'] <= last_id:
+                        continue
+                    last_id = message['id']
+                elif message['event'] == 'eta':
+                    eta = message['data']
+                yield _sse_message(message['event'], message['data'], message['id'])
+        finally:
+            broker.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@role_required('client')
 def track_shipment(request):
     """CL-02: Track shipment by number"""
-    if not request.user.is_authenticated or request.user.role != 'client':
-        return redirect('/auth/client/login/')
-
-    try:
-        client = Client.objects.get(auth_user=request.user)
-    except Client.DoesNotExist:
-        logout(request)
-        return redirect('/auth/client/login/?error=Profile%20not%20found.%20Please%20contact%20support.')
+    client = request.profile
 
     if request.method == 'POST':
-        tracking_number = request.POST.get('tracking_number')
+        tracking_number = typeahead.normalize(request.POST.get('tracking_number'))
 
         try:
             shipment = Shipment.objects.get(
@@ -127,45 +222,61 @@ def track_shipment(request):
             return redirect('client:shipment_detail', shipment_id=shipment.id)
 
         except Shipment.DoesNotExist:
+            # A partial number is enough when only one of the client's shipments starts with it
+            matches = typeahead.suggest(tracking_number, limit=2, client_id=client.pk, kinds=['shipment'])
+            if len(matches) == 1:
+                return redirect('client:shipment_detail', shipment_id=matches[0][2])
             messages.error(request, "Shipment not found or doesn't belong to your account.")
 
     return render(request, 'client/track_shipment.html', {'client': client})
 
+# Detail page of each kind of code suggested
+TYPEAHEAD_URLS = {
+    'shipment': 'client:shipment_detail',
+    'invoice': 'client:invoice_detail',
+}
+
+@role_required('client', api=True)
+def suggest_codes(request):
+    """AJAX: Autocomplete of the client's own shipment (EXP) and invoice (FAC) numbers"""
+    suggestions = typeahead.suggest(
+        request.GET.get('q', ''),
+        client_id=request.profile.pk,
+        kinds=list(TYPEAHEAD_URLS)
+    )
+
+    return JsonResponse({'suggestions': [{
+        'kind': kind,
+        'code': code,
+        'id': pk,
+        'url': reverse(TYPEAHEAD_URLS[kind], args=[pk])
+    } for kind, code, pk in suggestions]})
+
 # ==================== INVOICE MANAGEMENT ====================
 
+@role_required('client')
 def invoice_list(request):
     """CL-04: View payment history"""
-    if not request.user.is_authenticated or request.user.role != 'client':
-        return redirect('/auth/client/login/')
-
-    try:
-        client = Client.objects.get(auth_user=request.user)
-    except Client.DoesNotExist:
-        logout(request)
-        return redirect('/auth/client/login/?error=Profile%20not%20found.%20Please%20contact%20support.')
+    client = request.profile
 
     invoices = Invoice.objects.filter(client=client).order_by('-issue_date')
 
     # Pagination
-    paginator = Paginator(invoices, 15)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator, page_obj = paginate(request, invoices, 15, ordering=('-issue_date', '-id'))
 
     return render(request, 'client/invoice_list.html', {
         'client': client,
         'page_obj': page_obj
     })
 
+def _invoice_validators(request, invoice_id):
+    return invoice_validators(request, invoice_id, client=request.profile)
+
+@role_required('client')
+@conditional_page(_invoice_validators)
 def invoice_detail(request, invoice_id):
     """CL-04: Download invoice PDF (view details)"""
-    if not request.user.is_authenticated or request.user.role != 'client':
-        return redirect('/auth/client/login/')
-
-    try:
-        client = Client.objects.get(auth_user=request.user)
-    except Client.DoesNotExist:
-        logout(request)
-        return redirect('/auth/client/login/?error=Profile%20not%20found.%20Please%20contact%20support.')
+    client = request.profile
 
     invoice = get_object_or_404(Invoice, id=invoice_id, client=client)
     payments = Payment.objects.filter(invoice=invoice).order_by('-payment_date')
@@ -176,18 +287,34 @@ def invoice_detail(request, invoice_id):
         'payments': payments
     })
 
+def _date_param(request, name, default):
+    try:
+        return parse_date(request.GET.get(name) or '') or default
+    except ValueError:
+        return default
+
+@role_required('client')
+def account_statement(request):
+    """CL-01: View own balance - account statement over a period (client ledger)"""
+    client = request.profile
+
+    today = timezone.localdate()
+    start = _date_param(request, 'start', today.replace(day=1))
+    end = _date_param(request, 'end', today)
+    if start > end:
+        start, end = end, start
+
+    return render(request, 'client/statement.html', {
+        'client': client,
+        'statement': ledger.statement(client, start, end)
+    })
+
 # ==================== CLAIMS MANAGEMENT ====================
 
+@role_required('client')
 def submit_claim(request):
     """CL-06: Submit claim"""
-    if not request.user.is_authenticated or request.user.role != 'client':
-        return redirect('/auth/client/login/')
-
-    try:
-        client = Client.objects.get(auth_user=request.user)
-    except Client.DoesNotExist:
-        logout(request)
-        return redirect('/auth/client/login/?error=Profile%20not%20found.%20Please%20contact%20support.')
+    client = request.profile
 
     if request.method == 'POST':
         subject = request.POST.get('title') or request.POST.get('subject', '')
@@ -217,39 +344,25 @@ def submit_claim(request):
         'shipments': shipments
     })
 
+@role_required('client')
 def claim_list(request):
     """CL-07: Track claim status"""
-    if not request.user.is_authenticated or request.user.role != 'client':
-        return redirect('/auth/client/login/')
-
-    try:
-        client = Client.objects.get(auth_user=request.user)
-    except Client.DoesNotExist:
-        logout(request)
-        return redirect('/auth/client/login/?error=Profile%20not%20found.%20Please%20contact%20support.')
+    client = request.profile
 
     claims = Claim.objects.filter(client=client).select_related('shipment', 'shipment__destination', 'shipment__client').order_by('-filed_date')
 
     # Pagination
-    paginator = Paginator(claims, 15)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator, page_obj = paginate(request, claims, 15, ordering=('-filed_date', '-id'))
 
     return render(request, 'client/claim_list.html', {
         'client': client,
         'page_obj': page_obj
     })
 
+@role_required('client')
 def claim_detail(request, claim_id):
     """CL-07: Track claim status (detailed view)"""
-    if not request.user.is_authenticated or request.user.role != 'client':
-        return redirect('/auth/client/login/')
-
-    try:
-        client = Client.objects.get(auth_user=request.user)
-    except Client.DoesNotExist:
-        logout(request)
-        return redirect('/auth/client/login/?error=Profile%20not%20found.%20Please%20contact%20support.')
+    client = request.profile
 
     claim = get_object_or_404(
         Claim.objects.select_related('shipment', 'shipment__destination', 'shipment__client'),
@@ -263,16 +376,10 @@ def claim_detail(request, claim_id):
 
 # ==================== PROFILE MANAGEMENT ====================
 
+@role_required('client')
 def client_profile(request):
     """CL-01: View own profile & balance"""
-    if not request.user.is_authenticated or request.user.role != 'client':
-        return redirect('/auth/client/login/')
-
-    try:
-        client = Client.objects.get(auth_user=request.user)
-    except Client.DoesNotExist:
-        logout(request)
-        return redirect('/auth/client/login/?error=Profile%20not%20found.%20Please%20contact%20support.')
+    client = request.profile
 
     if request.method == 'POST':
         # Handle profile updates
@@ -1,12 +1,16 @@
 from django.contrib import admin
 
 # Register your models here.
-from .models import Client, Driver, Vehicle, Destination, ServiceType, Shipment
+from .models import Client, Driver, Vehicle, Destination, ServiceType, TariffVersion, TariffRate, Shipment, LedgerEntry
+from . import ledger
 
 @admin.register(Client)
 class ClientAdmin(admin.ModelAdmin):
     list_display = ['client_id', 'name', 'email', 'phone', 'balance']
 
+    def get_queryset(self, request):
+        return ledger.with_balance(super().get_queryset(request))
+
 @admin.register(Driver)
 class DriverAdmin(admin.ModelAdmin):
     list_display = ['driver_id', 'first_name', 'last_name', 'availability']
@@ -23,6 +27,32 @@ class DestinationAdmin(admin.ModelAdmin):
 class ServiceTypeAdmin(admin.ModelAdmin):
     list_display = ['code', 'name', 'type']
 
+class TariffRateInline(admin.TabularInline):
+    model = TariffRate
+    extra = 0
+
+@admin.register(TariffVersion)
+class TariffVersionAdmin(admin.ModelAdmin):
+    list_display = ['name', 'effective_from', 'is_active']
+    inlines = [TariffRateInline]
+
 @admin.register(Shipment)
 class ShipmentAdmin(admin.ModelAdmin):
-    list_display = ['shipment_number', 'client', 'status', 'amount']
\ No newline at end of file
+    list_display = ['shipment_number', 'client', 'status', 'amount']
+
+@admin.register(LedgerEntry)
+class LedgerEntryAdmin(admin.ModelAdmin):
+    """Entries are append-only: the admin only adds adjustments"""
+    list_display = ['client', 'sequence', 'created_at', 'entry_type', 'description', 'debit', 'credit', 'balance']
+    list_filter = ['entry_type']
+    fields = ['client', 'debit', 'credit', 'description']
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def save_model(self, request, obj, form, change):
+        entry = ledger.adjust(obj.client, obj.debit - obj.credit, obj.description, request.user)
+        obj.pk = entry.pk
@@ -0,0 +1,154 @@
+"""
+History archive - common/archive.py
+Moves cold rows of tracking_events and audit_logs to archive tables.
+
+The tracking events of shipments delivered more than ARCHIVE_AFTER_MONTHS
+ago are final: nobody adds to them and they are rarely read. They move to
+tracking_events_archive, and audit log entries older than that move to
+audit_logs_archive, so the hot tables (and their indexes) only hold the
+rows that live pages and inserts touch.
+
+Rows move in batches of ARCHIVE_BATCH_SIZE, each batch in one transaction:
+INSERT INTO archive SELECT ... FROM hot, then DELETE FROM hot, keeping the
+ids. Restoring runs the same statements the other way round. The moves are
+raw SQL: they neither fire the tracking event signals (public tracking
+payloads and live streams) nor reset the timestamps.
+
+Readers do not need to know where a row is: tracking_history() and
+audit_history() read both tables in one UNION query.
+`python manage.py archive_history` archives or restores and reports the rows
+moved per second.
+"""
+
+import calendar
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import BooleanField, Value
+from django.utils import timezone
+
+from common.models import ArchivedAuditLog, ArchivedTrackingEvent, AuditLog, TrackingEvent
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def months_ago(months, now=None):
+    """The same day and time `months` months before now (clamped to the month's last day)"""
+    now = now or timezone.now()
+    month_index = now.year * 12 + now.month - 1 - months
+    year, month = divmod(month_index, 12)
+    day = min(now.day, calendar.monthrange(year, month + 1)[1])
+    return now.replace(year=year, month=month + 1, day=day)
+
+
+class Archive:
+    """A hot table, its archive table and which hot rows are due for archiving"""
+
+    def __init__(self, name, hot, cold, due):
+        self.name = name
+        self.hot = hot
+        self.cold = cold
+        self.due = due  # cutoff -> queryset of the hot rows to archive
+        self.columns = [field.column for field in hot._meta.concrete_fields]
+
+    def _move(self, source, target, ids, extra=None):
+        quote = connection.ops.quote_name
+        columns = ', '.join(quote(column) for column in self.columns)
+        placeholders = ', '.join(['%s'] * len(ids))
+        target_columns, values, params = columns, columns, []
+        if extra:
+            target_columns += ', ' + ', '.join(quote(column) for column in extra)
+            values += ', ' + ', '.join(['%s'] * len(extra))
+            params.extend(extra.values())
+        source_table, target_table = quote(source._meta.db_table), quote(target._meta.db_table)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {target_table} ({target_columns}) '
+                f'SELECT {values} FROM {source_table} WHERE id IN ({placeholders})',
+                params + list(ids)
+            )
+            cursor.execute(f'DELETE FROM {source_table} WHERE id IN ({placeholders})', list(ids))
+        return len(ids)
+
+    def _batches(self, queryset, batch_size):
+        # Keyset over the primary key: each batch starts after the previous one
+        last = None
+        while True:
+            batch = queryset if last is None else queryset.filter(pk__gt=last)
+            ids = list(batch.order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                return
+            yield ids
+            last = ids[-1]
+
+    def archive(self, cutoff, batch_size=None):
+        """Move the rows due before `cutoff` to the archive table; yields the rows moved per batch"""
+        batch_size = batch_size or _setting('ARCHIVE_BATCH_SIZE', 1000)
+        for ids in self._batches(self.due(cutoff), batch_size):
+            yield self._move(self.hot, self.cold, ids, {'archived_at': connection.ops.adapt_datetimefield_value(timezone.now())})
+
+    def restore(self, queryset=None, batch_size=None):
+        """Move archived rows (all, or those of a queryset of the archive) back; yields the rows moved per batch"""
+        batch_size = batch_size or _setting('ARCHIVE_BATCH_SIZE', 1000)
+        for ids in self._batches(queryset if queryset is not None else self.cold.objects.all(), batch_size):
+            yield self._move(self.cold, self.hot, ids)
+
+    def pending(self, cutoff):
+        """Rows due for archiving before `cutoff`"""
+        return self.due(cutoff).count()
+
+
+ARCHIVES = {
+    'tracking_events': Archive(
+        'tracking_events', TrackingEvent, ArchivedTrackingEvent,
+        lambda cutoff: TrackingEvent.objects.filter(shipment__status='delivered', shipment__actual_delivery__lt=cutoff)
+    ),
+    'audit_logs': Archive(
+        'audit_logs', AuditLog, ArchivedAuditLog,
+        lambda cutoff: AuditLog.objects.filter(timestamp__lt=cutoff)
+    ),
+}
+
+
+def cutoff(months=None):
+    """Rows older than this are archived"""
+    return months_ago(months if months is not None else _setting('ARCHIVE_AFTER_MONTHS', 6))
+
+
+# ==================== UNIFIED HISTORY ====================
+
+TRACKING_FIELDS = ('id', 'status', 'location', 'timestamp', 'notes', 'created_by_id')
+AUDIT_FIELDS = ('id', 'user_id', 'action', 'model_name', 'object_id', 'details', 'ip_address', 'timestamp')
+
+
+def tracking_history(shipment_id, limit=None):
+    """
+    Tracking events of a shipment, latest first, whether archived or not
+    (list of dicts with the TrackingEvent fields, plus 'archived')
+    """
+    hot = TrackingEvent.objects.filter(shipment_id=shipment_id).order_by().values(*TRACKING_FIELDS)
+    cold = ArchivedTrackingEvent.objects.filter(shipment_id=shipment_id).order_by().values(*TRACKING_FIELDS)
+    return _union(hot, cold, limit)
+
+
+def audit_history(model_name=None, object_id=None, user_id=None, limit=None):
+    """Audit log entries, latest first, whether archived or not (list of dicts, plus 'archived')"""
+    filters = {}
+    if model_name is not None:
+        filters['model_name'] = model_name
+    if object_id is not None:
+        filters['object_id'] = str(object_id)
+    if user_id is not None:
+        filters['user_id'] = user_id
+    hot = AuditLog.objects.filter(**filters).order_by().values(*AUDIT_FIELDS)
+    cold = ArchivedAuditLog.objects.filter(**filters).order_by().values(*AUDIT_FIELDS)
+    return _union(hot, cold, limit)
+
+
+def _union(hot, cold, limit):
+    hot = hot.annotate(archived=Value(False, output_field=BooleanField()))
+    cold = cold.annotate(archived=Value(True, output_field=BooleanField()))
+    rows = hot.union(cold, all=True).order_by('-timestamp', '-id')
+    return list(rows[:limit] if limit else rows)
@@ -0,0 +1,25 @@
+"""
+Cache backends - common/cache_backends.py
+The locmem and file-based backends, counting the entries they cull when full
+(reported per alias by common/caching.py).
+"""
+
+from django.core.cache.backends import filebased, locmem
+
+from common import caching
+
+
+class LocMemCache(locmem.LocMemCache):
+    def _cull(self):
+        before = len(self._cache)
+        super()._cull()
+        caching.record_evictions(self.key_prefix, before - len(self._cache))
+
+
+class FileBasedCache(filebased.FileBasedCache):
+    def _cull(self):
+        entries = len(self._list_cache_files())
+        super()._cull()
+        if entries >= self._max_entries:
+            culled = int(entries / self._cull_frequency) if self._cull_frequency else entries
+            caching.record_evictions(self.key_prefix, culled)
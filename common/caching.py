@@ -0,0 +1,232 @@
+"""
+Cache layer - common/caching.py
+Namespaced, instrumented access to the named caches of settings.CACHES.
+
+Every subsystem takes its cache from get_cache(namespace, alias): keys are
+prefixed with the namespace and stored under the namespace's version
+(settings.CACHE_NAMESPACE_VERSIONS), so bumping a version drops every key a
+subsystem wrote, e.g. after the shape of its cached values changed.
+
+Each operation is counted (hits, misses, writes, deletes, time spent) in
+process-local counters, added to shared totals in the default cache every
+CACHE_STATS_FLUSH_SECONDS by a background thread (best effort: requests
+never wait for it, and a failed flush loses its counts). Entries evicted by
+the locmem and file backends (common/cache_backends.py) are counted per
+alias. The totals are read by stats() and `python manage.py cache_stats`.
+"""
+
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.locmem import LocMemCache
+
+logger = logging.getLogger(__name__)
+
+STATS_KEY = 'cachestats:{}:{}:{}'  # alias, namespace, field
+STATS_INDEX_KEY = 'cachestats:index'
+FIELDS = ('gets', 'hits', 'misses', 'writes', 'deletes', 'operations', 'time_ns')
+EVICTIONS = '@evictions'  # Pseudo-namespace holding the evictions of an alias
+
+_missing = object()
+_lock = threading.Lock()
+_flushing = threading.Lock()  # Held while a background flush runs
+_registry = {}  # (alias, namespace) -> NamespacedCache
+_pending = {}  # (alias, namespace) -> {field: count} not yet flushed
+_state = {'flushed_at': time.monotonic(), 'indexed': set()}
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _record(alias, namespace, started, **counts):
+    counts['operations'] = 1
+    counts['time_ns'] = time.perf_counter_ns() - started
+    with _lock:
+        pending = _pending.setdefault((alias, namespace), dict.fromkeys(FIELDS, 0))
+        for field, count in counts.items():
+            pending[field] += count
+        due = time.monotonic() - _state['flushed_at'] >= _setting('CACHE_STATS_FLUSH_SECONDS', 10)
+    if due:
+        _schedule_flush()
+
+
+def record_evictions(alias, count):
+    """Called by the cache backends when they cull entries"""
+    if count > 0:
+        with _lock:
+            pending = _pending.setdefault((alias, EVICTIONS), {})
+            pending['evictions'] = pending.get('evictions', 0) + count
+
+
+def _add(store, key, count):
+    try:
+        store.incr(key, count)
+    except ValueError:
+        if not store.add(key, count, None):
+            store.incr(key, count)
+
+
+def _background_flush():
+    try:
+        flush_stats()
+    except Exception:
+        logger.exception("Flushing cache statistics failed")
+    finally:
+        # This thread's cache connection is not managed by a request
+        caches['default'].close()
+        _flushing.release()
+
+
+def _schedule_flush():
+    """Flush in a background thread, unless one is already running"""
+    if _flushing.acquire(blocking=False):
+        threading.Thread(target=_background_flush, name='cache-stats-flush', daemon=True).start()
+
+
+def flush_stats():
+    """Add this process's counters to the shared totals"""
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+        _state['flushed_at'] = time.monotonic()
+    if not pending:
+        return
+    store = caches['default']
+    new = set(pending) - _state['indexed']
+    if new:
+        index = store.get(STATS_INDEX_KEY) or set()
+        if not new <= index:
+            store.set(STATS_INDEX_KEY, index | new, None)
+        _state['indexed'] |= new
+    for (alias, namespace), counts in pending.items():
+        for field, count in counts.items():
+            if count:
+                _add(store, STATS_KEY.format(alias, namespace, field), count)
+
+
+def stats():
+    """
+    Shared totals per cache: {(alias, namespace): {field: count}}, where the
+    (alias, '@evictions') entries hold the evictions of each alias.
+    """
+    flush_stats()
+    store = caches['default']
+    index = sorted(store.get(STATS_INDEX_KEY) or ())
+    keys = {
+        STATS_KEY.format(alias, namespace, field): (alias, namespace, field)
+        for alias, namespace in index
+        for field in (('evictions',) if namespace == EVICTIONS else FIELDS)
+    }
+    totals = {entry: {} for entry in index}
+    values = store.get_many(list(keys))
+    for key, (alias, namespace, field) in keys.items():
+        totals[(alias, namespace)][field] = values.get(key, 0)
+    return totals
+
+
+def reset_stats():
+    flush_stats()
+    store = caches['default']
+    index = store.get(STATS_INDEX_KEY) or set()
+    store.delete_many([
+        STATS_KEY.format(alias, namespace, field)
+        for alias, namespace in index
+        for field in FIELDS + ('evictions',)
+    ] + [STATS_INDEX_KEY])
+    _state['indexed'] = set()
+
+
+class NamespacedCache:
+    """The subset of the Django cache API used by the project, on one namespace of one alias"""
+
+    def __init__(self, namespace, alias):
+        self.namespace = namespace
+        self.alias = alias
+        self.version = _setting('CACHE_NAMESPACE_VERSIONS', {}).get(namespace, 1)
+        self.prefix = f'{namespace}:'
+
+    @property
+    def backend(self):
+        # caches[] hands out one connection per thread
+        return caches[self.alias]
+
+    @property
+    def shared(self):
+        """False when every process has its own copy of the cache (locmem)"""
+        return not isinstance(self.backend, LocMemCache)
+
+    def _key(self, key):
+        return self.prefix + key
+
+    def get(self, key, default=None):
+        started = time.perf_counter_ns()
+        # A sentinel tells cached falsy values from misses
+        value = self.backend.get(self._key(key), _missing, version=self.version)
+        hit = value is not _missing
+        _record(self.alias, self.namespace, started, gets=1, hits=int(hit), misses=int(not hit))
+        return value if hit else default
+
+    def get_many(self, keys):
+        started = time.perf_counter_ns()
+        keys = list(keys)
+        found = self.backend.get_many([self._key(key) for key in keys], version=self.version)
+        values = {key: found[self._key(key)] for key in keys if self._key(key) in found}
+        _record(self.alias, self.namespace, started,
+                gets=len(keys), hits=len(values), misses=len(keys) - len(values))
+        return values
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        started = time.perf_counter_ns()
+        self.backend.set(self._key(key), value, timeout, version=self.version)
+        _record(self.alias, self.namespace, started, writes=1)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT):
+        started = time.perf_counter_ns()
+        self.backend.set_many({self._key(key): value for key, value in data.items()}, timeout, version=self.version)
+        _record(self.alias, self.namespace, started, writes=len(data))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT):
+        started = time.perf_counter_ns()
+        added = self.backend.add(self._key(key), value, timeout, version=self.version)
+        _record(self.alias, self.namespace, started, writes=int(added))
+        return added
+
+    def incr(self, key, delta=1):
+        """Raises ValueError if the key does not exist, like the Django API"""
+        started = time.perf_counter_ns()
+        try:
+            return self.backend.incr(self._key(key), delta, version=self.version)
+        finally:
+            _record(self.alias, self.namespace, started, writes=1)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT):
+        started = time.perf_counter_ns()
+        touched = self.backend.touch(self._key(key), timeout, version=self.version)
+        _record(self.alias, self.namespace, started, writes=int(touched))
+        return touched
+
+    def delete(self, key):
+        started = time.perf_counter_ns()
+        deleted = self.backend.delete(self._key(key), version=self.version)
+        _record(self.alias, self.namespace, started, deletes=1)
+        return deleted
+
+    def delete_many(self, keys):
+        started = time.perf_counter_ns()
+        keys = [self._key(key) for key in keys]
+        self.backend.delete_many(keys, version=self.version)
+        _record(self.alias, self.namespace, started, deletes=len(keys))
+
+
+def get_cache(namespace, alias='default'):
+    """The cache of a subsystem: `namespace` keys on the `alias` named cache"""
+    cache = _registry.get((alias, namespace))
+    if cache is None:
+        with _lock:
+            cache = _registry.setdefault((alias, namespace), NamespacedCache(namespace, alias))
+    return cache
@@ -0,0 +1,23 @@
+"""
+System checks - common/checks.py
+"""
+
+from django.core.checks import Tags, Warning, register
+
+from common import search
+
+
+@register(Tags.database)
+def search_triggers_check(app_configs, databases=None, **kwargs):
+    """The FTS5 search index triggers are dropped by SQLite table rebuilds (common/search.py)"""
+    if not databases or 'default' not in databases:
+        return []
+    missing = search.missing_triggers()
+    if not missing:
+        return []
+    return [Warning(
+        f"Search index triggers missing: {', '.join(sorted(missing))}. "
+        "Writes to their tables are not indexed.",
+        hint="Run `python manage.py rebuild_search_index` to recreate them and reindex.",
+        id='common.W001',
+    )]
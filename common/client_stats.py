@@ -0,0 +1,195 @@
+"""
+Client statistics - common/client_stats.py
+One ClientStats row per client: shipments by status, last shipment date,
+invoiced and paid totals, open invoices and open balance.
+
+Client pages read that row instead of counting and summing the client's
+shipments, invoices and payments. Signal handlers (common/signals.py) keep
+it current in the transaction of each write:
+- a new shipment adds to the total and to its status, a status change moves
+  it from one status to the other, a deletion removes it;
+- saving an invoice (payments save their invoice) applies the difference
+  between its old and new amounts and status.
+
+Updates are increments (UPDATE ... SET n = n + 1), so concurrent writes on
+one client add up. A missing row is created from the client's data, and
+`python manage.py reconcile_client_stats` corrects rows after writes that
+bypass signals (QuerySet.update(), raw SQL).
+"""
+
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Q, Subquery, Sum
+from django.db.models.functions import Coalesce, Greatest
+
+from common.models import ClientStats, Invoice, Shipment
+
+# Shipment status -> counter ('failed_delivery' is recorded by the driver portal)
+STATUS_COUNTERS = {
+    'pending': 'pending_shipments',
+    'in_transit': 'in_transit_shipments',
+    'at_sorting_center': 'at_sorting_center_shipments',
+    'out_for_delivery': 'out_for_delivery_shipments',
+    'delivered': 'delivered_shipments',
+    'failed': 'failed_shipments',
+    'failed_delivery': 'failed_shipments',
+    'returned': 'returned_shipments',
+}
+
+OPEN_INVOICE_STATUSES = ('issued', 'partially_paid', 'overdue')
+UNBILLED_INVOICE_STATUSES = ('draft', 'cancelled')
+
+SHIPMENT_COUNTERS = ('total_shipments',) + tuple(dict.fromkeys(STATUS_COUNTERS.values()))
+INVOICE_COUNTERS = ('total_invoiced', 'total_paid', 'open_invoices', 'open_balance')
+COUNTERS = SHIPMENT_COUNTERS + INVOICE_COUNTERS + ('last_shipment_at',)
+
+
+def computed(client_id):
+    """The statistics of a client computed from its shipments and invoices (dict of counters)"""
+    shipments = Shipment.objects.filter(client_id=client_id).order_by()
+    values = shipments.aggregate(
+        total_shipments=Count('pk'),
+        last_shipment_at=Max('created_at'),
+        **{
+            counter: Count('pk', filter=Q(status__in=[s for s, c in STATUS_COUNTERS.items() if c == counter]))
+            for counter in SHIPMENT_COUNTERS[1:]
+        }
+    )
+    invoices = Invoice.objects.filter(client_id=client_id).exclude(status__in=UNBILLED_INVOICE_STATUSES).order_by()
+    open_filter = Q(status__in=OPEN_INVOICE_STATUSES)
+    values.update(invoices.aggregate(
+        total_invoiced=Coalesce(Sum('amount_ttc'), Decimal('0')),
+        total_paid=Coalesce(Sum('amount_paid'), Decimal('0')),
+        open_invoices=Count('pk', filter=open_filter),
+        open_balance=Coalesce(Sum(F('amount_ttc') - F('amount_paid'), filter=open_filter), Decimal('0')),
+    ))
+    return values
+
+
+def get_stats(client_id):
+    """The ClientStats row of a client, created from its data if missing"""
+    try:
+        return ClientStats.objects.get(client_id=client_id)
+    except ClientStats.DoesNotExist:
+        pass
+    try:
+        with transaction.atomic():
+            return ClientStats.objects.create(client_id=client_id, **computed(client_id))
+    except IntegrityError:
+        # Created concurrently
+        return ClientStats.objects.get(client_id=client_id)
+
+
+def _apply(client_id, changes):
+    changes = {name: value for name, value in changes.items() if value is not None}
+    if not changes:
+        return
+    if not ClientStats.objects.filter(client_id=client_id).update(**changes):
+        # No row yet: computing it from the data already includes this change
+        get_stats(client_id)
+
+
+def _increments(delta):
+    return {name: F(name) + value for name, value in delta.items() if value}
+
+
+def shipment_saved(shipment, created, previous):
+    """Count a new shipment, or move a shipment whose status changed"""
+    counter = STATUS_COUNTERS.get(shipment.status)
+    if created:
+        delta = {'total_shipments': 1}
+        if counter:
+            delta[counter] = 1
+        changes = _increments(delta)
+        changes['last_shipment_at'] = Greatest(Coalesce(F('last_shipment_at'), shipment.created_at), shipment.created_at)
+        _apply(shipment.client_id, changes)
+        return
+
+    if not previous or 'status' not in previous or previous['status'] == shipment.status:
+        return
+    delta = {}
+    old_counter = STATUS_COUNTERS.get(previous['status'])
+    if old_counter:
+        delta[old_counter] = -1
+    if counter:
+        delta[counter] = delta.get(counter, 0) + 1
+    _apply(shipment.client_id, _increments(delta))
+
+
+def shipment_deleted(shipment):
+    delta = {'total_shipments': -1}
+    counter = STATUS_COUNTERS.get(shipment.status)
+    if counter:
+        delta[counter] = -1
+    changes = _increments(delta)
+    # The latest of the remaining shipments (this one is already deleted)
+    changes['last_shipment_at'] = Subquery(
+        Shipment.objects.filter(client_id=shipment.client_id).order_by('-created_at').values('created_at')[:1]
+    )
+    _apply(shipment.client_id, changes)
+
+
+def _invoice_contribution(status, amount_ttc, amount_paid):
+    if status in UNBILLED_INVOICE_STATUSES:
+        return dict.fromkeys(INVOICE_COUNTERS, 0)
+    is_open = status in OPEN_INVOICE_STATUSES
+    return {
+        'total_invoiced': amount_ttc,
+        'total_paid': amount_paid,
+        'open_invoices': 1 if is_open else 0,
+        'open_balance': amount_ttc - amount_paid if is_open else 0,
+    }
+
+
+def invoice_saved(invoice, created):
+    """Apply the difference between an invoice's previous and current amounts and status"""
+    current = {'status': invoice.status, 'amount_ttc': invoice.amount_ttc, 'amount_paid': invoice.amount_paid}
+    previous = getattr(invoice, '_counted', None)
+    invoice._counted = current
+    if created:
+        before = dict.fromkeys(INVOICE_COUNTERS, 0)
+    elif previous is None or len(previous) < len(current):
+        # Loaded without these fields: recompute the client's totals instead
+        _apply(invoice.client_id, _invoice_totals(invoice.client_id))
+        return
+    elif previous == current:
+        return
+    else:
+        before = _invoice_contribution(**previous)
+    after = _invoice_contribution(**current)
+    _apply(invoice.client_id, _increments({name: after[name] - before[name] for name in INVOICE_COUNTERS}))
+
+
+def invoice_deleted(invoice):
+    contribution = _invoice_contribution(invoice.status, invoice.amount_ttc, invoice.amount_paid)
+    _apply(invoice.client_id, _increments({name: -value for name, value in contribution.items()}))
+
+
+def _invoice_totals(client_id):
+    values = computed(client_id)
+    return {name: values[name] for name in INVOICE_COUNTERS}
+
+
+def _differs(stats, values, name):
+    stored, counted = getattr(stats, name), values[name]
+    if isinstance(stored, Decimal):
+        return stored != Decimal(str(counted)).quantize(Decimal('0.01'))
+    return stored != counted
+
+
+def reconcile(clients):
+    """Rewrite the statistics rows that drifted (or are missing); returns the clients fixed"""
+    fixed = []
+    existing = ClientStats.objects.in_bulk([client.pk for client in clients])
+    for client in clients:
+        values = computed(client.pk)
+        stats = existing.get(client.pk)
+        if stats is None:
+            ClientStats.objects.create(client_id=client.pk, **values)
+        elif any(_differs(stats, values, name) for name in COUNTERS):
+            ClientStats.objects.filter(pk=client.pk).update(**values)
+        else:
+            continue
+        fixed.append(client)
+    return fixed
@@ -0,0 +1,102 @@
+"""
+Conditional responses - common/conditional.py
+ETag / Last-Modified validators for the shipment and invoice detail pages.
+
+A page's validators come from one aggregate query: the row's updated_at and
+the latest tracking event (shipments) or payment (invoices). When the browser
+already holds that version, Django's condition() answers 304 Not Modified
+before the view runs, so no template is rendered and no tracking history or
+payment list is loaded.
+
+The ETag also covers what else the page shows (the viewer, the cached ETA),
+and pages are marked private, revalidated on every visit. Requests carrying
+pending flash messages are always rendered in full.
+"""
+
+import hashlib
+from functools import wraps
+
+from django.contrib import messages
+from django.db.models import Max
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from common.eta import get_eta
+from common.models import Invoice, Shipment
+
+
+def _validators(kind, pk, timestamps, *extra):
+    """(etag, last_modified) from the timestamps of a row (None if the row is not visible)"""
+    timestamps = [timestamp for timestamp in timestamps if timestamp is not None]
+    if not timestamps:
+        return None, None
+    last_modified = max(timestamps)
+    parts = [kind, pk, last_modified.isoformat(), *extra]
+    etag = hashlib.md5('|'.join(str(part) for part in parts).encode()).hexdigest()
+    return etag, last_modified
+
+
+def shipment_validators(request, shipment_id, client=None):
+    """Validators of a shipment page: updated_at and the latest tracking event"""
+    shipments = Shipment.objects.filter(pk=shipment_id)
+    if client is not None:
+        shipments = shipments.filter(client=client)
+    row = shipments.annotate(
+        last_event=Max('tracking_events__timestamp')
+    ).values_list('updated_at', 'last_event').first()
+    if row is None:
+        return None, None
+
+    extra = [request.user.pk]
+    if client is not None:
+        # The client page shows the live ETA, which changes without a tracking event
+        eta = get_eta(shipment_id)
+        extra.append(eta['computed_at'].isoformat() if eta else '')
+    return _validators('shipment', shipment_id, row, *extra)
+
+
+def invoice_validators(request, invoice_id, client=None):
+    """Validators of an invoice page: updated_at and the latest payment"""
+    invoices = Invoice.objects.filter(pk=invoice_id)
+    if client is not None:
+        invoices = invoices.filter(client=client)
+    row = invoices.annotate(
+        last_payment=Max('payments__created_at')
+    ).values_list('updated_at', 'last_payment').first()
+    if row is None:
+        return None, None
+    return _validators('invoice', invoice_id, row, request.user.pk)
+
+
+def conditional_page(validators):
+    """
+    View decorator answering conditional GETs from `validators(request, *args,
+    **kwargs) -> (etag, last_modified)`, computed once per request. Apply it
+    below the role guard so the validators only run for authorised users.
+    """
+    def memoised(request, *args, **kwargs):
+        if not hasattr(request, '_page_validators'):
+            if messages.get_messages(request):
+                # A 304 would leave the flash messages for the next page
+                request._page_validators = (None, None)
+            else:
+                request._page_validators = validators(request, *args, **kwargs)
+        return request._page_validators
+
+    def etag_func(request, *args, **kwargs):
+        return memoised(request, *args, **kwargs)[0]
+
+    def last_modified_func(request, *args, **kwargs):
+        return memoised(request, *args, **kwargs)[1]
+
+    def decorator(view_func):
+        conditional_view = condition(etag_func=etag_func, last_modified_func=last_modified_func)(view_func)
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if response.has_header('ETag'):
+                patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,97 @@
+"""
+Approximate counts - common/counting.py
+"Total: N" for filtered lists without a full COUNT(*) on every page view.
+
+- Small results are counted exactly, with a count bounded by
+  APPROX_COUNT_THRESHOLD rows (SELECT COUNT(*) FROM (... LIMIT n)).
+- Larger results use a counter maintained in the dashboards cache: the
+  exact count of the same query, recomputed in the background when it is
+  older than APPROX_COUNT_SOFT_SECONDS (common/swr.py).
+- Until that counter exists, the total is estimated from a sample: the share
+  of matching rows among the latest APPROX_COUNT_SAMPLE rows of the table,
+  scaled to the table size.
+
+An exact count is always available on demand (exact=True, or the
+`exact_count=1` query parameter of the paginated lists).
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.db.models import Max, Min
+
+from common import swr
+from common.caching import get_cache
+
+EXACT_PARAM = 'exact_count'
+
+cache = get_cache('counts', alias='dashboards')
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class Count:
+    """A row count that knows whether it is exact; approximate counts render as '~N'"""
+
+    def __init__(self, value, exact=True):
+        self.value = value
+        self.exact = exact
+
+    def __int__(self):
+        return self.value
+
+    def __str__(self):
+        return str(self.value) if self.exact else f'~{self.value}'
+
+
+def _key(queryset):
+    sql, params = queryset.order_by().query.sql_with_params()
+    return hashlib.sha256(f'{sql}|{params!r}'.encode()).hexdigest()[:32]
+
+
+def estimate(queryset):
+    """Sampled estimate of a queryset's size, from the latest rows of its table"""
+    table = queryset.model._default_manager.order_by()
+    bounds = table.aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['high'] is None:
+        return 0
+    window_start = bounds['high'] - _setting('APPROX_COUNT_SAMPLE', 10000) + 1
+    if window_start <= bounds['low']:
+        # The sample would be the whole table
+        return queryset.count()
+
+    present = table.filter(pk__gte=window_start).count()
+    matches = queryset.filter(pk__gte=window_start).count()
+    # Rows in the table, assuming the primary keys below the sample are as dense as in it
+    rows = present * (bounds['high'] - bounds['low'] + 1) / (bounds['high'] - window_start + 1)
+    return round(rows * matches / present) if present else 0
+
+
+def count(queryset, exact=False):
+    """Size of a queryset: exact if small or requested, otherwise approximate"""
+    if exact:
+        return Count(queryset.count())
+
+    threshold = _setting('APPROX_COUNT_THRESHOLD', 1000)
+    bounded = queryset.order_by()[:threshold + 1].count()
+    if bounded <= threshold:
+        return Count(bounded)
+
+    maintained = swr.get_or_schedule(
+        cache,
+        _key(queryset),
+        queryset.order_by().count,
+        soft_ttl=_setting('APPROX_COUNT_SOFT_SECONDS', 300),
+        hard_ttl=_setting('APPROX_COUNT_HARD_SECONDS', 3600)
+    )
+    if maintained is not None:
+        return Count(maintained, exact=False)
+    return Count(max(estimate(queryset), threshold + 1), exact=False)
+
+
+def request_counter(request):
+    """Count function for a paginated list: approximate unless the request asks for the exact count"""
+    exact = request.GET.get(EXACT_PARAM) == '1'
+    return lambda queryset: count(queryset, exact=exact)
@@ -0,0 +1,221 @@
+"""
+Live ETA engine - common/eta.py
+Estimates when each remaining shipment of an in-progress tour will be reached,
+from the driver's last position, the remaining ordered stops and the driver's
+historical travel speed and per-stop service time.
+
+ETAs are cached per shipment; shipment pages and the tracking API only read
+the cache. They are recomputed incrementally, one tour at a time, when a
+location ping or a shipment status change arrives.
+
+The remaining stops of a tour (its plan) and the recompute throttle are kept
+in the shared cache too, so invalidating a plan in the process that handled
+a change reaches every worker.
+"""
+
+import statistics
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Sum
+from django.utils import timezone
+
+from common.caching import get_cache
+from common.models import DeliveryTour, Driver, TourShipment
+from common.pubsub import broker, shipment_topic
+from common.trips import cumulative_haversine_km
+
+ETA_KEY = 'shipment:{}'
+TOUR_KEY = 'tour:{}'
+PROFILE_KEY = 'driver-profile:{}'
+PLAN_KEY = 'plan:{}'
+RUN_KEY = 'ran:{}'
+
+cache = get_cache('eta')
+
+# Shipments in these statuses no longer need an ETA
+CLOSED_STATUSES = ['delivered', 'failed', 'failed_delivery', 'returned']
+
+_last_run = {}  # tour_id -> monotonic time of this process's last computation (saves a cache round-trip)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def eta_payload(shipment_id, eta):
+    """JSON-serialisable form of a cached ETA, as served by the tracking API and live streams"""
+    if eta is None:
+        return {'shipment_id': shipment_id, 'eta': None}
+    return {
+        'shipment_id': shipment_id,
+        'eta': eta['eta'].isoformat(),
+        'stops_before': eta['stops_before'],
+        'computed_at': eta['computed_at'].isoformat(),
+    }
+
+
+def _publish(shipment_id, eta):
+    topic = shipment_topic(shipment_id)
+    if broker.has_subscribers(topic):
+        broker.publish(topic, 'eta', eta_payload(shipment_id, eta))
+
+
+def get_eta(shipment_id):
+    """Cached ETA of a shipment: dict with eta, stops_before, tour_id, computed_at (or None)"""
+    return cache.get(ETA_KEY.format(shipment_id))
+
+
+def driver_profile(driver_id):
+    """Historical average speed (km/h) and median stop service time (seconds) of a driver"""
+    key = PROFILE_KEY.format(driver_id)
+    profile = cache.get(key)
+    if profile is not None:
+        return profile
+
+    speed = _setting('ETA_DEFAULT_SPEED_KMH', 30)
+    totals = DeliveryTour.objects.filter(
+        driver_id=driver_id,
+        status='completed',
+        duration_hours__gt=0
+    ).aggregate(distance=Sum('distance_km'), hours=Sum('duration_hours'))
+    if totals['distance'] and totals['hours']:
+        speed = float(totals['distance'] / totals['hours'])
+
+    stops = TourShipment.objects.filter(
+        tour__driver_id=driver_id,
+        arrived_at__isnull=False,
+        departed_at__isnull=False
+    ).order_by('-departed_at').values_list('arrived_at', 'departed_at')[:200]
+    durations = [(departed - arrived).total_seconds() for arrived, departed in stops if departed > arrived]
+    service = statistics.median(durations) if durations else _setting('ETA_DEFAULT_SERVICE_MINUTES', 5) * 60
+
+    profile = {'speed_kmh': max(speed, 1.0), 'service_seconds': service}
+    cache.set(key, profile, _setting('ETA_PROFILE_CACHE_SECONDS', 3600))
+    return profile
+
+
+def _get_plan(tour_id):
+    """Remaining stops of a tour, in delivery order"""
+    key = PLAN_KEY.format(tour_id)
+    plan = cache.get(key)
+    if plan is None:
+        plan = list(TourShipment.objects.filter(
+            tour_id=tour_id,
+            departed_at__isnull=True
+        ).exclude(
+            shipment__status__in=CLOSED_STATUSES
+        ).order_by('sequence').values('shipment_id', 'latitude', 'longitude', 'arrived_at'))
+        cache.set(key, plan, _setting('ETA_CACHE_SECONDS', 900))
+    return plan
+
+
+def compute_tour_etas(tour_id, driver_id, latitude=None, longitude=None, now=None):
+    """Recompute and cache the ETAs of every remaining stop of a tour"""
+    now = now or timezone.now()
+    if latitude is None or longitude is None:
+        latitude, longitude = Driver.objects.filter(pk=driver_id).values_list(
+            'current_latitude', 'current_longitude'
+        ).first() or (None, None)
+    plan = [stop for stop in _get_plan(tour_id) if stop['latitude'] is not None and stop['longitude'] is not None]
+
+    etas = {}
+    if latitude is not None and longitude is not None and plan:
+        profile = driver_profile(driver_id)
+        cumulative_km = cumulative_haversine_km(
+            [float(latitude)] + [float(stop['latitude']) for stop in plan],
+            [float(longitude)] + [float(stop['longitude']) for stop in plan],
+        )[1:]
+        travel_seconds = cumulative_km * _setting('ETA_ROAD_FACTOR', 1.3) / profile['speed_kmh'] * 3600
+
+        service_before = 0.0
+        for index, stop in enumerate(plan):
+            etas[stop['shipment_id']] = {
+                'eta': now + timedelta(seconds=float(travel_seconds[index]) + service_before),
+                'stops_before': index,
+                'tour_id': tour_id,
+                'computed_at': now,
+            }
+            service = profile['service_seconds']
+            if stop['arrived_at'] is not None:
+                # The driver is at this stop already: only the remaining service time counts
+                service = max(0.0, service - (now - stop['arrived_at']).total_seconds())
+            service_before += service
+
+    previous = cache.get(TOUR_KEY.format(tour_id)) or []
+    stale = [shipment_id for shipment_id in previous if shipment_id not in etas]
+    if stale:
+        cache.delete_many([ETA_KEY.format(shipment_id) for shipment_id in stale])
+
+    timeout = _setting('ETA_CACHE_SECONDS', 900)
+    cache.set_many({ETA_KEY.format(shipment_id): eta for shipment_id, eta in etas.items()}, timeout)
+    cache.set(TOUR_KEY.format(tour_id), list(etas), timeout)
+    _last_run[tour_id] = time.monotonic()
+
+    for shipment_id in stale:
+        _publish(shipment_id, None)
+    for shipment_id, eta in etas.items():
+        _publish(shipment_id, eta)
+    return etas
+
+
+def _recently_run(tour_id):
+    # This process computed the tour within the throttle delay: no need to ask the cache
+    last = _last_run.get(tour_id)
+    return last is not None and time.monotonic() - last < _setting('ETA_MIN_RECOMPUTE_SECONDS', 30)
+
+
+def _claim_run(tour_id):
+    # Shared throttle: the first process to add the key recomputes, the others skip
+    return cache.add(RUN_KEY.format(tour_id), True, _setting('ETA_MIN_RECOMPUTE_SECONDS', 30))
+
+
+def _recompute_due(tour_id, force):
+    if tour_id is None:
+        return False
+    if force:
+        return True
+    return not _recently_run(tour_id) and _claim_run(tour_id)
+
+
+def on_location_ping(driver_id, tour_id, latitude, longitude, now=None, force=False):
+    """Recompute a tour's ETAs from a new driver position (throttled per tour)"""
+    if not _recompute_due(tour_id, force):
+        return None
+    return compute_tour_etas(tour_id, driver_id, latitude, longitude, now)
+
+
+async def aon_location_ping(driver_id, tour_id, latitude, longitude, now=None, force=False):
+    """Async variant of on_location_ping(); returns immediately while this process's throttle runs"""
+    if tour_id is None or (not force and _recently_run(tour_id)):
+        return None
+    return await sync_to_async(on_location_ping)(driver_id, tour_id, latitude, longitude, now, force)
+
+
+def invalidate_plan(tour_id):
+    """Reload the remaining stops of a tour on its next computation (in every process)"""
+    cache.delete(PLAN_KEY.format(tour_id))
+
+
+def invalidate_tour(tour_id):
+    """Drop the stop plan and cached ETAs of a tour (tour started, completed or changed)"""
+    _last_run.pop(tour_id, None)
+    shipment_ids = cache.get(TOUR_KEY.format(tour_id)) or []
+    cache.delete_many([ETA_KEY.format(shipment_id) for shipment_id in shipment_ids] + [
+        TOUR_KEY.format(tour_id), PLAN_KEY.format(tour_id), RUN_KEY.format(tour_id)
+    ])
+
+
+def on_shipment_status_change(shipment_id):
+    """Refresh the ETAs of the in-progress tour carrying a shipment after its status changed"""
+    cache.delete(ETA_KEY.format(shipment_id))
+    tour = DeliveryTour.objects.filter(
+        tour_shipments__shipment_id=shipment_id,
+        status='in_progress'
+    ).values('id', 'driver_id').first()
+    if tour is None:
+        return None
+    invalidate_plan(tour['id'])
+    return compute_tour_etas(tour['id'], tour['driver_id'])
@@ -0,0 +1,272 @@
+"""
+Geofence arrival detection - common/geofence.py
+Tests each driver location ping against the stops of the driver's current tour
+and emits arrival/departure TrackingEvents automatically.
+
+Stops are compiled into numpy arrays once per tour and process, under the
+tour's version stamp held in the shared cache. Changing the stops, and every
+confirmed arrival or departure, bumps the stamp so that each process
+recompiles the tour on its next ping. Only the small debounce state (the
+running streak of each stop) is kept in the shared cache, so the pings of
+one driver can reach any worker process: a ping costs one cache read, one
+vectorised distance check and no database query unless an arrival or
+departure is confirmed. The state is only written while a streak changes and
+expires after GEOFENCE_STATE_SECONDS.
+
+Stops without coordinates of their own are not geofenced.
+
+Concurrent pings of one tour handled by two workers may lose one streak
+increment (the later write wins), which delays an arrival by a ping; the
+conditional updates in _emit_events() keep each event at-most-once.
+"""
+
+import time
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+from common.caching import get_cache
+from common.models import DeliveryTour, TourShipment, TrackingEvent
+
+EARTH_RADIUS_M = 6371008.8
+
+ARRIVED_STATUS = 'arrived_at_stop'
+DEPARTED_STATUS = 'departed_from_stop'
+
+DRIVER_KEY = 'driver:{}'  # -> {'tour_id': in-progress tour or None}
+VERSION_KEY = 'version:{}'  # -> stamp of the tour's stops
+STATE_KEY = 'state:{}'  # -> {'version', 'enter': {stop_id: pings}, 'exit': {stop_id: pings}}
+
+cache = get_cache('geofence')
+
+_compiled = {}  # tour_id -> TourGeofence compiled by this process
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class TourGeofence:
+    """Stops of one in-progress tour compiled for vectorised point-in-radius checks"""
+
+    def __init__(self, tour_id, stops, version=None):
+        self.tour_id = tour_id
+        self.version = version
+        self.stop_ids = np.array([stop['id'] for stop in stops], dtype=np.int64)
+        self.shipment_ids = np.array([stop['shipment_id'] for stop in stops], dtype=np.int64)
+        self.lat = np.radians(np.array([float(stop['latitude']) for stop in stops]))
+        self.lon = np.radians(np.array([float(stop['longitude']) for stop in stops]))
+        self.cos_lat = np.cos(self.lat)
+
+        radius = np.array([stop['geofence_radius'] for stop in stops], dtype=float)
+        exit_radius = radius * _setting('GEOFENCE_EXIT_FACTOR', 1.25)
+        self.enter_r2 = radius ** 2
+        self.exit_r2 = exit_radius ** 2
+
+        self.inside = np.array([stop['arrived_at'] is not None for stop in stops], dtype=bool)
+        self.enter_streak = np.zeros(len(stops), dtype=np.int32)
+        self.exit_streak = np.zeros(len(stops), dtype=np.int32)
+
+    @classmethod
+    def load(cls, tour_id, version=None):
+        stops = TourShipment.objects.filter(
+            tour_id=tour_id,
+            latitude__isnull=False,
+            longitude__isnull=False,
+            departed_at__isnull=True
+        ).order_by('sequence').values(
+            'id', 'shipment_id', 'latitude', 'longitude', 'geofence_radius', 'arrived_at'
+        )
+        return cls(tour_id, list(stops), version)
+
+    def squared_distances(self, latitude, longitude):
+        """Squared distance (m²) from a point to every stop (equirectangular approximation)"""
+        lat = np.radians(latitude)
+        lon = np.radians(longitude)
+        x = (lon - self.lon) * (self.cos_lat + np.cos(lat)) / 2
+        y = lat - self.lat
+        return (x * x + y * y) * EARTH_RADIUS_M ** 2
+
+    def streaks(self):
+        """Running enter and exit streaks, {stop_id: pings} (stops at zero left out)"""
+        return tuple(
+            {stop_id: pings for stop_id, pings in zip(self.stop_ids.tolist(), streak.tolist()) if pings}
+            for streak in (self.enter_streak, self.exit_streak)
+        )
+
+    def restore(self, entering, leaving):
+        """Set the streaks saved by streaks(), possibly in another process"""
+        stop_ids = self.stop_ids.tolist()
+        self.enter_streak = np.array([entering.get(stop_id, 0) for stop_id in stop_ids], dtype=np.int32)
+        self.exit_streak = np.array([leaving.get(stop_id, 0) for stop_id in stop_ids], dtype=np.int32)
+
+    def update(self, latitude, longitude):
+        """
+        Feed one ping through the debouncer.
+        Returns the (stop_id, shipment_id) pairs that arrived and departed.
+        """
+        if not len(self.stop_ids):
+            return [], []
+
+        enter_pings = _setting('GEOFENCE_ENTER_PINGS', 2)
+        exit_pings = _setting('GEOFENCE_EXIT_PINGS', 2)
+
+        d2 = self.squared_distances(latitude, longitude)
+
+        # Consecutive pings inside the radius (entering) or beyond the
+        # exit radius (leaving); the gap between both radii is hysteresis
+        self.enter_streak = np.where(~self.inside & (d2 <= self.enter_r2), self.enter_streak + 1, 0)
+        self.exit_streak = np.where(self.inside & (d2 > self.exit_r2), self.exit_streak + 1, 0)
+
+        arrivals = np.flatnonzero(self.enter_streak >= enter_pings)
+        departures = np.flatnonzero(self.exit_streak >= exit_pings)
+
+        self.inside[arrivals] = True
+        self.inside[departures] = False
+        self.enter_streak[arrivals] = 0
+        self.exit_streak[departures] = 0
+
+        arrived = list(zip(self.stop_ids[arrivals].tolist(), self.shipment_ids[arrivals].tolist()))
+        departed = list(zip(self.stop_ids[departures].tolist(), self.shipment_ids[departures].tolist()))
+
+        if departed:
+            # A departed stop is done for this tour
+            keep = np.ones(len(self.stop_ids), dtype=bool)
+            keep[departures] = False
+            self._compress(keep)
+
+        return arrived, departed
+
+    def _compress(self, keep):
+        for name in ('stop_ids', 'shipment_ids', 'lat', 'lon', 'cos_lat', 'enter_r2', 'exit_r2',
+                     'inside', 'enter_streak', 'exit_streak'):
+            setattr(self, name, getattr(self, name)[keep])
+
+
+def active_tour_id(driver_id):
+    """In-progress tour of a driver, cached for a few seconds"""
+    key = DRIVER_KEY.format(driver_id)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached['tour_id']
+
+    tour_id = DeliveryTour.objects.filter(
+        driver_id=driver_id,
+        status='in_progress'
+    ).values_list('id', flat=True).first()
+    cache.set(key, {'tour_id': tour_id}, _setting('GEOFENCE_TOUR_CACHE_SECONDS', 30))
+    return tour_id
+
+
+async def aactive_tour_id(driver_id):
+    """Async variant of active_tour_id() for the ASGI driver endpoints"""
+    return await sync_to_async(active_tour_id)(driver_id)
+
+
+def _bump(tour_id):
+    key = VERSION_KEY.format(tour_id)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = time.time_ns()
+        cache.set(key, version, _setting('GEOFENCE_STATE_SECONDS', 3600))
+        return version
+
+
+def get_geofence(tour_id, version):
+    """Stops of a tour compiled by this process for the given version stamp"""
+    geofence = _compiled.get(tour_id)
+    if geofence is None or geofence.version != version:
+        geofence = TourGeofence.load(tour_id, version)
+        _compiled.pop(tour_id, None)
+        _compiled[tour_id] = geofence
+        # Tours finished or handled elsewhere: keep the most recently compiled ones
+        while len(_compiled) > _setting('GEOFENCE_MAX_TOURS', 1000):
+            del _compiled[next(iter(_compiled))]
+    return geofence
+
+
+def invalidate_tour(tour_id):
+    """Recompile a tour's stops on its next ping, in every process (stops added, removed or moved)"""
+    _compiled.pop(tour_id, None)
+    _bump(tour_id)
+
+
+def invalidate_driver(driver_id, tour_id=None):
+    """Forget the cached tour and stops of a driver (call when a tour starts or ends)"""
+    key = DRIVER_KEY.format(driver_id)
+    cached = cache.get(key)
+    cache.delete(key)
+    for stale in {tour_id, cached and cached['tour_id']} - {None}:
+        invalidate_tour(stale)
+
+
+def _emit_events(arrivals, departures, latitude, longitude, timestamp):
+    location = f"{latitude:.6f}, {longitude:.6f}"
+    emitted = []
+    for stop_id, shipment_id in arrivals:
+        # The conditional update keeps the event at-most-once across worker processes
+        if TourShipment.objects.filter(pk=stop_id, arrived_at__isnull=True).update(arrived_at=timestamp):
+            TrackingEvent.objects.create(
+                shipment_id=shipment_id,
+                status=ARRIVED_STATUS,
+                location=location,
+                notes='Driver arrived at delivery stop (automatic geofence detection)'
+            )
+            emitted.append((shipment_id, ARRIVED_STATUS))
+    for stop_id, shipment_id in departures:
+        if TourShipment.objects.filter(
+            pk=stop_id, arrived_at__isnull=False, departed_at__isnull=True
+        ).update(departed_at=timestamp):
+            TrackingEvent.objects.create(
+                shipment_id=shipment_id,
+                status=DEPARTED_STATUS,
+                location=location,
+                notes='Driver left delivery stop (automatic geofence detection)'
+            )
+            emitted.append((shipment_id, DEPARTED_STATUS))
+    return emitted
+
+
+def process_ping(driver_id, latitude, longitude, timestamp, tour_id=None):
+    """
+    Check a location ping against the geofences of the driver's current tour.
+    Returns the list of (shipment_id, status) tracking events emitted.
+    """
+    if tour_id is None:
+        tour_id = active_tour_id(driver_id)
+    if tour_id is None:
+        return []
+
+    version_key, state_key = VERSION_KEY.format(tour_id), STATE_KEY.format(tour_id)
+    cached = cache.get_many([version_key, state_key])
+    version = cached.get(version_key)
+    if version is None:
+        version = _bump(tour_id)
+    state = cached.get(state_key)
+    if state is None or state['version'] != version:
+        state = {'version': version, 'enter': {}, 'exit': {}}
+
+    geofence = get_geofence(tour_id, version)
+    geofence.restore(state['enter'], state['exit'])
+    arrivals, departures = geofence.update(latitude, longitude)
+    entering, leaving = geofence.streaks()
+    if (entering, leaving) != (state['enter'], state['exit']):
+        cache.set(
+            state_key, {'version': version, 'enter': entering, 'exit': leaving},
+            _setting('GEOFENCE_STATE_SECONDS', 3600)
+        )
+    if not arrivals and not departures:
+        return []
+
+    emitted = _emit_events(arrivals, departures, latitude, longitude, timestamp)
+    # The stops' arrived_at/departed_at changed: every process recompiles them once committed
+    transaction.on_commit(lambda: invalidate_tour(tour_id))
+    return emitted
+
+
+async def aprocess_ping(driver_id, latitude, longitude, timestamp, tour_id=None):
+    """Async variant of process_ping() (the shared cache is read off the event loop)"""
+    return await sync_to_async(process_ping)(driver_id, latitude, longitude, timestamp, tour_id)
@@ -0,0 +1,54 @@
+"""
+Hot queries - common/hot_queries.py
+Registry of the query shapes the portals run most, replayed by
+`python manage.py index_advisor` to check that each one uses an index.
+
+A hot query is registered with @hot_query(name): a function returning the
+queryset, built with placeholder values (plans do not depend on them).
+"""
+
+from common.models import Claim, DeliveryTour, Incident, Invoice, Shipment, TrackingEvent
+
+HOT_QUERIES = {}  # name -> function returning a queryset
+
+
+def hot_query(name):
+    def register(build):
+        HOT_QUERIES[name] = build
+        return build
+    return register
+
+
+@hot_query('client shipments (client portal, CL-02)')
+def client_shipments():
+    return Shipment.objects.filter(client_id=1).order_by('-created_at')[:10]
+
+
+@hot_query('shipments by status (agent and manager lists)')
+def shipments_by_status():
+    return Shipment.objects.filter(status='in_transit').order_by('-created_at')[:20]
+
+
+@hot_query('tracking history of a shipment')
+def tracking_history():
+    return TrackingEvent.objects.filter(shipment_id=1).order_by('-timestamp')
+
+
+@hot_query('unpaid invoices of a client (client dashboard)')
+def client_unpaid_invoices():
+    return Invoice.objects.filter(client_id=1, status__in=['issued', 'partially_paid', 'overdue'])
+
+
+@hot_query('open incidents (dashboards)')
+def open_incidents():
+    return Incident.objects.filter(status__in=['reported', 'investigating']).order_by('-reported_date')[:5]
+
+
+@hot_query('claims of a client (client portal, CL-06)')
+def client_claims():
+    return Claim.objects.filter(client_id=1).order_by('-filed_date')
+
+
+@hot_query('active tours of a driver (driver portal, DR-01)')
+def driver_active_tours():
+    return DeliveryTour.objects.filter(driver_id=1, status__in=['planned', 'in_progress']).order_by('date')
@@ -0,0 +1,214 @@
+"""
+Client ledger - common/ledger.py
+Append-only account of each client: invoices are debits, payments credits,
+and every entry carries the client's running balance.
+
+- A client's balance is the balance of their latest entry, one lookup on the
+  (client, sequence) index instead of a sum over invoices and payments.
+- Entries are never changed or deleted. Saving an invoice (payments save
+  their invoice) posts the difference between what the ledger holds for the
+  invoice and its payments and their current amounts: the first posting is
+  the invoice's debit or the payment's credit, later changes (amount
+  corrections, cancellation) are adjustments. Deleting an invoice or a
+  payment posts its reversal, without a link to the row being deleted (a
+  payment's reversal links its invoice, which payments protect).
+- Entries keep a client from being deleted (PROTECT): its account history
+  stays.
+- A statement is a range scan of the client's entries between two dates,
+  opening on the balance of the last entry before the period.
+
+Postings lock the client row (SELECT ... FOR UPDATE) so that each entry
+follows the latest one; the (client, sequence) unique constraint rejects an
+entry that would fork the sequence anyway.
+"""
+
+from collections import namedtuple
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from common.client_stats import UNBILLED_INVOICE_STATUSES
+from common.models import Client, LedgerEntry
+
+ZERO = Decimal('0.00')
+CENT = Decimal('0.01')
+
+Statement = namedtuple('Statement', [
+    'client', 'start', 'end', 'opening_balance', 'entries', 'total_debit', 'total_credit', 'closing_balance'
+])
+
+
+def _cents(amount):
+    return Decimal(str(amount or 0)).quantize(CENT)
+
+
+def _latest(client_id):
+    return LedgerEntry.objects.filter(client_id=client_id).order_by('-sequence').only('sequence', 'balance').first()
+
+
+def balance(client_id):
+    """Current balance of a client (DA, positive when the client owes)"""
+    latest = _latest(client_id)
+    return latest.balance if latest else ZERO
+
+
+def with_balance(queryset):
+    """Client queryset annotated with each client's balance (client.balance reads it)"""
+    latest = LedgerEntry.objects.filter(client_id=OuterRef('pk')).order_by('-sequence').values('balance')[:1]
+    return queryset.annotate(
+        balance=Coalesce(Subquery(latest), Value(ZERO), output_field=DecimalField(max_digits=14, decimal_places=2))
+    )
+
+
+def _lock(client_id):
+    # Serializes the postings of one client
+    list(Client.objects.select_for_update().filter(pk=client_id).values_list('pk', flat=True))
+
+
+def _append(client_id, entry_type, amount, description, **fields):
+    """Add an entry after the client's latest one: positive amounts are debits, negative ones credits"""
+    latest = _latest(client_id)
+    amount = _cents(amount)
+    return LedgerEntry.objects.create(
+        client_id=client_id,
+        sequence=latest.sequence + 1 if latest else 1,
+        entry_type=entry_type,
+        debit=max(amount, ZERO),
+        credit=max(-amount, ZERO),
+        balance=(latest.balance if latest else ZERO) + amount,
+        description=description,
+        **fields
+    )
+
+
+def adjust(client, amount, description, user=None):
+    """Post a manual adjustment: positive amounts are charged to the client, negative ones credited"""
+    with transaction.atomic():
+        _lock(client.pk)
+        return _append(client.pk, 'adjustment', amount, description, created_by=user)
+
+
+def _posted(**filters):
+    """Net amount (debits - credits) and number of the entries matching `filters`"""
+    values = LedgerEntry.objects.filter(**filters).order_by().aggregate(
+        net=Sum(F('debit') - F('credit')), entries=Count('pk')
+    )
+    return _cents(values['net']), values['entries']
+
+
+def invoice_saved(invoice):
+    """Post what changed in an invoice and its payments since the ledger last recorded them"""
+    with transaction.atomic():
+        _lock(invoice.client_id)
+
+        billed = _cents(invoice.amount_ttc) if invoice.status not in UNBILLED_INVOICE_STATUSES else ZERO
+        posted, entries = _posted(invoice=invoice, payment__isnull=True)
+        if billed != posted:
+            if not entries:
+                entry_type, description = 'invoice', f"Invoice {invoice.invoice_number}"
+            elif invoice.status == 'cancelled':
+                entry_type, description = 'adjustment', f"Invoice {invoice.invoice_number} cancelled"
+            else:
+                entry_type, description = 'adjustment', f"Invoice {invoice.invoice_number} amended"
+            _append(invoice.client_id, entry_type, billed - posted, description,
+                    invoice=invoice, created_by_id=invoice.created_by_id)
+
+        postings = {
+            row['payment']: (_cents(row['net']), row['entries'])
+            for row in LedgerEntry.objects.filter(invoice=invoice, payment__isnull=False).order_by().values(
+                'payment'
+            ).annotate(net=Sum(F('debit') - F('credit')), entries=Count('pk'))
+        }
+        for payment in invoice.payments.all():
+            received = -_cents(payment.amount)
+            posted, entries = postings.get(payment.pk, (ZERO, 0))
+            if received == posted:
+                continue
+            if not entries:
+                entry_type, description = 'payment', f"Payment {payment.payment_number} ({invoice.invoice_number})"
+            else:
+                entry_type, description = 'adjustment', f"Payment {payment.payment_number} amended"
+            _append(invoice.client_id, entry_type, received - posted, description,
+                    invoice=invoice, payment=payment, created_by_id=payment.created_by_id)
+
+
+def invoice_deleted(invoice):
+    """Reverse what the ledger holds for an invoice being deleted"""
+    with transaction.atomic():
+        _lock(invoice.client_id)
+        posted, entries = _posted(invoice=invoice, payment__isnull=True)
+        if posted:
+            # Runs on pre_delete: an entry created now would escape the deletion's SET_NULL
+            _append(invoice.client_id, 'adjustment', -posted, f"Invoice {invoice.invoice_number} deleted")
+
+
+def payment_deleted(payment):
+    """Reverse what the ledger holds for a payment being deleted"""
+    client_id = payment.invoice.client_id
+    with transaction.atomic():
+        _lock(client_id)
+        posted, entries = _posted(payment=payment)
+        if posted:
+            _append(client_id, 'adjustment', -posted,
+                    f"Payment {payment.payment_number} ({payment.invoice.invoice_number}) deleted",
+                    invoice=payment.invoice)
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def statement(client, start, end):
+    """The client's entries from `start` to `end` (dates, inclusive) with opening and closing balances"""
+    entries = client.ledger_entries.all()
+    opening = entries.filter(created_at__lt=_day_start(start)).order_by('-created_at', '-sequence').first()
+    opening_balance = opening.balance if opening else ZERO
+
+    period = list(entries.filter(
+        created_at__gte=_day_start(start),
+        created_at__lt=_day_start(end + timedelta(days=1))
+    ).select_related('invoice').order_by('sequence'))
+
+    return Statement(
+        client=client,
+        start=start,
+        end=end,
+        opening_balance=opening_balance,
+        entries=period,
+        total_debit=sum((entry.debit for entry in period), ZERO),
+        total_credit=sum((entry.credit for entry in period), ZERO),
+        closing_balance=period[-1].balance if period else opening_balance,
+    )
+
+
+def verify(client_id):
+    """
+    Problems in a client's ledger (list of strings): broken sequence or
+    running balance, invoices and payments whose postings differ from them
+    """
+    problems = []
+    previous_sequence, running = 0, ZERO
+    for entry in LedgerEntry.objects.filter(client_id=client_id).order_by('sequence').iterator():
+        if entry.sequence != previous_sequence + 1:
+            problems.append(f"entry #{entry.sequence} follows #{previous_sequence}")
+        running += entry.debit - entry.credit
+        if entry.balance != running:
+            problems.append(f"entry #{entry.sequence} balance {entry.balance}, entries add up to {running}")
+            running = entry.balance
+        previous_sequence = entry.sequence
+
+    invoices = Client.objects.get(pk=client_id).invoices.prefetch_related('payments')
+    for invoice in invoices:
+        billed = _cents(invoice.amount_ttc) if invoice.status not in UNBILLED_INVOICE_STATUSES else ZERO
+        posted, entries = _posted(invoice=invoice, payment__isnull=True)
+        if billed != posted:
+            problems.append(f"invoice {invoice.invoice_number} billed {billed}, posted {posted}")
+        for payment in invoice.payments.all():
+            posted, entries = _posted(payment=payment)
+            if -_cents(payment.amount) != posted:
+                problems.append(f"payment {payment.payment_number} of {payment.amount}, posted {-posted}")
+    return problems
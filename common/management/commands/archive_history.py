@@ -0,0 +1,62 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from common import archive
+
+
+class Command(BaseCommand):
+    help = ("Move the tracking events of shipments delivered long ago, and old audit log entries, "
+            "to their archive tables (common/archive.py), or restore them")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int,
+                            help="Archive what is older than this many months (default: ARCHIVE_AFTER_MONTHS)")
+        parser.add_argument('--table', action='append', choices=sorted(archive.ARCHIVES),
+                            help="Only this table; repeatable (default: all)")
+        parser.add_argument('--batch-size', type=int,
+                            help="Rows moved per transaction (default: ARCHIVE_BATCH_SIZE)")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only count the rows due for archiving")
+        parser.add_argument('--restore', action='store_true',
+                            help="Move archived rows back to the live tables")
+        parser.add_argument('--shipment', action='append', metavar='SHIPMENT_NUMBER',
+                            help="With --restore: only the tracking events of this shipment; repeatable")
+
+    def handle(self, *args, **options):
+        if options['shipment'] and not options['restore']:
+            raise CommandError("--shipment only applies to --restore")
+        names = options['table'] or list(archive.ARCHIVES)
+        if options['shipment']:
+            names = ['tracking_events']
+        cutoff = archive.cutoff(options['months'])
+
+        for name in names:
+            store = archive.ARCHIVES[name]
+            if options['restore']:
+                queryset = store.cold.objects.all()
+                if options['shipment']:
+                    queryset = queryset.filter(shipment__shipment_number__in=options['shipment'])
+                action = "restored"
+                if options['dry_run']:
+                    self.stdout.write(f"{name}: {queryset.count()} rows would be {action}")
+                    continue
+                batches = store.restore(queryset, options['batch_size'])
+            else:
+                action = "archived"
+                if options['dry_run']:
+                    self.stdout.write(f"{name}: {store.pending(cutoff)} rows would be {action}")
+                    continue
+                batches = store.archive(cutoff, options['batch_size'])
+
+            started = time.monotonic()
+            moved = 0
+            for count in batches:
+                moved += count
+                if options['verbosity'] > 1:
+                    self.stdout.write(f"  {name}: {moved} rows {action}")
+            elapsed = time.monotonic() - started
+            rate = moved / elapsed if elapsed else 0
+            self.stdout.write(self.style.SUCCESS(
+                f"{name}: {moved} rows {action} in {elapsed:.2f} s ({rate:,.0f} rows/s)"
+            ))
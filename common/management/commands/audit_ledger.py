@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from common import ledger
+from common.models import Client
+
+
+class Command(BaseCommand):
+    help = ("Check the client ledgers (common/ledger.py): entry sequence, running balances, "
+            "and the postings of every invoice and payment")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--client', action='append', metavar='CLIENT_ID',
+                            help="Only this client code (CLT...); repeatable")
+        parser.add_argument('--post-missing', action='store_true',
+                            help="Post adjustments for the invoices and payments whose postings differ")
+
+    def handle(self, *args, **options):
+        clients = Client.objects.order_by('pk')
+        if options['client']:
+            clients = clients.filter(client_id__in=options['client'])
+
+        checked = failing = 0
+        for client in clients.only('pk', 'client_id').iterator():
+            checked += 1
+            problems = ledger.verify(client.pk)
+            if not problems:
+                continue
+            failing += 1
+            for problem in problems:
+                self.stdout.write(f"{client.client_id}: {problem}")
+            if options['post_missing']:
+                # Entries are append-only: differences are posted as adjustments
+                for invoice in client.invoices.all():
+                    ledger.invoice_saved(invoice)
+
+        style = self.style.WARNING if failing else self.style.SUCCESS
+        self.stdout.write(style(f"Checked {checked} client ledgers, {failing} with problems"))
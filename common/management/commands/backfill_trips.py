@@ -0,0 +1,62 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from common.models import DeliveryTour
+from common.trips import reconstruct_tours
+
+
+def _init_worker():
+    """Give each worker process its own Django setup and database connections"""
+    django.setup()
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Reconstruct distance, duration and fuel of completed tours from GPS breadcrumbs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Number of worker processes (default: CPU count)")
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help="Tours handed to a worker at a time")
+        parser.add_argument('--all', action='store_true',
+                            help="Recompute tours that already have a distance")
+
+    def handle(self, *args, **options):
+        tours = DeliveryTour.objects.filter(status='completed')
+        if not options['all']:
+            tours = tours.filter(distance_km=0)
+        tour_ids = list(tours.order_by('id').values_list('id', flat=True))
+
+        if not tour_ids:
+            self.stdout.write("No tours to reconstruct.")
+            return
+
+        batch_size = max(1, options['batch_size'])
+        batches = [tour_ids[i:i + batch_size] for i in range(0, len(tour_ids), batch_size)]
+        workers = max(1, min(options['workers'], len(batches)))
+        self.stdout.write(f"Reconstructing {len(tour_ids)} tours in {len(batches)} batches using {workers} worker(s)...")
+
+        updated = skipped = 0
+        if workers == 1:
+            for batch in batches:
+                done, missing = reconstruct_tours(batch)
+                updated += done
+                skipped += missing
+        else:
+            # Forked workers must not share the parent's database connections
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+                futures = [executor.submit(reconstruct_tours, batch) for batch in batches]
+                for future in as_completed(futures):
+                    done, missing = future.result()
+                    updated += done
+                    skipped += missing
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Updated {updated} tours ({skipped} skipped: not enough GPS breadcrumbs)."
+        ))
@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+
+from common import caching
+
+
+class Command(BaseCommand):
+    help = "Show the hit ratio, latency and evictions of the named caches (common/caching.py)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help="Clear the statistics after showing them")
+
+    def handle(self, *args, **options):
+        if getattr(settings, 'CACHE_BACKEND', 'locmem') == 'locmem':
+            self.stdout.write(self.style.WARNING(
+                "CACHE_BACKEND is locmem: only this command's own process is visible."
+            ))
+
+        totals = caching.stats()
+        evictions = {alias: counts.get('evictions', 0)
+                     for (alias, namespace), counts in totals.items() if namespace == caching.EVICTIONS}
+
+        self.stdout.write(f"{'cache':<28}{'gets':>10}{'hit %':>8}{'writes':>10}{'deletes':>10}{'avg µs':>9}")
+        for (alias, namespace), counts in sorted(totals.items()):
+            if namespace == caching.EVICTIONS:
+                continue
+            gets = counts['gets']
+            hit_ratio = f"{100 * counts['hits'] / gets:.1f}" if gets else '-'
+            operations = counts['operations']
+            latency = f"{counts['time_ns'] / operations / 1000:.0f}" if operations else '-'
+            self.stdout.write(
+                f"{alias + '/' + namespace:<28}{gets:>10}{hit_ratio:>8}"
+                f"{counts['writes']:>10}{counts['deletes']:>10}{latency:>9}"
+            )
+
+        self.stdout.write('')
+        for alias in settings.CACHES:
+            backend = caches[alias]
+            if type(backend).__name__ == 'RedisCache':
+                # Redis evicts by its own policy, for the whole server
+                info = backend._cache.get_client().info('stats')
+                self.stdout.write(f"{alias}: {info.get('evicted_keys', 0)} evictions (Redis server)")
+            else:
+                self.stdout.write(f"{alias}: {evictions.get(alias, 0)} evictions")
+
+        if options['reset']:
+            caching.reset_stats()
+            self.stdout.write(self.style.SUCCESS("Statistics cleared"))
@@ -0,0 +1,43 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from common.hot_queries import HOT_QUERIES
+
+# Plan lines reading a whole table (SQLite "SCAN <table>" without an index,
+# PostgreSQL "Seq Scan") or sorting rows an index could have ordered
+FULL_SCAN = re.compile(r'\bSCAN (?!.*\bUSING\b.*\bINDEX\b)|Seq Scan')
+TEMP_SORT = re.compile(r'USE TEMP B-TREE|\bSort\b')
+
+
+class Command(BaseCommand):
+    help = "Replay the registered hot queries (common/hot_queries.py) under EXPLAIN and flag full table scans"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--strict', action='store_true',
+                            help="Exit with an error if any hot query scans a whole table")
+        parser.add_argument('--verbose-plans', action='store_true',
+                            help="Print the full plan of every query")
+
+    def handle(self, *args, **options):
+        scans = []
+        for name, build in HOT_QUERIES.items():
+            plan = build().explain()
+            lines = [line.strip() for line in plan.splitlines() if line.strip()]
+            full_scans = [line for line in lines if FULL_SCAN.search(line)]
+            sorts = [line for line in lines if TEMP_SORT.search(line)]
+
+            if full_scans:
+                scans.append(name)
+                self.stdout.write(self.style.ERROR(f"FULL SCAN  {name}"))
+            elif sorts:
+                self.stdout.write(self.style.WARNING(f"SORT       {name}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"ok         {name}"))
+            for line in (lines if options['verbose_plans'] else full_scans + sorts):
+                self.stdout.write(f"           {line}")
+
+        self.stdout.write(f"\n{len(HOT_QUERIES)} hot queries on {connection.vendor}, {len(scans)} with full scans")
+        if scans and options['strict']:
+            raise CommandError(f"Full table scans in: {', '.join(scans)}")
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from common import search
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the full-text search index of clients, shipments and claims (common/search.py). "
+        "Run it after any migration that rebuilds one of those tables on SQLite (e.g. AlterField): "
+        "the rebuild drops the index triggers, which this command recreates."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--optimize', action='store_true',
+                            help="Also merge the index segments (faster searches after many writes)")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            self.stdout.write(self.style.WARNING(
+                f"No search index on {connection.vendor}: searches use icontains lookups."
+            ))
+            return
+
+        started = time.monotonic()
+        missing = search.missing_triggers()
+        if missing:
+            self.stdout.write(f"Recreating missing triggers: {', '.join(sorted(missing))}")
+        tables = search.rebuild(optimize=options['optimize'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {', '.join(tables)} in {time.monotonic() - started:.2f}s"
+        ))
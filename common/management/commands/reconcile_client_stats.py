@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from common import client_stats
+from common.models import Client
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = "Recompute the client statistics rows (common/client_stats.py) and fix the ones that drifted"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--client', action='append', metavar='CLIENT_ID',
+                            help="Only this client code (CLT...); repeatable")
+
+    def handle(self, *args, **options):
+        clients = Client.objects.order_by('pk')
+        if options['client']:
+            clients = clients.filter(client_id__in=options['client'])
+
+        checked = fixed = 0
+        batch = []
+        for client in clients.only('pk', 'client_id').iterator():
+            batch.append(client)
+            if len(batch) == BATCH_SIZE:
+                fixed += self.reconcile(batch)
+                checked += len(batch)
+                batch = []
+        if batch:
+            fixed += self.reconcile(batch)
+            checked += len(batch)
+
+        style = self.style.WARNING if fixed else self.style.SUCCESS
+        self.stdout.write(style(f"Checked {checked} clients, fixed the statistics of {fixed}"))
+
+    def reconcile(self, clients):
+        fixed = client_stats.reconcile(clients)
+        for client in fixed:
+            self.stdout.write(f"  fixed {client.client_id}")
+        return len(fixed)
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from common import tour_counters
+from common.models import DeliveryTour
+
+
+class Command(BaseCommand):
+    help = "Recompute the shipment counters of delivery tours (common/tour_counters.py) and fix the ones that drifted"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only list the tours whose counters drifted")
+        parser.add_argument('--since', metavar='YYYY-MM-DD',
+                            help="Only check tours dated from this day")
+
+    def handle(self, *args, **options):
+        tours = DeliveryTour.objects.all()
+        if options['since']:
+            tours = tours.filter(date__gte=options['since'])
+
+        if options['dry_run']:
+            drifted = list(tour_counters.drifted(tours))
+            for tour in drifted:
+                stored = ', '.join(f"{name}={getattr(tour, name)}" for name in tour_counters.COUNTERS)
+                counted = ', '.join(f"{name}={getattr(tour, f'counted_{name}')}" for name in tour_counters.COUNTERS)
+                self.stdout.write(f"{tour.tour_number}: stored {stored}; counted {counted}")
+            self.stdout.write(f"{len(drifted)} tours with drifted counters")
+            return
+
+        fixed = tour_counters.reconcile(tours)
+        style = self.style.WARNING if fixed else self.style.SUCCESS
+        self.stdout.write(style(f"Fixed the counters of {fixed} tours"))
@@ -0,0 +1,121 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from common import pricing
+from common.models import Shipment
+
+
+def _update_amounts(amounts, now, batch_size):
+    """
+    Write new amounts with one UPDATE ... SET amount = CASE id WHEN ... END per
+    batch (QuerySet.bulk_update() builds the same statement, but its expression
+    compilation dominates the run time on large chunks).
+    """
+    opts = Shipment._meta
+    quote = connection.ops.quote_name
+    amount_field = opts.get_field('amount')
+    updated_field = opts.get_field('updated_at')
+    if connection.features.max_query_params:
+        # Two parameters per row in the CASE, one in the IN list, plus updated_at
+        batch_size = min(batch_size, (connection.features.max_query_params - 1) // 3)
+
+    with connection.cursor() as cursor:
+        for start in range(0, len(amounts), batch_size):
+            batch = amounts[start:start + batch_size]
+            params = []
+            for pk, amount in batch:
+                params += [pk, amount_field.get_db_prep_save(amount, connection)]
+            params.append(updated_field.get_db_prep_save(now, connection))
+            params += [pk for pk, amount in batch]
+            cursor.execute(
+                f"UPDATE {quote(opts.db_table)} "
+                f"SET {quote(amount_field.column)} = CASE {quote(opts.pk.column)} "
+                f"{' '.join(['WHEN %s THEN %s'] * len(batch))} ELSE {quote(amount_field.column)} END, "
+                f"{quote(updated_field.column)} = %s "
+                f"WHERE {quote(opts.pk.column)} IN ({', '.join(['%s'] * len(batch))})",
+                params
+            )
+
+
+class Command(BaseCommand):
+    help = "Reprice uninvoiced shipments with the current tariffs and write a CSV report of the price changes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help="Shipments priced and updated per transaction")
+        parser.add_argument('--update-batch-size', type=int, default=500,
+                            help="Rows per UPDATE ... CASE statement")
+        parser.add_argument('--report', default='reprice_report.csv',
+                            help="CSV file receiving one row per changed shipment")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Write the report without updating any shipment")
+
+    def handle(self, *args, **options):
+        chunk_size = max(1, options['chunk_size'])
+        dry_run = options['dry_run']
+        shipments = Shipment.objects.filter(invoiceline__isnull=True).order_by('pk').values_list(
+            'pk', 'shipment_number', 'destination_id', 'service_type_id',
+            'weight', 'volume', 'created_at', 'amount'
+        )
+
+        scanned = changed = 0
+        total_delta = 0
+        started = time.perf_counter()
+        last_pk = 0
+
+        with open(options['report'], 'w', newline='') as report:
+            writer = csv.writer(report)
+            writer.writerow(['shipment_id', 'shipment_number', 'old_amount', 'new_amount', 'delta'])
+
+            while True:
+                # Keyset pagination: each chunk starts after the last primary key seen
+                rows = list(shipments.filter(pk__gt=last_pk)[:chunk_size])
+                if not rows:
+                    break
+                last_pk = rows[-1][0]
+                scanned += len(rows)
+
+                # Each shipment keeps the tariff version in effect when it was created
+                amounts = pricing.quote_batch(
+                    [row[2] for row in rows],
+                    [row[3] for row in rows],
+                    [row[4] for row in rows],
+                    [row[5] for row in rows],
+                    at=[row[6] for row in rows]
+                )
+                updates = {}
+                for row, amount in zip(rows, amounts):
+                    if amount is not None and amount != row[7]:
+                        updates[row[0]] = (row, amount)
+
+                if updates and not dry_run:
+                    now = timezone.now()
+                    with transaction.atomic():
+                        # Skip shipments invoiced since the chunk was read
+                        still_open = set(Shipment.objects.filter(
+                            pk__in=list(updates),
+                            invoiceline__isnull=True
+                        ).values_list('pk', flat=True))
+                        updates = {pk: update for pk, update in updates.items() if pk in still_open}
+                        _update_amounts(
+                            [(pk, amount) for pk, (row, amount) in updates.items()],
+                            now,
+                            options['update_batch_size']
+                        )
+
+                for row, amount in updates.values():
+                    delta = amount - row[7]
+                    total_delta += delta
+                    writer.writerow([row[0], row[1], row[7], amount, delta])
+                changed += len(updates)
+
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        action = "would change" if dry_run else "changed"
+        self.stdout.write(self.style.SUCCESS(
+            f"Repriced {scanned} shipments ({scanned / elapsed:.0f} rows/s): {changed} {action}, "
+            f"total delta {total_delta:+} DA. Report: {options['report']}"
+        ))
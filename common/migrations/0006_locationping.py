@@ -0,0 +1,34 @@
+# Generated by Django 6.0.1 on 2026-10-18 23:54
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0005_driver_current_latitude_driver_current_longitude_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LocationPing',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('latitude', models.DecimalField(decimal_places=6, max_digits=9, validators=[django.core.validators.MinValueValidator(-90), django.core.validators.MaxValueValidator(90)], verbose_name='Latitude')),
+                ('longitude', models.DecimalField(decimal_places=6, max_digits=9, validators=[django.core.validators.MinValueValidator(-180), django.core.validators.MaxValueValidator(180)], verbose_name='Longitude')),
+                ('accuracy', models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Accuracy (meters)')),
+                ('recorded_at', models.DateTimeField(verbose_name='Recorded At')),
+                ('driver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='location_pings', to='common.driver', verbose_name='Driver')),
+                ('tour', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='location_pings', to='common.deliverytour', verbose_name='Tour')),
+            ],
+            options={
+                'verbose_name': 'Location Ping',
+                'verbose_name_plural': 'Location Pings',
+                'db_table': 'location_pings',
+                'ordering': ['recorded_at'],
+                'indexes': [models.Index(fields=['tour', 'recorded_at'], name='location_ping_tour_idx')],
+            },
+        ),
+    ]
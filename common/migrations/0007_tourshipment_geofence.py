@@ -0,0 +1,39 @@
+# Generated by Django 6.0.1 on 2026-10-18 23:55
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0006_locationping'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tourshipment',
+            name='arrived_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Arrived At'),
+        ),
+        migrations.AddField(
+            model_name='tourshipment',
+            name='departed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Departed At'),
+        ),
+        migrations.AddField(
+            model_name='tourshipment',
+            name='geofence_radius',
+            field=models.PositiveIntegerField(default=150, verbose_name='Geofence Radius (meters)'),
+        ),
+        migrations.AddField(
+            model_name='tourshipment',
+            name='latitude',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True, validators=[django.core.validators.MinValueValidator(-90), django.core.validators.MaxValueValidator(90)], verbose_name='Stop Latitude'),
+        ),
+        migrations.AddField(
+            model_name='tourshipment',
+            name='longitude',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True, validators=[django.core.validators.MinValueValidator(-180), django.core.validators.MaxValueValidator(180)], verbose_name='Stop Longitude'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 6.0.1 on 2026-10-19 00:02
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0007_tourshipment_geofence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TariffVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Name')),
+                ('effective_from', models.DateTimeField(verbose_name='Effective From')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Active')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('notes', models.TextField(blank=True, verbose_name='Notes')),
+            ],
+            options={
+                'verbose_name': 'Tariff Version',
+                'verbose_name_plural': 'Tariff Versions',
+                'db_table': 'tariff_versions',
+                'ordering': ['-effective_from'],
+            },
+        ),
+        migrations.CreateModel(
+            name='TariffRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('zone', models.CharField(choices=[('local', 'Local'), ('national', 'National'), ('international', 'International')], max_length=20, verbose_name='Zone')),
+                ('min_weight', models.DecimalField(decimal_places=2, default=0, max_digits=8, validators=[django.core.validators.MinValueValidator(0)], verbose_name='From Weight (kg)')),
+                ('min_volume', models.DecimalField(decimal_places=3, default=0, max_digits=8, validators=[django.core.validators.MinValueValidator(0)], verbose_name='From Volume (m³)')),
+                ('base_amount', models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Base Amount (DA)')),
+                ('weight_tariff', models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Weight Tariff (DA/kg)')),
+                ('volume_tariff', models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Volume Tariff (DA/m³)')),
+                ('service_type', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='tariff_rates', to='common.servicetype', verbose_name='Service Type')),
+                ('version', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rates', to='common.tariffversion', verbose_name='Tariff Version')),
+            ],
+            options={
+                'verbose_name': 'Tariff Rate',
+                'verbose_name_plural': 'Tariff Rates',
+                'db_table': 'tariff_rates',
+                'ordering': ['version', 'zone', 'service_type', 'min_weight', 'min_volume'],
+                'unique_together': {('version', 'zone', 'service_type', 'min_weight', 'min_volume')},
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 6.0.1 on 2026-10-19 00:24
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0009_invoice_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='claim',
+            index=models.Index(fields=['client', '-filed_date'], name='claim_client_filed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deliverytour',
+            index=models.Index(fields=['driver', 'status', '-date'], name='tour_driver_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='incident',
+            index=models.Index(fields=['status', '-reported_date'], name='incident_status_reported_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['client', 'status'], name='invoice_client_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shipment',
+            index=models.Index(fields=['client', '-created_at'], name='shipment_client_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shipment',
+            index=models.Index(fields=['status', '-created_at'], name='shipment_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trackingevent',
+            index=models.Index(fields=['shipment', '-timestamp'], name='tracking_event_shipment_idx'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Full-text search index (common/search.py): FTS5 tables kept in sync by triggers
+
+from django.db import migrations
+
+# table -> (content table, indexed columns); columns are copied from the content
+# table, so the index stores only the tokens (external content tables)
+SEARCH_TABLES = {
+    'search_clients': ('clients', ['client_id', 'name', 'email', 'phone', 'city']),
+    'search_shipments': ('shipments', [
+        'shipment_number', 'recipient_name', 'sender_name',
+        'recipient_address', 'sender_address', 'description',
+    ]),
+    'search_claims': ('claims', ['claim_number', 'subject', 'description']),
+}
+
+
+def _create_sql(table, content, columns):
+    cols = ', '.join(columns)
+    new = ', '.join(f'new.{column}' for column in columns)
+    old = ', '.join(f'old.{column}' for column in columns)
+    insert = f"INSERT INTO {table}(rowid, {cols}) VALUES (new.id, {new});"
+    delete = f"INSERT INTO {table}({table}, rowid, {cols}) VALUES ('delete', old.id, {old});"
+    return [
+        f"CREATE VIRTUAL TABLE {table} USING fts5({cols}, content='{content}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2', prefix='2 3 4')",
+        f"CREATE TRIGGER {table}_ai AFTER INSERT ON {content} BEGIN {insert} END",
+        f"CREATE TRIGGER {table}_ad AFTER DELETE ON {content} BEGIN {delete} END",
+        f"CREATE TRIGGER {table}_au AFTER UPDATE OF {cols} ON {content} BEGIN {delete} {insert} END",
+        f"INSERT INTO {table}({table}) VALUES ('rebuild')",
+    ]
+
+
+def create_search_index(apps, schema_editor):
+    # FTS5 is SQLite only; other databases fall back to icontains (common/search.py)
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table, (content, columns) in SEARCH_TABLES.items():
+        for sql in _create_sql(table, content, columns):
+            schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table, (content, columns) in SEARCH_TABLES.items():
+        for trigger in ('ai', 'ad', 'au'):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {table}_{trigger}")
+        schema_editor.execute(f"DROP TABLE IF EXISTS {table}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0010_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
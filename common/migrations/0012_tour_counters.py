@@ -0,0 +1,60 @@
+# Generated by Django 6.0.1 on 2026-10-19 00:53
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def count_existing_tours(apps, schema_editor):
+    # Same counting as common/tour_counters.py, on the historical models
+    DeliveryTour = apps.get_model('common', 'DeliveryTour')
+    totals = DeliveryTour.objects.annotate(
+        shipments=Count('tour_shipments'),
+        delivered=Count('tour_shipments', filter=Q(tour_shipments__shipment__status='delivered')),
+        failed=Count('tour_shipments', filter=Q(tour_shipments__shipment__status__in=['failed', 'failed_delivery'])),
+        weight=Sum('tour_shipments__shipment__weight'),
+        volume=Sum('tour_shipments__shipment__volume'),
+    ).filter(shipments__gt=0)
+    for tour in totals.iterator():
+        DeliveryTour.objects.filter(pk=tour.pk).update(
+            total_shipments=tour.shipments,
+            delivered_count=tour.delivered,
+            failed_count=tour.failed,
+            total_weight=tour.weight or 0,
+            total_volume=tour.volume or 0,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0011_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deliverytour',
+            name='delivered_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Delivered'),
+        ),
+        migrations.AddField(
+            model_name='deliverytour',
+            name='failed_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Failed'),
+        ),
+        migrations.AddField(
+            model_name='deliverytour',
+            name='total_shipments',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Shipments'),
+        ),
+        migrations.AddField(
+            model_name='deliverytour',
+            name='total_volume',
+            field=models.DecimalField(decimal_places=3, default=0, editable=False, max_digits=12, verbose_name='Total Volume (m³)'),
+        ),
+        migrations.AddField(
+            model_name='deliverytour',
+            name='total_weight',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='Total Weight (kg)'),
+        ),
+        migrations.RunPython(count_existing_tours, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 6.0.1 on 2026-10-19 00:56
+
+import django.db.models.deletion
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, F, Max, Q, Sum
+from django.db.models.functions import Coalesce
+
+# Same counting as common/client_stats.py, on the historical models
+STATUS_COUNTERS = {
+    'pending_shipments': ['pending'],
+    'in_transit_shipments': ['in_transit'],
+    'at_sorting_center_shipments': ['at_sorting_center'],
+    'out_for_delivery_shipments': ['out_for_delivery'],
+    'delivered_shipments': ['delivered'],
+    'failed_shipments': ['failed', 'failed_delivery'],
+    'returned_shipments': ['returned'],
+}
+OPEN_INVOICE_STATUSES = ['issued', 'partially_paid', 'overdue']
+
+
+def create_client_stats(apps, schema_editor):
+    Client = apps.get_model('common', 'Client')
+    ClientStats = apps.get_model('common', 'ClientStats')
+    Shipment = apps.get_model('common', 'Shipment')
+    Invoice = apps.get_model('common', 'Invoice')
+
+    for client_id in Client.objects.values_list('pk', flat=True).iterator():
+        values = Shipment.objects.filter(client_id=client_id).aggregate(
+            total_shipments=Count('pk'),
+            last_shipment_at=Max('created_at'),
+            **{counter: Count('pk', filter=Q(status__in=statuses)) for counter, statuses in STATUS_COUNTERS.items()}
+        )
+        open_filter = Q(status__in=OPEN_INVOICE_STATUSES)
+        values.update(Invoice.objects.filter(client_id=client_id).exclude(status__in=['draft', 'cancelled']).aggregate(
+            total_invoiced=Coalesce(Sum('amount_ttc'), Decimal('0')),
+            total_paid=Coalesce(Sum('amount_paid'), Decimal('0')),
+            open_invoices=Count('pk', filter=open_filter),
+            open_balance=Coalesce(Sum(F('amount_ttc') - F('amount_paid'), filter=open_filter), Decimal('0')),
+        ))
+        ClientStats.objects.create(client_id=client_id, **values)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0012_tour_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClientStats',
+            fields=[
+                ('client', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='common.client')),
+                ('total_shipments', models.PositiveIntegerField(default=0)),
+                ('pending_shipments', models.PositiveIntegerField(default=0)),
+                ('in_transit_shipments', models.PositiveIntegerField(default=0)),
+                ('at_sorting_center_shipments', models.PositiveIntegerField(default=0)),
+                ('out_for_delivery_shipments', models.PositiveIntegerField(default=0)),
+                ('delivered_shipments', models.PositiveIntegerField(default=0)),
+                ('failed_shipments', models.PositiveIntegerField(default=0)),
+                ('returned_shipments', models.PositiveIntegerField(default=0)),
+                ('last_shipment_at', models.DateTimeField(blank=True, null=True)),
+                ('total_invoiced', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Total Invoiced (DA)')),
+                ('total_paid', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Total Paid (DA)')),
+                ('open_invoices', models.PositiveIntegerField(default=0)),
+                ('open_balance', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Open Balance (DA)')),
+            ],
+            options={
+                'verbose_name': 'Client Statistics',
+                'verbose_name_plural': 'Client Statistics',
+                'db_table': 'client_stats',
+            },
+        ),
+        migrations.RunPython(create_client_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 6.0.1 on 2026-10-19 01:02
+
+import django.db.models.deletion
+import django.utils.timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import migrations, models
+
+UNBILLED_INVOICE_STATUSES = ['draft', 'cancelled']
+
+
+def post_history(apps, schema_editor):
+    """
+    Ledger of every client from their invoices and payments, in date order.
+    The old balance column held the balance due of the last invoice paid,
+    not the client's balance, so it is not carried over.
+    """
+    Client = apps.get_model('common', 'Client')
+    Invoice = apps.get_model('common', 'Invoice')
+    Payment = apps.get_model('common', 'Payment')
+    LedgerEntry = apps.get_model('common', 'LedgerEntry')
+
+    for client_id in Client.objects.values_list('pk', flat=True).iterator():
+        postings = []
+        invoices = Invoice.objects.filter(client_id=client_id).exclude(status__in=UNBILLED_INVOICE_STATUSES)
+        for invoice in invoices.order_by():
+            postings.append((invoice.created_at, 0, 'invoice', invoice.amount_ttc, f"Invoice {invoice.invoice_number}",
+                             invoice.pk, None, invoice.created_by_id))
+        payments = Payment.objects.filter(invoice__client_id=client_id).select_related('invoice')
+        for payment in payments.order_by():
+            postings.append((payment.created_at, 1, 'payment', -payment.amount,
+                             f"Payment {payment.payment_number} ({payment.invoice.invoice_number})",
+                             payment.invoice_id, payment.pk, payment.created_by_id))
+        postings.sort(key=lambda posting: posting[:2])
+
+        balance = Decimal('0.00')
+        entries = []
+        for sequence, (created_at, _, entry_type, amount, description, invoice_id, payment_id, user_id) in enumerate(postings, 1):
+            balance += amount
+            entries.append(LedgerEntry(
+                client_id=client_id, sequence=sequence, entry_type=entry_type,
+                debit=max(amount, Decimal('0.00')), credit=max(-amount, Decimal('0.00')), balance=balance,
+                description=description, invoice_id=invoice_id, payment_id=payment_id,
+                created_by_id=user_id, created_at=created_at
+            ))
+        LedgerEntry.objects.bulk_create(entries, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0013_client_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.PositiveIntegerField(editable=False)),
+                ('entry_type', models.CharField(choices=[('invoice', 'Invoice Issued'), ('payment', 'Payment Received'), ('adjustment', 'Adjustment')], max_length=20)),
+                ('debit', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Debit (DA)')),
+                ('credit', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Credit (DA)')),
+                ('balance', models.DecimalField(decimal_places=2, editable=False, max_digits=14, verbose_name='Balance (DA)')),
+                ('description', models.CharField(max_length=255)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='ledger_entries', to='common.client')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('invoice', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='common.invoice')),
+                ('payment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='common.payment')),
+            ],
+            options={
+                'verbose_name': 'Ledger Entry',
+                'verbose_name_plural': 'Ledger Entries',
+                'db_table': 'ledger_entries',
+                'ordering': ['client', 'sequence'],
+                'indexes': [models.Index(fields=['client', 'created_at'], name='ledger_client_created_idx')],
+                'constraints': [models.UniqueConstraint(fields=('client', 'sequence'), name='ledger_client_sequence_uniq')],
+            },
+        ),
+        migrations.RunPython(post_history, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='client',
+            name='balance',
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 6.0.1 on 2026-10-19 01:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0014_client_ledger'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedAuditLog',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('action', models.CharField(choices=[('create', 'Create'), ('update', 'Update'), ('delete', 'Delete'), ('view', 'View'), ('login', 'Login'), ('logout', 'Logout')], max_length=20, verbose_name='Action')),
+                ('model_name', models.CharField(max_length=100, verbose_name='Model')),
+                ('object_id', models.CharField(max_length=50, verbose_name='Object ID')),
+                ('details', models.TextField(blank=True, verbose_name='Details')),
+                ('ip_address', models.GenericIPAddressField(blank=True, null=True, verbose_name='IP Address')),
+                ('timestamp', models.DateTimeField(verbose_name='Timestamp')),
+                ('archived_at', models.DateTimeField(verbose_name='Archived At')),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Archived Audit Log',
+                'verbose_name_plural': 'Archived Audit Logs',
+                'db_table': 'audit_logs_archive',
+                'ordering': ['-timestamp'],
+                'indexes': [models.Index(fields=['model_name', 'object_id'], name='archived_audit_object_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedTrackingEvent',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('status', models.CharField(max_length=30, verbose_name='Status')),
+                ('location', models.CharField(max_length=200, verbose_name='Location')),
+                ('timestamp', models.DateTimeField(verbose_name='Timestamp')),
+                ('notes', models.TextField(blank=True, verbose_name='Notes')),
+                ('archived_at', models.DateTimeField(verbose_name='Archived At')),
+                ('created_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Created By')),
+                ('shipment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_tracking_events', to='common.shipment', verbose_name='Shipment')),
+            ],
+            options={
+                'verbose_name': 'Archived Tracking Event',
+                'verbose_name_plural': 'Archived Tracking Events',
+                'db_table': 'tracking_events_archive',
+                'ordering': ['-timestamp'],
+                'indexes': [models.Index(fields=['shipment', '-timestamp'], name='archived_event_shipment_idx')],
+            },
+        ),
+    ]
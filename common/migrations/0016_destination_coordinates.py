@@ -0,0 +1,24 @@
+# Generated by Django 6.0.1 on 2026-10-19 01:11
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0015_history_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='destination',
+            name='latitude',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True, validators=[django.core.validators.MinValueValidator(-90), django.core.validators.MaxValueValidator(90)], verbose_name='Latitude'),
+        ),
+        migrations.AddField(
+            model_name='destination',
+            name='longitude',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True, validators=[django.core.validators.MinValueValidator(-180), django.core.validators.MaxValueValidator(180)], verbose_name='Longitude'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 6.0.1 on 2026-10-19 02:01
+
+import django.core.validators
+from django.db import migrations, models
+from django.db.models import F
+
+
+def clear_destination_stops(apps, schema_editor):
+    """Stops positioned on their destination (a city or zone) are not delivery points: no geofence"""
+    TourShipment = apps.get_model('common', 'TourShipment')
+    TourShipment.objects.filter(
+        latitude=F('shipment__destination__latitude'),
+        longitude=F('shipment__destination__longitude'),
+        arrived_at__isnull=True
+    ).update(latitude=None, longitude=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0016_destination_coordinates'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_destination_stops, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='destination',
+            name='latitude',
+        ),
+        migrations.RemoveField(
+            model_name='destination',
+            name='longitude',
+        ),
+        migrations.AddField(
+            model_name='shipment',
+            name='recipient_latitude',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True, validators=[django.core.validators.MinValueValidator(-90), django.core.validators.MaxValueValidator(90)], verbose_name='Recipient Latitude'),
+        ),
+        migrations.AddField(
+            model_name='shipment',
+            name='recipient_longitude',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True, validators=[django.core.validators.MinValueValidator(-180), django.core.validators.MaxValueValidator(180)], verbose_name='Recipient Longitude'),
+        ),
+    ]
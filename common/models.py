@@ -6,6 +6,7 @@ Based on project requirements sections 0-6
 
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 from decimal import Decimal
 import uuid
@@ -23,14 +24,6 @@ class Client(models.Model):
     postal_code = models.CharField(max_length=10, verbose_name="Postal Code")
     country = models.CharField(max_length=100, default='Algeria', verbose_name="Country")
     
-    # Balance tracking
-    balance = models.DecimalField(
-        max_digits=12, 
-        decimal_places=2, 
-        default=0,
-        verbose_name="Balance (DA)"
-    )
-    
     # Metadata
     is_active = models.BooleanField(default=True, verbose_name="Active")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Created At")
@@ -45,6 +38,19 @@ class Client(models.Model):
             else:
                 self.client_id = "CLT00001"
         super().save(*args, **kwargs)
+
+    @property
+    def balance(self):
+        """Balance (DA): running balance of the client's latest ledger entry (common/ledger.py)"""
+        if not hasattr(self, '_balance'):
+            latest = LedgerEntry.objects.filter(client_id=self.pk).order_by('-sequence').values_list('balance', flat=True)
+            self._balance = latest.first() or Decimal('0.00')
+        return self._balance
+
+    @balance.setter
+    def balance(self, value):
+        # Set by querysets annotating the balance (ledger.with_balance())
+        self._balance = value
     
     class Meta:
         db_table = 'clients'
@@ -56,6 +62,49 @@ class Client(models.Model):
         return f"{self.client_id} - {self.name}"
 
 
+class ClientStats(models.Model):
+    """
+    Account summary of a client, maintained incrementally by the shipment and
+    invoice write paths (common/client_stats.py)
+    """
+    client = models.OneToOneField(
+        Client,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats'
+    )
+
+    # Shipments by status
+    total_shipments = models.PositiveIntegerField(default=0)
+    pending_shipments = models.PositiveIntegerField(default=0)
+    in_transit_shipments = models.PositiveIntegerField(default=0)
+    at_sorting_center_shipments = models.PositiveIntegerField(default=0)
+    out_for_delivery_shipments = models.PositiveIntegerField(default=0)
+    delivered_shipments = models.PositiveIntegerField(default=0)
+    failed_shipments = models.PositiveIntegerField(default=0)
+    returned_shipments = models.PositiveIntegerField(default=0)
+    last_shipment_at = models.DateTimeField(null=True, blank=True)
+
+    # Invoices (drafts and cancelled invoices excluded)
+    total_invoiced = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Total Invoiced (DA)")
+    total_paid = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Total Paid (DA)")
+    open_invoices = models.PositiveIntegerField(default=0)
+    open_balance = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Open Balance (DA)")
+
+    @property
+    def active_shipments(self):
+        """Shipments on their way (in transit, at a sorting center or out for delivery)"""
+        return self.in_transit_shipments + self.at_sorting_center_shipments + self.out_for_delivery_shipments
+
+    class Meta:
+        db_table = 'client_stats'
+        verbose_name = 'Client Statistics'
+        verbose_name_plural = 'Client Statistics'
+
+    def __str__(self):
+        return f"Statistics of {self.client_id}"
+
+
 class Driver(models.Model):
     """Driver entity with availability and professional info"""
     AVAILABILITY_CHOICES = [
@@ -363,11 +412,95 @@ class ServiceType(models.Model):
         return f"{self.code} - {self.name}"
 
 
+class TariffVersion(models.Model):
+    """Effective-dated set of tariff grids (Pricing)"""
+    name = models.CharField(max_length=100, verbose_name="Name")
+    effective_from = models.DateTimeField(verbose_name="Effective From")
+    is_active = models.BooleanField(default=True, verbose_name="Active")
+    created_at = models.DateTimeField(auto_now_add=True)
+    notes = models.TextField(blank=True, verbose_name="Notes")
+
+    class Meta:
+        db_table = 'tariff_versions'
+        ordering = ['-effective_from']
+        verbose_name = 'Tariff Version'
+        verbose_name_plural = 'Tariff Versions'
+
+    def __str__(self):
+        return f"{self.name} (from {self.effective_from:%Y-%m-%d})"
+
+
+class TariffRate(models.Model):
+    """
+    One cell of a tariff grid: price of a (zone, service type) from a weight
+    and volume break upward.
+    Formula: Montant = Montant de base + (Poids × Tarif poids) + (Volume × Tarif volume)
+    """
+    version = models.ForeignKey(
+        TariffVersion,
+        on_delete=models.CASCADE,
+        related_name='rates',
+        verbose_name="Tariff Version"
+    )
+    zone = models.CharField(max_length=20, choices=Destination.ZONE_CHOICES, verbose_name="Zone")
+    service_type = models.ForeignKey(
+        ServiceType,
+        on_delete=models.PROTECT,
+        related_name='tariff_rates',
+        verbose_name="Service Type"
+    )
+
+    # Breaks: the cell applies to parcels of at least this weight and volume
+    min_weight = models.DecimalField(
+        max_digits=8,
+        decimal_places=2,
+        default=0,
+        validators=[MinValueValidator(0)],
+        verbose_name="From Weight (kg)"
+    )
+    min_volume = models.DecimalField(
+        max_digits=8,
+        decimal_places=3,
+        default=0,
+        validators=[MinValueValidator(0)],
+        verbose_name="From Volume (m³)"
+    )
+
+    base_amount = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        validators=[MinValueValidator(0)],
+        verbose_name="Base Amount (DA)"
+    )
+    weight_tariff = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        validators=[MinValueValidator(0)],
+        verbose_name="Weight Tariff (DA/kg)"
+    )
+    volume_tariff = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        validators=[MinValueValidator(0)],
+        verbose_name="Volume Tariff (DA/m³)"
+    )
+
+    class Meta:
+        db_table = 'tariff_rates'
+        ordering = ['version', 'zone', 'service_type', 'min_weight', 'min_volume']
+        unique_together = ['version', 'zone', 'service_type', 'min_weight', 'min_volume']
+        verbose_name = 'Tariff Rate'
+        verbose_name_plural = 'Tariff Rates'
+
+    def __str__(self):
+        return f"{self.version.name} - {self.zone} / {self.service_type.code} from {self.min_weight} kg, {self.min_volume} m³"
+
+
 # ==================== SECTION 2: SHIPMENTS & TRACKING ====================
 
 class Shipment(models.Model):
     """
-    Shipment/Expedition with automatic pricing
+    Shipment/Expedition with automatic pricing (common/pricing.py)
     Formula: Montant total = Tarif de base + (Poids × Tarif poids) + (Volume × Tarif volume)
     """
     STATUS_CHOICES = [
@@ -450,6 +583,24 @@ class Shipment(models.Model):
     recipient_name = models.CharField(max_length=200, verbose_name="Recipient Name")
     recipient_phone = models.CharField(max_length=20, verbose_name="Recipient Phone")
     recipient_address = models.TextField(verbose_name="Recipient Address")
+
+    # Geocoded delivery address: the tour stop of the shipment is geofenced around it (common/geofence.py)
+    recipient_latitude = models.DecimalField(
+        max_digits=9,
+        decimal_places=6,
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(-90), MaxValueValidator(90)],
+        verbose_name="Recipient Latitude"
+    )
+    recipient_longitude = models.DecimalField(
+        max_digits=9,
+        decimal_places=6,
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(-180), MaxValueValidator(180)],
+        verbose_name="Recipient Longitude"
+    )
     
     # Additional
     notes = models.TextField(blank=True, verbose_name="Notes")
@@ -466,19 +617,37 @@ class Shipment(models.Model):
         if not self.shipment_number:
             self.shipment_number = f"EXP{uuid.uuid4().hex[:12].upper()}"
         
-        # Calculate amount using formula
-        if self.service_type and self.destination:
-            self.amount = (
-                self.destination.base_tariff +
-                (self.weight * self.service_type.weight_tariff) +
-                (self.volume * self.service_type.volume_tariff)
-            )
+        # Calculate amount with the tariff in effect when the shipment was created
+        from common import pricing
+        amount = pricing.quote(
+            self.destination_id,
+            self.service_type_id,
+            self.weight,
+            self.volume,
+            at=self.created_at
+        )
+        if amount is not None:
+            self.amount = amount
         
         super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Values the tour counters were computed from (common/tour_counters.py)
+        instance._counted = {
+            name: value for name, value in zip(field_names, values)
+            if name in ('status', 'weight', 'volume') and value is not models.DEFERRED
+        }
+        return instance
     
     class Meta:
         db_table = 'shipments'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['client', '-created_at'], name='shipment_client_created_idx'),
+            models.Index(fields=['status', '-created_at'], name='shipment_status_created_idx'),
+        ]
         verbose_name = 'Shipment'
         verbose_name_plural = 'Shipments'
     
@@ -508,6 +677,9 @@ class TrackingEvent(models.Model):
     class Meta:
         db_table = 'tracking_events'
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['shipment', '-timestamp'], name='tracking_event_shipment_idx'),
+        ]
         verbose_name = 'Tracking Event'
         verbose_name_plural = 'Tracking Events'
     
@@ -515,6 +687,44 @@ class TrackingEvent(models.Model):
         return f"{self.shipment.shipment_number} - {self.status}"
 
 
+class ArchivedTrackingEvent(models.Model):
+    """
+    Tracking event moved out of tracking_events (common/archive.py), same id
+    and columns; read through archive.tracking_history()
+    """
+    id = models.BigIntegerField(primary_key=True)
+    shipment = models.ForeignKey(
+        Shipment,
+        on_delete=models.CASCADE,
+        related_name='archived_tracking_events',
+        verbose_name="Shipment"
+    )
+    status = models.CharField(max_length=30, verbose_name="Status")
+    location = models.CharField(max_length=200, verbose_name="Location")
+    timestamp = models.DateTimeField(verbose_name="Timestamp")
+    notes = models.TextField(blank=True, verbose_name="Notes")
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='+',
+        verbose_name="Created By"
+    )
+    archived_at = models.DateTimeField(verbose_name="Archived At")
+
+    class Meta:
+        db_table = 'tracking_events_archive'
+        ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['shipment', '-timestamp'], name='archived_event_shipment_idx'),
+        ]
+        verbose_name = 'Archived Tracking Event'
+        verbose_name_plural = 'Archived Tracking Events'
+
+    def __str__(self):
+        return f"{self.shipment_id} - {self.status} (archived)"
+
+
 class DeliveryTour(models.Model):
     """Delivery tour with driver, vehicle, and route data"""
     STATUS_CHOICES = [
@@ -569,6 +779,26 @@ class DeliveryTour(models.Model):
         verbose_name="Status"
     )
     notes = models.TextField(blank=True, verbose_name="Notes")
+
+    # Shipment counters, maintained with the tour's shipments (common/tour_counters.py)
+    total_shipments = models.PositiveIntegerField(default=0, editable=False, verbose_name="Shipments")
+    delivered_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Delivered")
+    failed_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Failed")
+    total_weight = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        editable=False,
+        verbose_name="Total Weight (kg)"
+    )
+    total_volume = models.DecimalField(
+        max_digits=12,
+        decimal_places=3,
+        default=0,
+        editable=False,
+        verbose_name="Total Volume (m³)"
+    )
+
     created_at = models.DateTimeField(auto_now_add=True)
     created_by = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -589,6 +819,9 @@ class DeliveryTour(models.Model):
     class Meta:
         db_table = 'delivery_tours'
         ordering = ['-date', '-created_at']
+        indexes = [
+            models.Index(fields=['driver', 'status', '-date'], name='tour_driver_status_date_idx'),
+        ]
         verbose_name = 'Delivery Tour'
         verbose_name_plural = 'Delivery Tours'
     
@@ -612,13 +845,91 @@ class TourShipment(models.Model):
     delivered = models.BooleanField(default=False)
     delivery_time = models.DateTimeField(null=True, blank=True)
     notes = models.TextField(blank=True)
-    
+
+    # Stop geofence (arrival/departure detection from driver location pings)
+    latitude = models.DecimalField(
+        max_digits=9,
+        decimal_places=6,
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(-90), MaxValueValidator(90)],
+        verbose_name="Stop Latitude"
+    )
+    longitude = models.DecimalField(
+        max_digits=9,
+        decimal_places=6,
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(-180), MaxValueValidator(180)],
+        verbose_name="Stop Longitude"
+    )
+    geofence_radius = models.PositiveIntegerField(default=150, verbose_name="Geofence Radius (meters)")
+    arrived_at = models.DateTimeField(null=True, blank=True, verbose_name="Arrived At")
+    departed_at = models.DateTimeField(null=True, blank=True, verbose_name="Departed At")
+
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.latitude is None and self.longitude is None:
+            # Stop position defaults to the shipment's delivery address (stops without one get no geofence)
+            self.latitude, self.longitude = Shipment.objects.filter(pk=self.shipment_id).values_list(
+                'recipient_latitude', 'recipient_longitude'
+            ).first() or (None, None)
+        super().save(*args, **kwargs)
+
     class Meta:
         db_table = 'tour_shipments'
         ordering = ['tour', 'sequence']
         unique_together = ['tour', 'shipment']
 
 
+class LocationPing(models.Model):
+    """GPS breadcrumb recorded from the driver app during a tour"""
+    driver = models.ForeignKey(
+        Driver,
+        on_delete=models.CASCADE,
+        related_name='location_pings',
+        verbose_name="Driver"
+    )
+    tour = models.ForeignKey(
+        DeliveryTour,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='location_pings',
+        verbose_name="Tour"
+    )
+    latitude = models.DecimalField(
+        max_digits=9,
+        decimal_places=6,
+        validators=[MinValueValidator(-90), MaxValueValidator(90)],
+        verbose_name="Latitude"
+    )
+    longitude = models.DecimalField(
+        max_digits=9,
+        decimal_places=6,
+        validators=[MinValueValidator(-180), MaxValueValidator(180)],
+        verbose_name="Longitude"
+    )
+    accuracy = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        default=0,
+        verbose_name="Accuracy (meters)"
+    )
+    recorded_at = models.DateTimeField(verbose_name="Recorded At")
+
+    class Meta:
+        db_table = 'location_pings'
+        ordering = ['recorded_at']
+        indexes = [
+            models.Index(fields=['tour', 'recorded_at'], name='location_ping_tour_idx'),
+        ]
+        verbose_name = 'Location Ping'
+        verbose_name_plural = 'Location Pings'
+
+    def __str__(self):
+        return f"{self.driver_id} @ {self.latitude},{self.longitude} ({self.recorded_at})"
+
+
 # ==================== SECTION 3: INVOICING & PAYMENTS ====================
 
 class Invoice(models.Model):
@@ -656,6 +967,7 @@ class Invoice(models.Model):
     notes = models.TextField(blank=True)
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     def save(self, *args, **kwargs):
         if not self.invoice_number:
@@ -676,6 +988,16 @@ class Invoice(models.Model):
             self.status = 'partially_paid'
         
         super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Values the client statistics were computed from (common/client_stats.py)
+        instance._counted = {
+            name: value for name, value in zip(field_names, values)
+            if name in ('status', 'amount_ttc', 'amount_paid') and value is not models.DEFERRED
+        }
+        return instance
     
     @property
     def balance_due(self):
@@ -684,6 +1006,9 @@ class Invoice(models.Model):
     class Meta:
         db_table = 'invoices'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['client', 'status'], name='invoice_client_status_idx'),
+        ]
     
     def __str__(self):
         return f"{self.invoice_number} - {self.client.name}"
@@ -730,20 +1055,63 @@ class Payment(models.Model):
         
         super().save(*args, **kwargs)
         
-        # Update invoice paid amount
+        # Update invoice paid amount (saving the invoice records the payment in the client's ledger)
         self.invoice.amount_paid = sum(p.amount for p in self.invoice.payments.all())
         self.invoice.save()
-        
-        # Update client balance if partial payment
-        if self.invoice.balance_due > 0:
-            self.invoice.client.balance = self.invoice.balance_due
-            self.invoice.client.save()
     
     class Meta:
         db_table = 'payments'
         ordering = ['-payment_date']
 
 
+class LedgerEntry(models.Model):
+    """
+    Append-only client account ledger: debits (invoices) and credits (payments),
+    each entry carrying the client's running balance (common/ledger.py)
+    """
+    ENTRY_TYPE_CHOICES = [
+        ('invoice', 'Invoice Issued'),
+        ('payment', 'Payment Received'),
+        ('adjustment', 'Adjustment'),
+    ]
+
+    # A client with ledger entries cannot be deleted: the account history is kept
+    client = models.ForeignKey(Client, on_delete=models.PROTECT, related_name='ledger_entries')
+    sequence = models.PositiveIntegerField(editable=False)  # 1, 2, 3... per client
+    entry_type = models.CharField(max_length=20, choices=ENTRY_TYPE_CHOICES)
+    debit = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Debit (DA)")
+    credit = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Credit (DA)")
+    balance = models.DecimalField(max_digits=14, decimal_places=2, editable=False, verbose_name="Balance (DA)")
+    invoice = models.ForeignKey(Invoice, on_delete=models.SET_NULL, null=True, blank=True, related_name='ledger_entries')
+    payment = models.ForeignKey(Payment, on_delete=models.SET_NULL, null=True, blank=True, related_name='ledger_entries')
+    description = models.CharField(max_length=255)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError("Ledger entries are append-only: post an adjustment instead")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError("Ledger entries are append-only: post an adjustment instead")
+
+    class Meta:
+        db_table = 'ledger_entries'
+        ordering = ['client', 'sequence']
+        verbose_name = 'Ledger Entry'
+        verbose_name_plural = 'Ledger Entries'
+        constraints = [
+            models.UniqueConstraint(fields=['client', 'sequence'], name='ledger_client_sequence_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['client', 'created_at'], name='ledger_client_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.client_id} #{self.sequence} {self.get_entry_type_display()}"
+
+
 # ==================== SECTION 4: INCIDENTS ====================
 
 class Incident(models.Model):
@@ -787,6 +1155,9 @@ class Incident(models.Model):
     class Meta:
         db_table = 'incidents'
         ordering = ['-reported_date']
+        indexes = [
+            models.Index(fields=['status', '-reported_date'], name='incident_status_reported_idx'),
+        ]
 
 
 # ==================== SECTION 5: CLAIMS ====================
@@ -837,6 +1208,9 @@ class Claim(models.Model):
     class Meta:
         db_table = 'claims'
         ordering = ['-filed_date']
+        indexes = [
+            models.Index(fields=['client', '-filed_date'], name='claim_client_filed_idx'),
+        ]
 
 
 # ==================== SECTION 0: FAVORITES ====================
@@ -898,4 +1272,38 @@ class AuditLog(models.Model):
         verbose_name_plural = 'Audit Logs'
     
     def __str__(self):
-        return f"{self.user} - {self.action} {self.model_name} at {self.timestamp}"
\ No newline at end of file
+        return f"{self.user} - {self.action} {self.model_name} at {self.timestamp}"
+
+
+class ArchivedAuditLog(models.Model):
+    """
+    Audit log entry moved out of audit_logs (common/archive.py), same id and
+    columns; read through archive.audit_history()
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='+',
+        verbose_name="User"
+    )
+    action = models.CharField(max_length=20, choices=AuditLog.ACTION_CHOICES, verbose_name="Action")
+    model_name = models.CharField(max_length=100, verbose_name="Model")
+    object_id = models.CharField(max_length=50, verbose_name="Object ID")
+    details = models.TextField(blank=True, verbose_name="Details")
+    ip_address = models.GenericIPAddressField(null=True, blank=True, verbose_name="IP Address")
+    timestamp = models.DateTimeField(verbose_name="Timestamp")
+    archived_at = models.DateTimeField(verbose_name="Archived At")
+
+    class Meta:
+        db_table = 'audit_logs_archive'
+        ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['model_name', 'object_id'], name='archived_audit_object_idx'),
+        ]
+        verbose_name = 'Archived Audit Log'
+        verbose_name_plural = 'Archived Audit Logs'
+
+    def __str__(self):
+        return f"{self.user_id} - {self.action} {self.model_name} at {self.timestamp} (archived)"
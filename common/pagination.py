@@ -0,0 +1,206 @@
+"""
+Cursor pagination - common/pagination.py
+Keyset pagination for the shipment, invoice, claim and incident journals.
+
+Paginator pages with COUNT(*) and OFFSET, both of which read every row before
+the page. A cursor page instead continues from the ordering values of the
+last (or first) row shown: `WHERE (created_at, id) < (...) ORDER BY
+created_at DESC, id DESC LIMIT n`, which an index answers directly however
+deep the page. Cursors are signed, so they are opaque to users and a
+tampered cursor is simply treated as the first page.
+
+The ordering must end with a unique field (the primary key) and its fields
+must not be null. Totals are optional and only computed if a template reads
+page.total; paginated lists count approximately unless the exact count is
+requested (common/counting.py).
+"""
+
+from decimal import Decimal
+from urllib.parse import urlencode
+
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from common import counting
+from common.projections import include
+
+CURSOR_SALT = 'common.pagination.cursor'
+CURSOR_PARAM = 'cursor'
+DEFAULT_ORDERING = ('-created_at', '-id')
+
+
+def exact_count(queryset):
+    return queryset.count()
+
+
+class CursorPage:
+    """One page of a CursorPaginator, with links that keep the other query parameters (filters)"""
+
+    def __init__(self, paginator, object_list, next_cursor, previous_cursor, query=None):
+        self.paginator = paginator
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.query = query
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def _url(self, **params):
+        # self.query is request.GET: the filters of the list
+        query = self.query.copy() if self.query is not None else {}
+        query.pop('page', None)
+        for name, value in params.items():
+            query[name] = value
+        return '?' + (query.urlencode() if hasattr(query, 'urlencode') else urlencode(query))
+
+    @property
+    def next_url(self):
+        return self._url(**{CURSOR_PARAM: self.next_cursor}) if self.has_next else None
+
+    @property
+    def previous_url(self):
+        return self._url(**{CURSOR_PARAM: self.previous_cursor}) if self.has_previous else None
+
+    @property
+    def exact_count_url(self):
+        """This page again, with the exact total"""
+        return self._url(**{counting.EXACT_PARAM: '1'})
+
+    @cached_property
+    def total(self):
+        """Total rows of the filtered list (None if the paginator has no count function)"""
+        return self.paginator.total()
+
+
+class CursorPaginator:
+    """
+    Keyset paginator over a filtered queryset.
+    `ordering` lists the ordering fields ('-field' for descending), ending
+    with a unique one; `count` is called with the queryset for page.total.
+    """
+
+    def __init__(self, queryset, per_page, ordering=DEFAULT_ORDERING, count=exact_count):
+        self.ordering = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+        # Cursors read the ordering fields of the rows: never leave them deferred
+        self.queryset = include(queryset, [name for name, descending in self.ordering])
+        self.per_page = per_page
+        self.count = count
+        self.fields = [queryset.model._meta.get_field(name) for name, descending in self.ordering]
+
+    def total(self):
+        return self.count(self.queryset) if self.count else None
+
+    def _values(self, obj):
+        if isinstance(obj, dict):
+            return [obj[name] for name, descending in self.ordering]
+        return [getattr(obj, field.attname) for field in self.fields]
+
+    def encode(self, direction, obj):
+        # Full-precision text for dates and decimals (a truncated value would skip rows)
+        values = [
+            value.isoformat() if hasattr(value, 'isoformat') else str(value) if isinstance(value, Decimal) else value
+            for value in self._values(obj)
+        ]
+        return signing.dumps([direction, values], salt=CURSOR_SALT, compress=True)
+
+    def decode(self, cursor):
+        """(direction, ordering values) of a cursor, or None if it is missing or invalid"""
+        if not cursor:
+            return None
+        try:
+            direction, values = signing.loads(cursor, salt=CURSOR_SALT)
+            if direction not in ('next', 'previous') or len(values) != len(self.fields):
+                return None
+            return direction, [field.to_python(value) for field, value in zip(self.fields, values)]
+        except (signing.BadSignature, ValidationError, ValueError, TypeError):
+            return None
+
+    def _after(self, values, reverse):
+        """Rows strictly after `values` in the ordering (before them if `reverse`)"""
+        condition = Q()
+        for position, (name, descending) in enumerate(self.ordering):
+            lookup = 'lt' if descending != reverse else 'gt'
+            step = Q(**{f'{name}__{lookup}': values[position]})
+            for previous, (previous_name, previous_descending) in enumerate(self.ordering[:position]):
+                step &= Q(**{previous_name: values[previous]})
+            condition |= step
+        return condition
+
+    def _order_by(self, reverse):
+        return [
+            ('-' if descending != reverse else '') + name
+            for name, descending in self.ordering
+        ]
+
+    def page(self, cursor=None, query=None):
+        decoded = self.decode(cursor)
+        if decoded is None:
+            rows = list(self.queryset.order_by(*self._order_by(False))[:self.per_page + 1])
+            more = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            next_cursor = self.encode('next', rows[-1]) if more else None
+            return CursorPage(self, rows, next_cursor, None, query)
+
+        direction, values = decoded
+        reverse = direction == 'previous'
+        rows = list(
+            self.queryset.filter(self._after(values, reverse)).order_by(*self._order_by(reverse))[:self.per_page + 1]
+        )
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+        if not rows:
+            # Nothing left on that side (rows deleted meanwhile): start over
+            return self.page(None, query)
+
+        # The cursor came from a row on the other side, so there are rows there
+        if reverse:
+            next_cursor = self.encode('next', rows[-1])
+            previous_cursor = self.encode('previous', rows[0]) if more else None
+        else:
+            next_cursor = self.encode('next', rows[-1]) if more else None
+            previous_cursor = self.encode('previous', rows[0])
+        return CursorPage(self, rows, next_cursor, previous_cursor, query)
+
+
+def paginate(request, queryset, per_page, ordering=DEFAULT_ORDERING, count=None):
+    """
+    (paginator, page) for the cursor in a request's query string. Totals are
+    approximate unless `count` is given or the request asks for the exact one.
+    """
+    paginator = CursorPaginator(queryset, per_page, ordering, count or counting.request_counter(request))
+    return paginator, paginator.page(request.GET.get(CURSOR_PARAM), request.GET)
+
+
+class CursorPaginationMixin:
+    """
+    ListView mixin replacing Paginator with a CursorPaginator
+    (paginate_by rows per page, ordered by cursor_ordering).
+    """
+    cursor_ordering = DEFAULT_ORDERING
+    cursor_count = None  # Count function of page.total (default: approximate)
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator, page = paginate(self.request, queryset, page_size, self.cursor_ordering, self.cursor_count)
+        return paginator, page, page.object_list, page.has_other_pages()
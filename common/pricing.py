@@ -0,0 +1,244 @@
+"""
+Pricing engine - common/pricing.py
+Prices parcels from the tariff grids of the TariffVersion in effect.
+
+Every version is compiled once per process into numpy lookup arrays: per
+(zone, service type) the weight and volume breaks are sorted and the grid
+cells resolved, so a parcel is priced with two searchsorted lookups. Amounts
+are computed in exact integer units and rounded half up to the centime, so the
+per-shipment path (quote) and the batch path (quote_batch) always agree.
+
+Parcels without a grid cell (or priced before any version takes effect) use
+the Destination/ServiceType tariffs:
+Montant total = Tarif de base + (Poids × Tarif poids) + (Volume × Tarif volume)
+"""
+
+import bisect
+import threading
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+
+import numpy as np
+from django.utils import timezone
+
+from common import refdata
+from common.models import TariffRate, TariffVersion
+
+# Integer units: weights in 1/100 kg, volumes in 1/1000 m³, amounts and rates
+# in centimes. weight × rate is then in 1/10 000 DA and volume × rate in
+# 1/100 000 DA, so the exact amount is summed in 1/100 000 DA.
+CENTIME = Decimal('0.01')
+WEIGHT_PLACES = Decimal('0.01')
+VOLUME_PLACES = Decimal('0.001')
+EXACT_PER_CENTIME = 1000
+
+INT64_MAX = np.iinfo(np.int64).max
+
+_lock = threading.Lock()
+_state = {
+    'refdata_version': None,
+    'versions': ([], []),  # (effective_from list, version_id list), sorted by date
+    'compiled': {},  # version_id -> CompiledTariff
+}
+
+
+def _units(value, places):
+    """Exact integer count of `places` in a decimal value (rounded half up beyond them)"""
+    return int(Decimal(value).quantize(places, rounding=ROUND_HALF_UP) / places)
+
+
+def _centimes(value):
+    return _units(value, CENTIME)
+
+
+def _weight_units(value):
+    return _units(value, WEIGHT_PLACES)
+
+
+def _volume_units(value):
+    return _units(value, VOLUME_PLACES)
+
+
+class CompiledTariff:
+    """Tariff grids of one version compiled into lookup arrays"""
+
+    def __init__(self, version_id, rates):
+        self.version_id = version_id
+        self.base = np.array([_centimes(rate['base_amount']) for rate in rates], dtype=np.int64)
+        self.weight_rate = np.array([_centimes(rate['weight_tariff']) for rate in rates], dtype=np.int64)
+        self.volume_rate = np.array([_centimes(rate['volume_tariff']) for rate in rates], dtype=np.int64)
+
+        # (zone, service_type_id) -> (weight breaks, volume breaks, cells)
+        self.grids = {}
+        by_key = {}
+        for index, rate in enumerate(rates):
+            by_key.setdefault((rate['zone'], rate['service_type_id']), []).append(
+                (_weight_units(rate['min_weight']), _volume_units(rate['min_volume']), index)
+            )
+        for key, cells in by_key.items():
+            cells.sort()
+            weights = sorted({cell[0] for cell in cells})
+            volumes = sorted({cell[1] for cell in cells})
+            # A cell takes the most specific row whose breaks both fit, weight first
+            grid = np.full((len(weights), len(volumes)), -1, dtype=np.int64)
+            for i, weight in enumerate(weights):
+                for j, volume in enumerate(volumes):
+                    for min_weight, min_volume, index in cells:
+                        if min_weight <= weight and min_volume <= volume:
+                            grid[i, j] = index
+            self.grids[key] = (np.array(weights, dtype=np.int64), np.array(volumes, dtype=np.int64), grid)
+
+    @classmethod
+    def load(cls, version_id):
+        rates = TariffRate.objects.filter(version_id=version_id).values(
+            'zone', 'service_type_id', 'min_weight', 'min_volume',
+            'base_amount', 'weight_tariff', 'volume_tariff'
+        )
+        return cls(version_id, list(rates))
+
+    def lookup(self, zones, service_type_ids, weights, volumes):
+        """Index of the grid cell of every parcel (-1 where no cell applies)"""
+        cells = np.full(len(weights), -1, dtype=np.int64)
+        keys = list(zip(zones, service_type_ids))
+        groups = {}
+        for position, key in enumerate(keys):
+            groups.setdefault(key, []).append(position)
+        for key, positions in groups.items():
+            grid = self.grids.get(key)
+            if grid is None:
+                continue
+            weight_breaks, volume_breaks, grid = grid
+            positions = np.array(positions, dtype=np.int64)
+            i = np.searchsorted(weight_breaks, weights[positions], side='right') - 1
+            j = np.searchsorted(volume_breaks, volumes[positions], side='right') - 1
+            found = (i >= 0) & (j >= 0)
+            cells[positions[found]] = grid[i[found], j[found]]
+        return cells
+
+
+def _refresh():
+    """Drop compiled versions when the reference data version changed"""
+    version = refdata.current_version()
+    if version != _state['refdata_version']:
+        versions = list(TariffVersion.objects.filter(is_active=True).order_by(
+            'effective_from', 'id'
+        ).values_list('effective_from', 'id'))
+        with _lock:
+            _state.update(
+                refdata_version=version,
+                versions=([row[0] for row in versions], [row[1] for row in versions]),
+                compiled={},
+            )
+
+
+def _version_at(at):
+    dates, ids = _state['versions']
+    position = bisect.bisect_right(dates, at or timezone.now())
+    return ids[position - 1] if position else None
+
+
+def version_at(at=None):
+    """Id of the tariff version in effect at a given time (None before the first one)"""
+    _refresh()
+    return _version_at(at)
+
+
+def get_compiled(version_id):
+    compiled = _state['compiled'].get(version_id)
+    if compiled is None:
+        compiled = CompiledTariff.load(version_id)
+        with _lock:
+            compiled = _state['compiled'].setdefault(version_id, compiled)
+    return compiled
+
+
+def _exact_amounts(base, weight_rate, volume_rate, weights, volumes):
+    """Exact amounts in 1/100 000 DA; falls back to Python integers if int64 could overflow"""
+    bound = (
+        int(base.max()) * EXACT_PER_CENTIME
+        + int(weights.max()) * int(weight_rate.max()) * 10
+        + int(volumes.max()) * int(volume_rate.max())
+    )
+    if bound > INT64_MAX:
+        base, weight_rate, volume_rate, weights, volumes = (
+            array.astype(object) for array in (base, weight_rate, volume_rate, weights, volumes)
+        )
+    return base * EXACT_PER_CENTIME + weights * weight_rate * 10 + volumes * volume_rate
+
+
+def quote_batch(destination_ids, service_type_ids, weights, volumes, at=None):
+    """
+    Price many parcels in one vectorised pass.
+    `at` is one pricing date for the whole batch or one date per parcel
+    (None means now). Returns one Decimal amount per parcel (None if its
+    destination or service type is unknown). Raises ValueError on a negative
+    weight or volume.
+    """
+    count = len(destination_ids)
+    if not count:
+        return []
+
+    weight_units = np.array([_weight_units(weight) for weight in weights], dtype=object)
+    volume_units = np.array([_volume_units(volume) for volume in volumes], dtype=object)
+    if (weight_units < 0).any() or (volume_units < 0).any():
+        raise ValueError('Weight and volume must be positive')
+    if max(weight_units.max(), volume_units.max()) > INT64_MAX:
+        raise ValueError('Weight or volume out of range')
+    weight_units = weight_units.astype(np.int64)
+    volume_units = volume_units.astype(np.int64)
+
+    # Destination/ServiceType tariffs, used where no grid cell applies
+    destinations = refdata.get_destinations(destination_ids)
+    service_types = refdata.get_service_types(service_type_ids)
+    known = np.zeros(count, dtype=bool)
+    zones = []
+    base = np.zeros(count, dtype=np.int64)
+    weight_rate = np.zeros(count, dtype=np.int64)
+    volume_rate = np.zeros(count, dtype=np.int64)
+    for position, (destination_id, service_type_id) in enumerate(zip(destination_ids, service_type_ids)):
+        destination = destinations[destination_id]
+        service_type = service_types[service_type_id]
+        zones.append(destination.zone if destination else None)
+        if destination and service_type:
+            known[position] = True
+            base[position] = _centimes(destination.base_tariff)
+            weight_rate[position] = _centimes(service_type.weight_tariff)
+            volume_rate[position] = _centimes(service_type.volume_tariff)
+
+    _refresh()
+    if at is None or isinstance(at, datetime):
+        version_ids = np.full(count, _version_at(at) or 0, dtype=np.int64)
+    else:
+        version_ids = np.array([_version_at(moment) or 0 for moment in at], dtype=np.int64)
+
+    for version_id in np.unique(version_ids[known]).tolist():
+        if not version_id:
+            continue
+        positions = np.flatnonzero(known & (version_ids == version_id))
+        compiled = get_compiled(version_id)
+        cells = compiled.lookup(
+            [zones[position] for position in positions],
+            [service_type_ids[position] for position in positions],
+            weight_units[positions],
+            volume_units[positions]
+        )
+        graded = positions[cells >= 0]
+        cells = cells[cells >= 0]
+        base[graded] = compiled.base[cells]
+        weight_rate[graded] = compiled.weight_rate[cells]
+        volume_rate[graded] = compiled.volume_rate[cells]
+
+    exact = _exact_amounts(base, weight_rate, volume_rate, weight_units, volume_units)
+    # Round half up to the centime (amounts are never negative)
+    centimes = (exact + EXACT_PER_CENTIME // 2) // EXACT_PER_CENTIME
+    return [
+        Decimal(int(amount)).scaleb(-2) if is_known else None
+        for amount, is_known in zip(centimes.tolist(), known.tolist())
+    ]
+
+
+def quote(destination_id, service_type_id, weight, volume, at=None):
+    """Price of one parcel (None if the destination or service type is unknown)"""
+    if destination_id is None or service_type_id is None:
+        return None
+    return quote_batch([destination_id], [service_type_id], [weight], [volume], at)[0]
@@ -0,0 +1,42 @@
+"""
+List projections - common/projections.py
+Load only the columns a list page displays.
+
+Shipment rows are wide (description, both addresses and notes are text
+columns), and so are the clients they join, but list templates show a few
+short fields. Each list declares the fields it displays and its queryset
+selects just those: `project(queryset, fields)` defers every other column
+and joins the related rows whose fields are listed ('client__name').
+
+A deferred field is still loaded if something reads it, at the cost of one
+query per row, so a list's fields must cover everything its template shows.
+"""
+
+
+def project(queryset, fields):
+    """The queryset loading only `fields` (and the primary keys), related fields through joins"""
+    related = {field.rsplit('__', 1)[0] for field in fields if '__' in field}
+    return queryset.select_related(*related).only(*fields)
+
+
+def include(queryset, fields):
+    """The queryset, making sure it loads `fields` if it defers some columns"""
+    names, deferred = queryset.query.deferred_loading
+    fields = set(fields)
+    if deferred:
+        # defer(): every field except `names`
+        if names.isdisjoint(fields):
+            return queryset
+        return queryset.defer(None).defer(*(names - fields))
+    # only(): just `names`
+    if not names or names.issuperset(fields):
+        return queryset
+    return queryset.only(*names, *fields)
+
+
+class ProjectionMixin:
+    """ListView mixin: `list_fields` are the fields the list template displays"""
+    list_fields = None
+
+    def project(self, queryset):
+        return project(queryset, self.list_fields) if self.list_fields else queryset
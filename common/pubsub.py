@@ -0,0 +1,111 @@
+"""
+In-process pub/sub - common/pubsub.py
+Fans out events published by the write paths (tracking events, ETA updates)
+to the async server-sent events streams watching a topic.
+
+Each watcher costs one asyncio queue in the topic's subscriber set: publishing
+never queries the database and watchers never poll. Publishers may run in any
+thread; delivery is scheduled on each subscriber's own event loop. Only the
+watchers connected to the same process as the writer are reached: with
+several processes, streams must also catch up from the database and the
+shared cache (as client.views.shipment_events does on each keepalive).
+
+Publishing an event with an id also bumps the topic's stamp in the shared
+cache. A stream compares the stamp with the one it last saw to know whether
+another process published something, and only then queries the database.
+"""
+
+import asyncio
+import threading
+import time
+
+from common.caching import get_cache
+
+STAMP_KEY = 'stamp:{}'
+STAMP_TIMEOUT = 24 * 3600
+
+cache = get_cache('pubsub')
+
+
+class Subscription:
+    """One watcher of a topic; iterate with ``await subscription.get()``"""
+
+    def __init__(self, topic, loop, maxsize):
+        self.topic = topic
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def _deliver(self, message):
+        if self.queue.full():
+            # A slow watcher loses its oldest messages instead of blocking publishers
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class Broker:
+    """Topic -> subscribers registry"""
+
+    def __init__(self, maxsize=100):
+        self.maxsize = maxsize
+        self._topics = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, topic):
+        """Create a subscription bound to the running event loop"""
+        subscription = Subscription(topic, asyncio.get_running_loop(), self.maxsize)
+        with self._lock:
+            self._topics.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._topics.get(subscription.topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._topics[subscription.topic]
+
+    def has_subscribers(self, topic):
+        return topic in self._topics
+
+    def stamp(self, topic):
+        """Stamp of the last event published to a topic by any process (None if none yet)"""
+        return cache.get(STAMP_KEY.format(topic))
+
+    def _bump(self, topic):
+        key = STAMP_KEY.format(topic)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # First event (or the stamp was evicted): start from a value no stream has seen
+            cache.set(key, time.time_ns(), STAMP_TIMEOUT)
+
+    def publish(self, topic, event, data, event_id=None):
+        """
+        Send an event to every subscriber of a topic; returns the number of subscribers reached.
+        Events with an id (persisted events, which streams can replay) also bump the topic's stamp.
+        """
+        if event_id is not None:
+            self._bump(topic)
+        with self._lock:
+            subscribers = list(self._topics.get(topic, ()))
+        message = {'event': event, 'data': data, 'id': event_id}
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._deliver, message)
+            except RuntimeError:
+                # The subscriber's event loop is closed: drop it
+                self.unsubscribe(subscription)
+        return len(subscribers)
+
+
+broker = Broker()
+
+
+def shipment_topic(shipment_id):
+    return f'shipment:{shipment_id}'
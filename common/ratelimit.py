@@ -0,0 +1,37 @@
+"""
+Rate limiting - common/ratelimit.py
+Fixed-window counters kept in the cache, used to throttle logins and the
+public tracking API.
+"""
+
+from common.caching import get_cache
+
+KEY = '{}:{}'
+
+cache = get_cache('ratelimit', alias='ratelimit')
+
+
+def client_ip(request):
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def hit(scope, identifier, window):
+    """Count one event in the current window; returns the count so far"""
+    key = KEY.format(scope, identifier)
+    # add() only creates the counter (and its expiry) at the start of a window
+    cache.add(key, 0, window)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Expired between add() and incr(): this event opens a new window
+        cache.set(key, 1, window)
+        return 1
+
+
+def count(scope, identifier):
+    """Events counted in the current window"""
+    return cache.get(KEY.format(scope, identifier), 0)
+
+
+def reset(scope, identifier):
+    cache.delete(KEY.format(scope, identifier))
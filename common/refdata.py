@@ -0,0 +1,159 @@
+"""
+Reference data cache - common/refdata.py
+Process-local copy of the tariff tables (Destination, ServiceType) used by
+pricing and by the shipment forms. Tariff grids (TariffVersion, TariffRate)
+share the same version stamp, see common/pricing.py.
+
+The tables change a few times a year, so every process keeps them in memory
+and only compares a version stamp held in the shared cache (at most every
+REFDATA_CHECK_SECONDS). Saving or deleting a row bumps the stamp, and every
+process reloads the tables on its next check.
+
+With the locmem cache backend the stamp is not shared: a change made by one
+process is not seen by the others. Each process then also reloads the
+tables every REFDATA_LOCAL_RELOAD_SECONDS, under a new local stamp.
+
+A lookup of an unknown id reloads the tables once (the row may have been
+created moments ago); ids still missing after that are remembered for
+REFDATA_MISSING_SECONDS so that they do not trigger a reload each time.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+
+from common.caching import get_cache
+from common.models import Destination, ServiceType
+
+VERSION_KEY = 'version'
+
+cache = get_cache('refdata', alias='refdata')
+
+_lock = threading.Lock()
+_state = {
+    'version': None,  # what current_version() reports
+    'stamp': None,  # value of the cached stamp when the tables were loaded
+    'checked_at': None,
+    'loaded_at': None,
+    'destinations': {},
+    'service_types': {},
+    'missing': {},  # (table, pk) -> when a reload last failed to find it
+}
+
+
+def bump_version():
+    """Invalidate the reference data of every process"""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # No stamp in the shared cache yet (or it was evicted): start a new one
+        cache.set(VERSION_KEY, time.time_ns(), None)
+    with _lock:
+        _state['checked_at'] = None
+
+
+def _shared_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def _expired():
+    # The stamp only covers this process: reload on a timer as well
+    loaded_at = _state['loaded_at']
+    return not cache.shared and (
+        loaded_at is None or time.monotonic() - loaded_at >= getattr(settings, 'REFDATA_LOCAL_RELOAD_SECONDS', 30)
+    )
+
+
+def _load(stamp):
+    # Timed reloads keep the same stamp: each gets its own version, so pricing recompiles its grids
+    version = stamp if cache.shared else (stamp, time.time_ns())
+    destinations = {destination.pk: destination for destination in Destination.objects.all()}
+    service_types = {service_type.pk: service_type for service_type in ServiceType.objects.all()}
+    now = time.monotonic()
+    with _lock:
+        _state.update(
+            version=version,
+            stamp=stamp,
+            checked_at=now,
+            loaded_at=now,
+            destinations=destinations,
+            service_types=service_types,
+            missing={},
+        )
+
+
+def _tables(force=False):
+    checked_at = _state['checked_at']
+    interval = getattr(settings, 'REFDATA_CHECK_SECONDS', 2)
+    if force or checked_at is None or time.monotonic() - checked_at >= interval:
+        stamp = _shared_version()
+        if force or stamp != _state['stamp'] or _expired():
+            _load(stamp)
+        else:
+            with _lock:
+                _state['checked_at'] = time.monotonic()
+    return _state
+
+
+def current_version():
+    """Version stamp of the reference data currently loaded in this process"""
+    return _tables()['version']
+
+
+def _missing(table, pk):
+    # Unknown ids stay unknown for REFDATA_MISSING_SECONDS (or until the tables change)
+    missed_at = _state['missing'].get((table, pk))
+    return missed_at is not None and time.monotonic() - missed_at < getattr(settings, 'REFDATA_MISSING_SECONDS', 30)
+
+
+def _lookup(table, pks):
+    tables = _tables()
+    rows = {pk: tables[table].get(pk) for pk in set(pks)}
+    unknown = [pk for pk, row in rows.items() if row is None and pk is not None and not _missing(table, pk)]
+    if unknown:
+        # Possibly created moments ago: reload once for the whole batch before giving up
+        tables = _tables(force=True)
+        now = time.monotonic()
+        with _lock:
+            for pk in unknown:
+                rows[pk] = tables[table].get(pk)
+                if rows[pk] is None:
+                    tables['missing'][(table, pk)] = now
+    return rows
+
+
+def get_destinations(pks):
+    """Destinations by primary key, {pk: Destination or None}, with at most one reload"""
+    return _lookup('destinations', pks)
+
+
+def get_service_types(pks):
+    """Service types by primary key, {pk: ServiceType or None}, with at most one reload"""
+    return _lookup('service_types', pks)
+
+
+def get_destination(pk):
+    """Destination by primary key from the in-memory table (None if unknown)"""
+    return get_destinations([pk])[pk]
+
+
+def get_service_type(pk):
+    """Service type by primary key from the in-memory table (None if unknown)"""
+    return get_service_types([pk])[pk]
+
+
+def active_destinations():
+    """Active destinations in model ordering (country, city)"""
+    destinations = [d for d in _tables()['destinations'].values() if d.is_active]
+    return sorted(destinations, key=lambda d: (d.country, d.city))
+
+
+def active_service_types():
+    """Active service types in model ordering (name)"""
+    service_types = [s for s in _tables()['service_types'].values() if s.is_active]
+    return sorted(service_types, key=lambda s: s.name)
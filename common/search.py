@@ -0,0 +1,206 @@
+"""
+Full-text search - common/search.py
+Ranked prefix search over clients, shipments and claims.
+
+On SQLite the text columns are indexed in FTS5 tables (migration
+0011_search_index): external content tables over clients, shipments and
+claims, kept in sync by triggers on those tables, so every write through the
+ORM or raw SQL is indexed in the same transaction. Queries are split into
+words and each word matches as a prefix ("alg ex" finds "Algiers Express");
+results are ranked by bm25 with the identifying columns weighted highest.
+Prefixes of 2 to 4 characters have their own index entries, so a search
+reads only the matching rows however large the table.
+
+Other databases have no FTS5 tables and fall back to icontains lookups.
+`python manage.py rebuild_search_index` rebuilds the tables from scratch.
+
+SQLite drops the triggers of a table when a migration rebuilds it (most
+AlterField and RemoveField operations on clients, shipments or claims): the
+index then silently stops following writes. A system check
+(common/checks.py, run by migrate and `check --database default`) reports
+missing triggers, and rebuild_search_index recreates them.
+"""
+
+import re
+from collections import namedtuple
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from common.models import Claim, Client, Shipment
+
+MAX_TERMS = 8
+SCOPED_WINDOW = 10  # Filtered searches: ranked hits read per result wanted (growing tenfold per pass)
+
+# Columns are those of the FTS5 table, in its order; weights are the bm25 column weights
+SearchIndex = namedtuple('SearchIndex', ['table', 'columns', 'weights'])
+
+INDEXES = {
+    Client: SearchIndex(
+        'search_clients',
+        ('client_id', 'name', 'email', 'phone', 'city'),
+        (10.0, 5.0, 3.0, 3.0, 1.0)
+    ),
+    Shipment: SearchIndex(
+        'search_shipments',
+        ('shipment_number', 'recipient_name', 'sender_name', 'recipient_address', 'sender_address', 'description'),
+        (10.0, 5.0, 3.0, 2.0, 1.0, 1.0)
+    ),
+    Claim: SearchIndex(
+        'search_claims',
+        ('claim_number', 'subject', 'description'),
+        (10.0, 3.0, 1.0)
+    ),
+}
+
+
+def terms(query):
+    """Words of a search query (at most MAX_TERMS)"""
+    return re.findall(r'\w+', query or '')[:MAX_TERMS]
+
+
+def match_expression(query):
+    """FTS5 MATCH expression: every word as a quoted prefix, all required"""
+    return ' '.join(f'"{term}"*' for term in terms(query))
+
+
+def _uses_fts():
+    return connection.vendor == 'sqlite'
+
+
+def _rank_sql(index):
+    weights = ', '.join(str(weight) for weight in index.weights)
+    return f'bm25({index.table}, {weights})'
+
+
+def _contains(queryset, index, query):
+    # Fallback without FTS5: every word somewhere in the indexed columns
+    for term in terms(query):
+        condition = Q()
+        for column in index.columns:
+            condition |= Q(**{f'{column}__icontains': term})
+        queryset = queryset.filter(condition)
+    return queryset
+
+
+def matching(queryset, query):
+    """
+    The rows of a queryset matching a search query, keeping its ordering
+    (for paginated lists). An empty query matches everything.
+    """
+    index = INDEXES[queryset.model]
+    match = match_expression(query)
+    if not match:
+        return queryset
+    if not _uses_fts():
+        return _contains(queryset, index, query)
+    return queryset.filter(
+        pk__in=RawSQL(f'SELECT rowid FROM {index.table} WHERE {index.table} MATCH %s', [match])
+    )
+
+
+def search(queryset, query, limit=20):
+    """Best `limit` matches of a search query within a queryset, ranked (list)"""
+    index = INDEXES[queryset.model]
+    match = match_expression(query)
+    if not match:
+        return []
+    if not _uses_fts():
+        return list(_contains(queryset, index, query).order_by('-pk')[:limit])
+
+    if queryset.query.where:
+        # Filtered (e.g. one client's shipments): when few rows pass the filters,
+        # rank just those; otherwise matches are common enough to be found by
+        # reading down the overall ranking
+        candidates = list(matching(queryset, query).values_list('pk', flat=True)[:limit * SCOPED_WINDOW + 1])
+        if len(candidates) <= limit * SCOPED_WINDOW:
+            return _fetch_ranked(queryset, _ranked_ids(index, match, limit, among=candidates))
+
+    # The index ranks and limits on its own, then only the hits are fetched,
+    # reading further down the ranking while the filters reject too many
+    window = limit if not queryset.query.where else limit * SCOPED_WINDOW
+    offset = 0
+    results = []
+    while len(results) < limit:
+        ids = _ranked_ids(index, match, window, offset)
+        results.extend(_fetch_ranked(queryset, ids))
+        if len(ids) < window:
+            break
+        offset += window
+        window *= SCOPED_WINDOW
+    return results[:limit]
+
+
+def _ranked_ids(index, match, limit, offset=0, among=None):
+    """Row ids of the best matches, optionally only among the given ids"""
+    params = [match]
+    restriction = ''
+    if among is not None:
+        if not among:
+            return []
+        restriction = f" AND rowid IN ({', '.join(['%s'] * len(among))})"
+        params.extend(among)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {index.table} WHERE {index.table} MATCH %s{restriction} '
+            f'ORDER BY {_rank_sql(index)} LIMIT %s OFFSET %s',
+            params + [limit, offset]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _fetch_ranked(queryset, ids):
+    found = queryset.in_bulk(ids)
+    return [found[pk] for pk in ids if pk in found]
+
+
+def _trigger_sql(model, index):
+    """Trigger name -> CREATE TRIGGER statement keeping an index in sync with its table"""
+    content = model._meta.db_table
+    cols = ', '.join(index.columns)
+    new = ', '.join(f'new.{column}' for column in index.columns)
+    old = ', '.join(f'old.{column}' for column in index.columns)
+    insert = f"INSERT INTO {index.table}(rowid, {cols}) VALUES (new.id, {new});"
+    delete = f"INSERT INTO {index.table}({index.table}, rowid, {cols}) VALUES ('delete', old.id, {old});"
+    return {
+        f'{index.table}_ai': f"CREATE TRIGGER {index.table}_ai AFTER INSERT ON {content} BEGIN {insert} END",
+        f'{index.table}_ad': f"CREATE TRIGGER {index.table}_ad AFTER DELETE ON {content} BEGIN {delete} END",
+        f'{index.table}_au': f"CREATE TRIGGER {index.table}_au AFTER UPDATE OF {cols} ON {content} "
+                             f"BEGIN {delete} {insert} END",
+    }
+
+
+def missing_triggers():
+    """Trigger name -> CREATE statement of the sync triggers missing from existing FTS5 tables"""
+    if not _uses_fts():
+        return {}
+    tables = set(connection.introspection.table_names())
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+        triggers = {row[0] for row in cursor.fetchall()}
+    missing = {}
+    for model, index in INDEXES.items():
+        if index.table in tables:
+            missing.update({
+                name: sql for name, sql in _trigger_sql(model, index).items() if name not in triggers
+            })
+    return missing
+
+
+def rebuild(optimize=False):
+    """
+    Rebuild the FTS5 tables from their content tables (and merge their
+    segments), recreating missing sync triggers first
+    """
+    if not _uses_fts():
+        return []
+    tables = [index.table for index in INDEXES.values()]
+    with connection.cursor() as cursor:
+        for sql in missing_triggers().values():
+            cursor.execute(sql)
+        for table in tables:
+            cursor.execute(f"INSERT INTO {table}({table}) VALUES ('rebuild')")
+            if optimize:
+                cursor.execute(f"INSERT INTO {table}({table}) VALUES ('optimize')")
+    return tables
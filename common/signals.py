@@ -0,0 +1,147 @@
+"""
+Signal handlers - common/signals.py
+Connected in CommonConfig.ready()
+"""
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from common import client_stats, eta, geofence, ledger, refdata, tour_counters, tracking, typeahead
+from common.models import (
+    Client, ClientStats, Destination, Invoice, Payment, ServiceType, Shipment, TariffRate, TariffVersion,
+    TourShipment, TrackingEvent
+)
+from common.pubsub import broker, shipment_topic
+
+
+def tracking_event_payload(event):
+    return {
+        'id': event.id,
+        'status': event.status,
+        'location': event.location,
+        'notes': event.notes,
+        'timestamp': event.timestamp.isoformat(),
+    }
+
+
+@receiver(post_save, sender=TrackingEvent, dispatch_uid='publish_tracking_event')
+def publish_tracking_event(sender, instance, created, **kwargs):
+    """Push new tracking events to the shipment's live tracking streams"""
+    if created:
+        topic = shipment_topic(instance.shipment_id)
+        payload = tracking_event_payload(instance)
+        transaction.on_commit(lambda: broker.publish(topic, 'tracking', payload, event_id=payload['id']))
+
+
+@receiver(post_save, sender=Shipment, dispatch_uid='public_tracking_shipment_saved')
+@receiver(post_save, sender=TrackingEvent, dispatch_uid='public_tracking_event_saved')
+@receiver(post_delete, sender=TrackingEvent, dispatch_uid='public_tracking_event_deleted')
+def refresh_public_tracking(sender, instance, **kwargs):
+    """Rewrite the cached public tracking payload of the shipment"""
+    shipment_id = instance.pk if sender is Shipment else instance.shipment_id
+    transaction.on_commit(lambda: tracking.refresh(shipment_id))
+
+
+@receiver(post_delete, sender=Shipment, dispatch_uid='public_tracking_shipment_deleted')
+def forget_public_tracking(sender, instance, **kwargs):
+    number = instance.shipment_number
+    transaction.on_commit(lambda: tracking.forget(number))
+
+
+@receiver(post_save, sender=Destination, dispatch_uid='refdata_destination_saved')
+@receiver(post_delete, sender=Destination, dispatch_uid='refdata_destination_deleted')
+@receiver(post_save, sender=ServiceType, dispatch_uid='refdata_service_type_saved')
+@receiver(post_delete, sender=ServiceType, dispatch_uid='refdata_service_type_deleted')
+@receiver(post_save, sender=TariffVersion, dispatch_uid='refdata_tariff_version_saved')
+@receiver(post_delete, sender=TariffVersion, dispatch_uid='refdata_tariff_version_deleted')
+@receiver(post_save, sender=TariffRate, dispatch_uid='refdata_tariff_rate_saved')
+@receiver(post_delete, sender=TariffRate, dispatch_uid='refdata_tariff_rate_deleted')
+def refresh_reference_data(sender, **kwargs):
+    """Tariff tables changed: every process reloads its reference data cache"""
+    transaction.on_commit(refdata.bump_version)
+
+
+@receiver(post_save, sender=Shipment, dispatch_uid='typeahead_shipment_saved')
+@receiver(post_save, sender=Client, dispatch_uid='typeahead_client_saved')
+@receiver(post_save, sender=Invoice, dispatch_uid='typeahead_invoice_saved')
+def refresh_typeahead(sender, instance, **kwargs):
+    """Keep this process's code autocomplete index current (others catch up on their next sync)"""
+    transaction.on_commit(lambda: typeahead.refresh(instance))
+
+
+@receiver(post_delete, sender=Shipment, dispatch_uid='typeahead_shipment_deleted')
+@receiver(post_delete, sender=Client, dispatch_uid='typeahead_client_deleted')
+@receiver(post_delete, sender=Invoice, dispatch_uid='typeahead_invoice_deleted')
+def forget_typeahead(sender, instance, **kwargs):
+    code = getattr(instance, typeahead.SOURCES[sender].code_field)
+    transaction.on_commit(lambda: typeahead.forget(sender, code))
+
+
+@receiver(post_save, sender=TourShipment, dispatch_uid='tour_counters_stop_saved')
+def count_tour_shipment(sender, instance, created, **kwargs):
+    """Add a shipment assigned to a tour to the tour's counters"""
+    if created:
+        tour_counters.shipment_added(instance.tour_id, instance.shipment)
+
+
+@receiver(post_delete, sender=TourShipment, dispatch_uid='tour_counters_stop_deleted')
+def uncount_tour_shipment(sender, instance, **kwargs):
+    tour_counters.shipment_removed(instance.tour_id, instance.shipment)
+
+
+@receiver(post_save, sender=TourShipment, dispatch_uid='geofence_stop_saved')
+@receiver(post_delete, sender=TourShipment, dispatch_uid='geofence_stop_deleted')
+def reload_tour_stops(sender, instance, **kwargs):
+    """The tour's stops changed: the geofence and the ETA plan are rebuilt (in every process)"""
+    tour_id = instance.tour_id
+    transaction.on_commit(lambda: geofence.invalidate_tour(tour_id))
+    transaction.on_commit(lambda: eta.invalidate_plan(tour_id))
+
+
+@receiver(post_save, sender=Shipment, dispatch_uid='shipment_counters_saved')
+def recount_shipment(sender, instance, created, **kwargs):
+    """Status, weight or volume changes update the tour counters and the client statistics"""
+    previous = None if created else getattr(instance, '_counted', None)
+    # Values as saved: the next save of this instance is compared with them
+    instance._counted = {'status': instance.status, 'weight': instance.weight, 'volume': instance.volume}
+    tour_counters.shipment_saved(instance, previous)
+    client_stats.shipment_saved(instance, created, previous)
+
+
+@receiver(post_delete, sender=Shipment, dispatch_uid='client_stats_shipment_deleted')
+def uncount_shipment(sender, instance, **kwargs):
+    client_stats.shipment_deleted(instance)
+
+
+@receiver(post_save, sender=Invoice, dispatch_uid='client_stats_invoice_saved')
+def recount_invoice(sender, instance, created, **kwargs):
+    """Invoice amounts and status (payments save their invoice) update the client statistics"""
+    client_stats.invoice_saved(instance, created)
+
+
+@receiver(post_delete, sender=Invoice, dispatch_uid='client_stats_invoice_deleted')
+def uncount_invoice(sender, instance, **kwargs):
+    client_stats.invoice_deleted(instance)
+
+
+@receiver(post_save, sender=Invoice, dispatch_uid='ledger_invoice_saved')
+def post_invoice(sender, instance, **kwargs):
+    """Record invoice and payment changes (payments save their invoice) in the client's ledger"""
+    ledger.invoice_saved(instance)
+
+
+@receiver(pre_delete, sender=Invoice, dispatch_uid='ledger_invoice_deleted')
+def reverse_invoice(sender, instance, **kwargs):
+    ledger.invoice_deleted(instance)
+
+
+@receiver(pre_delete, sender=Payment, dispatch_uid='ledger_payment_deleted')
+def reverse_payment(sender, instance, **kwargs):
+    ledger.payment_deleted(instance)
+
+
+@receiver(post_save, sender=Client, dispatch_uid='client_stats_client_saved')
+def create_client_stats(sender, instance, created, **kwargs):
+    if created:
+        ClientStats.objects.get_or_create(client=instance)
@@ -0,0 +1,149 @@
+"""
+Stale-while-revalidate cache - common/swr.py
+Cache helper for values that are expensive to compute (manager analytics).
+
+Each entry has a soft and a hard TTL. Until the soft TTL an entry is fresh.
+Between the soft and the hard TTL it is still served, but the first request
+to see it stale starts one background recomputation: a lock key in the cache
+lets a single process run it, and the other requests keep getting the stale
+value. After the hard TTL the entry is gone and requests wait for a new one.
+
+Concurrent misses on a key are coalesced (singleflight): within a process
+the first thread computes and the others wait for its result, and the lock
+key makes other processes wait for the entry to appear instead of
+recomputing it too.
+"""
+
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY = '{}:computing'
+
+_lock = threading.Lock()
+_flights = {}  # (alias, namespace, key) -> _Flight
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class _Flight:
+    """One computation in progress in this process, shared by the threads waiting for it"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+def _singleflight(flight_key, compute):
+    with _lock:
+        flight = _flights.get(flight_key)
+        leader = flight is None
+        if leader:
+            flight = _flights[flight_key] = _Flight()
+
+    if not leader:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    try:
+        flight.value = compute()
+        return flight.value
+    except Exception as error:
+        flight.error = error
+        raise
+    finally:
+        with _lock:
+            del _flights[flight_key]
+        flight.done.set()
+
+
+def _store(cache, key, value, soft_ttl, hard_ttl):
+    cache.set(key, (value, time.time() + soft_ttl), hard_ttl)
+    return value
+
+
+def _fill(cache, key, compute, soft_ttl, hard_ttl):
+    """Compute a missing entry, or wait for the process already computing it"""
+    lock_key = LOCK_KEY.format(key)
+    if not cache.add(lock_key, True, _setting('SWR_LOCK_SECONDS', 60)):
+        deadline = time.monotonic() + _setting('SWR_WAIT_SECONDS', 10)
+        while time.monotonic() < deadline:
+            time.sleep(_setting('SWR_POLL_SECONDS', 0.1))
+            entry = cache.get(key)
+            if entry is not None:
+                return entry[0]
+        # The other computation is too slow (or died): compute it here as well
+    try:
+        return _store(cache, key, compute(), soft_ttl, hard_ttl)
+    finally:
+        cache.delete(lock_key)
+
+
+def _revalidate(cache, key, compute, soft_ttl, hard_ttl):
+    """Background recomputation of an entry (the caller holds the lock key)"""
+    try:
+        _singleflight(
+            (cache.alias, cache.namespace, key),
+            lambda: _store(cache, key, compute(), soft_ttl, hard_ttl)
+        )
+    except Exception:
+        logger.exception("Recomputing cache entry %s:%s failed", cache.namespace, key)
+    finally:
+        cache.delete(LOCK_KEY.format(key))
+        # This thread's database connections are not managed by a request
+        connections.close_all()
+
+
+def _schedule(cache, key, compute, soft_ttl, hard_ttl):
+    """Start a background recomputation, unless one is already running somewhere"""
+    if cache.add(LOCK_KEY.format(key), True, _setting('SWR_LOCK_SECONDS', 60)):
+        threading.Thread(
+            target=_revalidate,
+            args=(cache, key, compute, soft_ttl, hard_ttl),
+            name=f'swr-{cache.namespace}-{key}',
+            daemon=True
+        ).start()
+
+
+def get_or_compute(cache, key, compute, soft_ttl, hard_ttl):
+    """
+    Cached value of `key` on a common.caching cache, calling `compute()` (no
+    arguments, result picklable) when it is missing. Stale values (older than
+    soft_ttl seconds) are returned while they are recomputed in the background.
+    """
+    entry = cache.get(key)
+    if entry is not None:
+        value, fresh_until = entry
+        if time.time() >= fresh_until:
+            _schedule(cache, key, compute, soft_ttl, hard_ttl)
+        return value
+
+    return _singleflight(
+        (cache.alias, cache.namespace, key),
+        lambda: _fill(cache, key, compute, soft_ttl, hard_ttl)
+    )
+
+
+def get_or_schedule(cache, key, compute, soft_ttl, hard_ttl):
+    """
+    Like get_or_compute(), but a missing value is computed in the background
+    too: returns None until it is available.
+    """
+    entry = cache.get(key)
+    if entry is None:
+        _schedule(cache, key, compute, soft_ttl, hard_ttl)
+        return None
+    value, fresh_until = entry
+    if time.time() >= fresh_until:
+        _schedule(cache, key, compute, soft_ttl, hard_ttl)
+    return value
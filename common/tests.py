@@ -1,3 +1,1409 @@
-from django.test import TestCase
+import asyncio
+import csv
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core import signing
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Q
+from django.http import QueryDict
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from authentication import tokens
+from common import (
+    archive, cache_backends, caching, checks, client_stats, counting, eta, geofence, ledger, pricing, pubsub, refdata,
+    search, swr, tour_counters, trips, typeahead
+)
+from common.caching import get_cache
+from common.hot_queries import HOT_QUERIES
+from common.models import (
+    ArchivedTrackingEvent, AuditLog, Client, ClientStats, DeliveryTour, Destination, Driver, Invoice, InvoiceLine,
+    LedgerEntry, LocationPing, Payment, ServiceType, Shipment, TariffRate, TariffVersion, TourShipment,
+    TrackingEvent, Vehicle
+)
+from common.pagination import CURSOR_PARAM, CURSOR_SALT, CursorPaginator
+from common.projections import include, project
+
+
+def reset_caches():
+    """Test databases reuse primary keys: drop what the caches remember about previous tests"""
+    for cache in caches.all():
+        cache.clear()
+    # Process-local copies are otherwise only compared with their stamps every few seconds
+    refdata.bump_version()
+    tokens._denylist['checked_at'] = None
+    typeahead._state['loaded_at'] = None
+
+
+def make_shipment(fixtures, **fields):
+    values = dict(
+        client=fixtures.client, service_type=fixtures.service_type, destination=fixtures.destination,
+        weight=Decimal('2.50'), volume=Decimal('0.100'), description='Parcel',
+        sender_name='Sender', sender_phone='0550000000', sender_address='Alger',
+        recipient_name='Recipient', recipient_phone='0660000000', recipient_address='Oran',
+    )
+    values.update(fields)
+    return Shipment.objects.create(**values)
+
+
+def make_fixtures(shipments=3, tour_status='in_progress'):
+    """A driver, vehicle, client, destination, service type and a tour carrying `shipments` shipments"""
+    reset_caches()
+    fixtures = SimpleNamespace()
+    fixtures.driver = Driver.objects.create(
+        first_name='Amine', last_name='Kaci', license_number='LIC-1', phone='0550000001',
+        email='driver@example.com', address='Alger', hire_date=date(2020, 1, 1)
+    )
+    fixtures.vehicle = Vehicle.objects.create(
+        registration_number='16-001-16', type='van', brand='Renault', model='Master',
+        capacity_kg=1000, fuel_consumption=Decimal('10.00'), purchase_date=date(2020, 1, 1)
+    )
+    fixtures.client = Client.objects.create(
+        name='Sahel Trading', email='client@example.com', phone='0550000002',
+        address='Rue 1', city='Alger', postal_code='16000'
+    )
+    fixtures.destination = Destination.objects.create(
+        code='ORN', city='Oran', zone='national', base_tariff=Decimal('100.00')
+    )
+    fixtures.service_type = ServiceType.objects.create(
+        code='STD', name='Standard', type='standard', weight_tariff=Decimal('20.00'),
+        volume_tariff=Decimal('50.00'), delivery_time_days=2
+    )
+    fixtures.tour = DeliveryTour.objects.create(
+        driver=fixtures.driver, vehicle=fixtures.vehicle, date=timezone.localdate(), status=tour_status
+    )
+    fixtures.shipments = []
+    for sequence in range(1, shipments + 1):
+        shipment = make_shipment(fixtures)
+        TourShipment.objects.create(tour=fixtures.tour, shipment=shipment, sequence=sequence)
+        fixtures.shipments.append(shipment)
+    return fixtures
+
+
+def page_queries(client, path):
+    """Queries run by a GET of `path`, once a first GET has filled the caches"""
+    response = client.get(path)
+    assert response.status_code == 200, response.status_code
+    with CaptureQueriesContext(connection) as context:
+        client.get(path)
+    return [query['sql'] for query in context.captured_queries]
+
+
+# ==================== TRIP RECONSTRUCTION ====================
+
+class TripReconstructionTests(TestCase):
+    def setUp(self):
+        self.fixtures = make_fixtures(shipments=0, tour_status='completed')
+        self.tour = self.fixtures.tour
+        self.start = timezone.now() - timedelta(hours=2)
+
+    def ping(self, minutes, latitude, longitude, accuracy=Decimal('10')):
+        return LocationPing.objects.create(
+            driver=self.fixtures.driver, tour=self.tour, latitude=Decimal(latitude), longitude=Decimal(longitude),
+            accuracy=accuracy, recorded_at=self.start + timedelta(minutes=minutes)
+        )
+
+    def test_haversine_of_one_degree_of_latitude(self):
+        distances = trips.cumulative_haversine_km([36.0, 37.0], [3.0, 3.0])
+        self.assertEqual(distances[0], 0.0)
+        self.assertAlmostEqual(distances[1], 111.19, places=1)
+
+    def test_distance_duration_and_fuel(self):
+        self.ping(0, '36.000000', '3.000000')
+        self.ping(30, '36.100000', '3.000000')
+        self.ping(60, '36.200000', '3.000000')
+
+        trip = trips.apply_trip(self.tour)
+
+        self.tour.refresh_from_db()
+        self.assertEqual(trip['ping_count'], 3)
+        self.assertEqual(self.tour.distance_km, Decimal('22.24'))
+        self.assertEqual(self.tour.duration_hours, Decimal('1.00'))
+        # 10 L/100 km
+        self.assertEqual(self.tour.fuel_consumed, Decimal('2.22'))
+
+    def test_inaccurate_pings_and_gps_jumps_are_ignored(self):
+        self.ping(0, '36.000000', '3.000000')
+        self.ping(10, '36.050000', '3.000000', accuracy=Decimal('500'))  # Inaccurate: dropped
+        self.ping(30, '36.100000', '3.000000')
+        self.ping(31, '38.000000', '3.000000')  # 211 km in a minute: not driven
+        self.ping(60, '36.200000', '3.000000')
+
+        trip = trips.reconstruct_trip(self.tour)
+
+        self.assertEqual(trip['ping_count'], 4)
+        # The way back from the jump (211 km in 29 minutes) is too fast as well
+        self.assertEqual(trip['distance_km'], Decimal('11.12'))
+
+    def test_too_few_pings(self):
+        self.ping(0, '36.000000', '3.000000')
+        self.assertIsNone(trips.apply_trip(self.tour))
+        self.tour.refresh_from_db()
+        self.assertEqual(self.tour.distance_km, Decimal('0'))
+
+    def test_backfill_command_only_updates_tours_without_distance(self):
+        self.ping(0, '36.000000', '3.000000')
+        self.ping(60, '36.100000', '3.000000')
+        measured = DeliveryTour.objects.create(
+            driver=self.fixtures.driver, vehicle=self.fixtures.vehicle, date=timezone.localdate(),
+            status='completed', distance_km=Decimal('5.00')
+        )
+
+        call_command('backfill_trips', workers=1, stdout=StringIO())
+
+        self.tour.refresh_from_db()
+        measured.refresh_from_db()
+        self.assertEqual(self.tour.distance_km, Decimal('11.12'))
+        self.assertEqual(measured.distance_km, Decimal('5.00'))
+
+
+# ==================== GEOFENCE ====================
+
+STOP = (36.75, 3.05)
+
+
+def north_of_stop(metres):
+    return STOP[0] + metres / 111195, STOP[1]
+
+
+class TourGeofenceTests(SimpleTestCase):
+    def setUp(self):
+        self.geofence = geofence.TourGeofence(1, [
+            {'id': 10, 'shipment_id': 100, 'latitude': STOP[0], 'longitude': STOP[1], 'geofence_radius': 150,
+             'arrived_at': None},
+            {'id': 11, 'shipment_id': 101, 'latitude': 36.80, 'longitude': 3.10, 'geofence_radius': 150,
+             'arrived_at': None},
+        ])
+
+    def ping(self, metres):
+        return self.geofence.update(*north_of_stop(metres))
+
+    def test_arrival_needs_consecutive_pings_inside(self):
+        self.assertEqual(self.ping(50), ([], []))
+        # A ping outside the radius restarts the debounce
+        self.assertEqual(self.ping(400), ([], []))
+        self.assertEqual(self.ping(50), ([], []))
+        self.assertEqual(self.geofence.streaks(), ({10: 1}, {}))
+        self.assertEqual(self.ping(100), ([(10, 100)], []))
+        self.assertEqual(self.geofence.streaks(), ({}, {}))
+
+    def test_departure_hysteresis(self):
+        self.ping(50)
+        self.ping(50)
+
+        # Between the radius and the exit radius (x1.25): still at the stop
+        for _ in range(3):
+            self.assertEqual(self.ping(170), ([], []))
+        self.assertEqual(self.ping(200), ([], []))
+        self.assertEqual(self.ping(200), ([], [(10, 100)]))
+        # A departed stop is done: it never fires again
+        self.assertEqual(self.geofence.stop_ids.tolist(), [11])
+        self.ping(0)
+        self.assertEqual(self.ping(0), ([], []))
+
+    def test_streaks_restored_in_another_process(self):
+        self.ping(50)
+        entering, leaving = self.geofence.streaks()
+
+        other = geofence.TourGeofence(1, [
+            {'id': 10, 'shipment_id': 100, 'latitude': STOP[0], 'longitude': STOP[1], 'geofence_radius': 150,
+             'arrived_at': None},
+        ])
+        other.restore(entering, leaving)
+        self.assertEqual(other.update(*north_of_stop(50)), ([(10, 100)], []))
+
+
+class ProcessPingTests(TestCase):
+    def setUp(self):
+        self.fixtures = make_fixtures(shipments=0)
+        self.tour = self.fixtures.tour
+        self.stop = self.add_stop(1, recipient_latitude=Decimal('36.750000'), recipient_longitude=Decimal('3.050000'))
+        geofence._compiled.clear()
+
+    def add_stop(self, sequence, **fields):
+        shipment = make_shipment(self.fixtures, **fields)
+        with self.captureOnCommitCallbacks(execute=True):
+            return TourShipment.objects.create(tour=self.tour, shipment=shipment, sequence=sequence)
+
+    def ping(self, metres):
+        latitude, longitude = north_of_stop(metres)
+        with self.captureOnCommitCallbacks(execute=True):
+            return geofence.process_ping(self.fixtures.driver.pk, latitude, longitude, timezone.now(), self.tour.pk)
+
+    def test_stops_take_the_delivery_address_coordinates(self):
+        other = self.add_stop(2)
+
+        self.assertEqual((self.stop.latitude, self.stop.longitude), (Decimal('36.750000'), Decimal('3.050000')))
+        # No coordinates of its own: not geofenced, even when pinging from its destination
+        self.assertEqual((other.latitude, other.longitude), (None, None))
+        self.assertEqual(geofence.TourGeofence.load(self.tour.pk).stop_ids.tolist(), [self.stop.pk])
+
+    def test_arrival_and_departure_events(self):
+        self.assertEqual(self.ping(50), [])
+        self.assertEqual(self.ping(50), [(self.stop.shipment_id, geofence.ARRIVED_STATUS)])
+        self.stop.refresh_from_db()
+        self.assertIsNotNone(self.stop.arrived_at)
+
+        self.assertEqual(self.ping(300), [])
+        self.assertEqual(self.ping(300), [(self.stop.shipment_id, geofence.DEPARTED_STATUS)])
+        events = TrackingEvent.objects.filter(shipment=self.stop.shipment).order_by('id')
+        self.assertEqual(
+            list(events.values_list('status', flat=True)), [geofence.ARRIVED_STATUS, geofence.DEPARTED_STATUS]
+        )
+
+    def test_debounce_state_is_shared_between_processes(self):
+        with self.assertNumQueries(1):
+            self.ping(50)
+        with self.assertNumQueries(0):
+            self.ping(400)
+            self.ping(50)
+
+        # Another process: compiles the stops once, then continues the streak from the shared cache
+        geofence._compiled.clear()
+        self.assertEqual(self.ping(50), [(self.stop.shipment_id, geofence.ARRIVED_STATUS)])
+
+    def test_stop_changes_recompile_every_process(self):
+        self.ping(50)
+        compiled = geofence._compiled[self.tour.pk]
+
+        # Saved by another process: this one only sees the version stamp move
+        with mock.patch.dict(geofence._compiled):
+            self.stop.latitude = Decimal('36.760000')
+            with self.captureOnCommitCallbacks(execute=True):
+                self.stop.save()
+        self.assertIs(geofence._compiled[self.tour.pk], compiled)
+
+        self.assertEqual(self.ping(50), [])
+        self.assertIsNot(geofence._compiled[self.tour.pk], compiled)
+        self.assertEqual(self.ping(0), [])
+
+
+# ==================== LIVE ETA ====================
+
+@override_settings(
+    ETA_DEFAULT_SPEED_KMH=30, ETA_DEFAULT_SERVICE_MINUTES=5, ETA_ROAD_FACTOR=1.3, ETA_MIN_RECOMPUTE_SECONDS=30
+)
+class EtaTests(TestCase):
+    def setUp(self):
+        self.fixtures = make_fixtures(shipments=0)
+        self.tour = self.fixtures.tour
+        self.driver_id = self.fixtures.driver.pk
+        self.stops = [self.add_stop(sequence, latitude) for sequence, latitude in ((1, '36.80'), (2, '36.85'))]
+        self.now = timezone.now()
+        eta._last_run.clear()
+
+    def add_stop(self, sequence, latitude=None):
+        coordinates = {}
+        if latitude is not None:
+            coordinates = dict(recipient_latitude=Decimal(latitude), recipient_longitude=Decimal('3.05'))
+        shipment = make_shipment(self.fixtures, **coordinates)
+        with self.captureOnCommitCallbacks(execute=True):
+            return TourShipment.objects.create(tour=self.tour, shipment=shipment, sequence=sequence)
+
+    def compute(self):
+        return eta.compute_tour_etas(self.tour.pk, self.driver_id, 36.75, 3.05, self.now)
+
+    def test_compute_tour_etas(self):
+        unplaced = self.add_stop(3)
+
+        etas = self.compute()
+
+        cumulative_km = trips.cumulative_haversine_km([36.75, 36.80, 36.85], [3.05] * 3)
+        first, second = (self.stops[0].shipment_id, self.stops[1].shipment_id)
+        self.assertEqual(list(etas), [first, second])
+        self.assertAlmostEqual(
+            (etas[first]['eta'] - self.now).total_seconds(), cumulative_km[1] * 1.3 / 30 * 3600, places=3
+        )
+        # The second stop also waits for the service time of the first one
+        self.assertAlmostEqual(
+            (etas[second]['eta'] - self.now).total_seconds(), cumulative_km[2] * 1.3 / 30 * 3600 + 300, places=3
+        )
+        self.assertEqual(etas[second]['stops_before'], 1)
+        self.assertEqual(eta.get_eta(second), etas[second])
+        # Stops without coordinates get no ETA
+        self.assertIsNone(eta.get_eta(unplaced.shipment_id))
+
+    def test_arrived_stop_counts_its_remaining_service_time(self):
+        self.stops[0].arrived_at = self.now - timedelta(minutes=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.stops[0].save()
+
+        etas = self.compute()
+
+        cumulative_km = trips.cumulative_haversine_km([36.75, 36.80, 36.85], [3.05] * 3)
+        self.assertAlmostEqual(
+            (etas[self.stops[1].shipment_id]['eta'] - self.now).total_seconds(),
+            cumulative_km[2] * 1.3 / 30 * 3600 + 180, places=3
+        )
+
+    def test_plan_is_cached_until_invalidated(self):
+        with self.assertNumQueries(3):  # plan, then the driver profile (tours and stops)
+            self.compute()
+        with self.assertNumQueries(0):
+            self.compute()
+
+        eta.invalidate_plan(self.tour.pk)
+        with self.assertNumQueries(1):
+            self.compute()
+        # Adding a stop invalidates the plan (after commit, in every process)
+        stop = self.add_stop(3, '36.90')
+        self.assertIn(stop.shipment_id, self.compute())
+
+    def test_closed_shipments_leave_the_plan(self):
+        self.compute()
+        delivered = self.stops[0].shipment
+        # Recomputed from the driver's last known position
+        Driver.objects.filter(pk=self.driver_id).update(
+            current_latitude=Decimal('36.75'), current_longitude=Decimal('3.05')
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Shipment.objects.filter(pk=delivered.pk).update(status='delivered')
+            etas = eta.on_shipment_status_change(delivered.pk)
+
+        self.assertEqual(list(etas), [self.stops[1].shipment_id])
+        self.assertEqual(etas[self.stops[1].shipment_id]['stops_before'], 0)
+        self.assertIsNone(eta.get_eta(delivered.pk))
+
+    def test_recompute_throttle(self):
+        self.assertIsNotNone(eta.on_location_ping(self.driver_id, self.tour.pk, 36.75, 3.05, self.now))
+        self.assertIsNone(eta.on_location_ping(self.driver_id, self.tour.pk, 36.76, 3.05, self.now))
+
+        # Another process: its own throttle is empty, the shared one still holds
+        eta._last_run.clear()
+        self.assertIsNone(eta.on_location_ping(self.driver_id, self.tour.pk, 36.76, 3.05, self.now))
+        # Arrivals and departures recompute at once
+        self.assertIsNotNone(eta.on_location_ping(self.driver_id, self.tour.pk, 36.76, 3.05, self.now, force=True))
+
+        eta.invalidate_tour(self.tour.pk)
+        self.assertIsNone(eta.get_eta(self.stops[0].shipment_id))
+        self.assertIsNotNone(eta.on_location_ping(self.driver_id, self.tour.pk, 36.77, 3.05, self.now))
+
+    def test_publishes_to_the_shipment_streams(self):
+        first, second = (self.stops[0].shipment_id, self.stops[1].shipment_id)
+        self.compute()
+        Shipment.objects.filter(pk=first).update(status='delivered')
+        eta.invalidate_plan(self.tour.pk)
+
+        with mock.patch.object(eta, 'broker') as broker:
+            broker.has_subscribers.side_effect = lambda topic: topic != pubsub.shipment_topic(second)
+            self.compute()
+
+        # The delivered shipment's stream learns it has no ETA any more; nobody watches the other one
+        broker.publish.assert_called_once_with(pubsub.shipment_topic(first), 'eta', {'shipment_id': first, 'eta': None})
+
+
+# ==================== REFERENCE DATA ====================
+
+class ReferenceDataTests(TestCase):
+    def setUp(self):
+        self.fixtures = make_fixtures(shipments=0)
+        self.destination = self.fixtures.destination
+
+    def test_cold_load_then_hits(self):
+        with self.assertNumQueries(2):
+            self.assertEqual(refdata.get_destination(self.destination.pk), self.destination)
+        with self.assertNumQueries(0):
+            self.assertEqual(refdata.get_destination(self.destination.pk), self.destination)
+            self.assertEqual(refdata.get_service_type(self.fixtures.service_type.pk), self.fixtures.service_type)
+            self.assertEqual(refdata.active_destinations(), [self.destination])
+
+    def test_unknown_ids_reload_once_per_batch(self):
+        refdata.get_destination(self.destination.pk)
+
+        with self.assertNumQueries(2):
+            destinations = refdata.get_destinations([self.destination.pk, 998, 999, 999])
+        self.assertEqual(destinations, {self.destination.pk: self.destination, 998: None, 999: None})
+        # Still missing after the reload: not looked up again for REFDATA_MISSING_SECONDS
+        with self.assertNumQueries(0):
+            self.assertIsNone(refdata.get_destination(999))
+            self.assertEqual(refdata.get_destinations([998, 999]), {998: None, 999: None})
+
+        with override_settings(REFDATA_MISSING_SECONDS=0), self.assertNumQueries(2):
+            self.assertIsNone(refdata.get_destination(999))
+
+    def test_new_row_found_by_the_reload(self):
+        refdata.get_destination(self.destination.pk)
+        # Created by another process: this one has not seen the new stamp yet
+        with mock.patch.object(refdata, 'bump_version'):
+            destination = Destination.objects.create(
+                code='CST', city='Constantine', zone='national', base_tariff=Decimal('120.00')
+            )
+
+        with self.assertNumQueries(2):
+            self.assertEqual(refdata.get_destination(destination.pk), destination)
+
+    def test_saving_a_row_reloads_the_tables(self):
+        refdata.get_destination(self.destination.pk)
+        refdata.get_destination(999)
+
+        self.destination.base_tariff = Decimal('150.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.destination.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            service_type = ServiceType.objects.create(
+                code='EXP', name='Express', type='express', weight_tariff=Decimal('30.00'),
+                volume_tariff=Decimal('60.00'), delivery_time_days=1
+            )
+
+        with self.assertNumQueries(2):
+            self.assertEqual(refdata.get_destination(self.destination.pk).base_tariff, Decimal('150.00'))
+        with self.assertNumQueries(0):
+            self.assertEqual(refdata.get_service_type(service_type.pk), service_type)
+        # The reload also forgets the ids it could not find
+        with self.assertNumQueries(2):
+            self.assertIsNone(refdata.get_destination(999))
+
+    def test_quote_batch_reloads_once_for_unknown_ids(self):
+        refdata.get_destination(self.destination.pk)
+        service_type = self.fixtures.service_type
+
+        with self.assertNumQueries(2):
+            refdata.get_destinations([997, 998, 999])
+        with mock.patch.object(refdata, '_load', wraps=refdata._load) as load:
+            amounts = pricing.quote_batch(
+                [self.destination.pk, 997, 998, 999], [service_type.pk] * 4, [Decimal('1.00')] * 4, [Decimal('0')] * 4
+            )
+        self.assertIsNotNone(amounts[0])
+        self.assertEqual(amounts[1:], [None, None, None])
+        load.assert_not_called()
+
+
+# ==================== PRICING ====================
+
+def legacy_amount(destination, service_type, weight, volume):
+    """Shipment.save() before the pricing engine, rounded to the centime like the amount column"""
+    amount = destination.base_tariff + weight * service_type.weight_tariff + volume * service_type.volume_tariff
+    return amount.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+class PricingTests(TestCase):
+    def setUp(self):
+        self.fixtures = make_fixtures(shipments=0)
+        self.destination = self.fixtures.destination
+        self.service_type = self.fixtures.service_type
+
+    def add_grid(self, effective_from, *cells):
+        version = TariffVersion.objects.create(name='Grid', effective_from=effective_from)
+        for min_weight, min_volume, base_amount, weight_tariff in cells:
+            TariffRate.objects.create(
+                version=version, zone=self.destination.zone, service_type=self.service_type,
+                min_weight=Decimal(min_weight), min_volume=Decimal(min_volume), base_amount=Decimal(base_amount),
+                weight_tariff=Decimal(weight_tariff), volume_tariff=Decimal('10.00')
+            )
+        # What the signals do on commit
+        refdata.bump_version()
+        return version
+
+    def test_without_grid_matches_the_legacy_formula(self):
+        rng = random.Random(32)
+        self.destination.base_tariff = Decimal('137.35')
+        self.destination.save()
+        self.service_type.weight_tariff = Decimal('19.99')
+        self.service_type.volume_tariff = Decimal('49.95')
+        self.service_type.save()
+        refdata.bump_version()
+        weights = [Decimal(rng.randint(1, 500000)).scaleb(-2) for _ in range(200)]
+        volumes = [Decimal(rng.randint(0, 50000)).scaleb(-3) for _ in range(200)]
+
+        amounts = pricing.quote_batch(
+            [self.destination.pk] * 200, [self.service_type.pk] * 200, weights, volumes
+        )
+
+        for weight, volume, amount in zip(weights, volumes, amounts):
+            self.assertEqual(amount, legacy_amount(self.destination, self.service_type, weight, volume))
+            self.assertEqual(amount, pricing.quote(self.destination.pk, self.service_type.pk, weight, volume))
+
+    def test_shipment_save_prices_like_before(self):
+        shipment = make_shipment(self.fixtures, weight=Decimal('12.35'), volume=Decimal('0.257'))
+        shipment.refresh_from_db()
+        self.assertEqual(
+            shipment.amount,
+            legacy_amount(self.destination, self.service_type, Decimal('12.35'), Decimal('0.257'))
+        )
+
+    def test_grid_cells_apply_from_their_breaks_and_effective_date(self):
+        now = timezone.now()
+        self.add_grid(
+            now - timedelta(days=1),
+            ('0', '0', '80.00', '15.00'),
+            ('10', '0', '60.00', '12.00'),
+        )
+        self.add_grid(now + timedelta(days=1), ('0', '0', '999.00', '0.00'))  # + 1 DA for 0.1 m³
+
+        # 5 kg: first cell; 10 kg: the 10 kg break; both + 0.1 m³ at 10 DA/m³
+        self.assertEqual(pricing.quote(self.destination.pk, self.service_type.pk, '5', '0.1'), Decimal('156.00'))
+        self.assertEqual(pricing.quote(self.destination.pk, self.service_type.pk, '10', '0.1'), Decimal('181.00'))
+        # Before the first version: Destination/ServiceType tariffs
+        before = now - timedelta(days=2)
+        self.assertEqual(
+            pricing.quote(self.destination.pk, self.service_type.pk, '5', '0.1', at=before),
+            legacy_amount(self.destination, self.service_type, Decimal('5'), Decimal('0.1'))
+        )
+        # The next version once it takes effect
+        later = now + timedelta(days=2)
+        self.assertEqual(pricing.quote(self.destination.pk, self.service_type.pk, '5', '0.1', at=later), Decimal('1000.00'))
+        self.assertEqual(
+            pricing.quote_batch([self.destination.pk] * 2, [self.service_type.pk] * 2, ['5', '5'], ['0.1', '0.1'],
+                                at=[before, later]),
+            [legacy_amount(self.destination, self.service_type, Decimal('5'), Decimal('0.1')), Decimal('1000.00')]
+        )
+
+    def test_unknown_references_and_negative_sizes(self):
+        self.assertEqual(pricing.quote_batch([self.destination.pk, 9999], [self.service_type.pk] * 2,
+                                             ['1', '1'], ['0', '0'])[1], None)
+        self.assertIsNone(pricing.quote(None, self.service_type.pk, '1', '0'))
+        with self.assertRaises(ValueError):
+            pricing.quote(self.destination.pk, self.service_type.pk, '-1', '0')
+
+
+class RepriceShipmentsTests(TestCase):
+    def setUp(self):
+        self.fixtures = make_fixtures(shipments=5)
+        self.shipments = self.fixtures.shipments
+        invoice = Invoice.objects.create(
+            client=self.fixtures.client, due_date=date(2030, 1, 1), tva_rate=Decimal('19.00')
+        )
+        InvoiceLine.objects.create(invoice=invoice, shipment=self.shipments[0], amount=self.shipments[0].amount)
+        # 2.5 kg: + 25 DA per shipment
+        ServiceType.objects.filter(pk=self.fixtures.service_type.pk).update(weight_tariff=Decimal('30.00'))
+        refdata.bump_version()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.report = os.path.join(directory, 'report.csv')
+
+    def reprice(self, *args):
+        call_command(
+            'reprice_shipments', '--chunk-size', '2', '--update-batch-size', '1', '--report', self.report, *args,
+            stdout=StringIO()
+        )
+        with open(self.report, newline='') as report:
+            return list(csv.DictReader(report))
+
+    def amounts(self):
+        return {shipment.pk: shipment.amount for shipment in Shipment.objects.all()}
+
+    def test_reprices_uninvoiced_shipments_and_reports_the_changes(self):
+        before = self.amounts()
+
+        rows = self.reprice()
+
+        after = self.amounts()
+        invoiced = self.shipments[0].pk
+        self.assertEqual(after[invoiced], before[invoiced])
+        for shipment in self.shipments[1:]:
+            self.assertEqual(after[shipment.pk], before[shipment.pk] + Decimal('25.00'))
+        self.assertEqual(sorted(int(row['shipment_id']) for row in rows), sorted(s.pk for s in self.shipments[1:]))
+        self.assertTrue(all(Decimal(row['delta']) == Decimal('25.00') for row in rows))
+
+        # Nothing left to change
+        self.assertEqual(self.reprice(), [])
+
+    def test_dry_run_only_writes_the_report(self):
+        before = self.amounts()
+
+        rows = self.reprice('--dry-run')
+
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(self.amounts(), before)
+
+
+# ==================== PUBLIC TRACKING ====================
+
+class PublicTrackingTests(TestCase):
+    def setUp(self):
+        self.fixtures = make_fixtures(shipments=1)
+        self.shipment = self.fixtures.shipments[0]
+        self.path = f'/api/track/{self.shipment.shipment_number.lower()}/'
+
+    def test_payload_has_the_timeline_but_no_personal_details(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            TrackingEvent.objects.create(shipment=self.shipment, status='in_transit', location='Blida', notes='Gate 4')
+
+        response = self.client.get(self.path)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('public', response['Cache-Control'])
+        payload = response.json()
+        self.assertEqual(payload['shipment_number'], self.shipment.shipment_number)
+        self.assertEqual(payload['destination'], 'Oran')
+        self.assertEqual([event['location'] for event in payload['events']], ['Blida'])
+        for detail in ('Recipient', '0660000000', 'Gate 4'):
+            self.assertNotIn(detail, response.content.decode())
+
+    def test_cached_payload_follows_new_events(self):
+        self.client.get(self.path)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            TrackingEvent.objects.create(shipment=self.shipment, status='delivered', location='Oran')
+        with self.assertNumQueries(0):
+            payload = self.client.get(self.path).json()
+
+        self.assertEqual(payload['events'][0]['status'], 'delivered')
+
+    def test_invalid_unknown_and_deleted_numbers(self):
+        self.assertEqual(self.client.get('/api/track/12345/').status_code, 400)
+        self.assertEqual(self.client.get('/api/track/EXP000000000000/').status_code, 404)
+
+        self.client.get(self.path)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shipment.delete()
+
+        self.assertEqual(self.client.get(self.path).status_code, 404)
+
+    @override_settings(PUBLIC_TRACKING_REQUESTS=2)
+    def test_requests_per_ip_are_limited(self):
+        for attempt in range(2):
+            self.assertEqual(self.client.get(self.path).status_code, 200)
+
+        response = self.client.get(self.path)
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '60')
+        self.assertEqual(self.client.get(self.path, REMOTE_ADDR='10.0.0.2').status_code, 200)
+
+
+# ==================== PUB/SUB ====================
+
+class BrokerTests(SimpleTestCase):
+    def setUp(self):
+        reset_caches()
+        self.broker = pubsub.Broker(maxsize=2)
+
+    async def test_fan_out_to_the_topic_subscribers(self):
+        first = self.broker.subscribe('shipment:1')
+        second = self.broker.subscribe('shipment:1')
+        other = self.broker.subscribe('shipment:2')
+
+        self.assertEqual(self.broker.publish('shipment:1', 'eta', {'eta': None}), 2)
+        message = {'event': 'eta', 'data': {'eta': None}, 'id': None}
+        self.assertEqual(await first.get(), message)
+        self.assertEqual(await second.get(), message)
+        await asyncio.sleep(0)
+        self.assertTrue(other.queue.empty())
+
+        self.broker.unsubscribe(first)
+        self.broker.unsubscribe(second)
+        self.assertFalse(self.broker.has_subscribers('shipment:1'))
+        self.assertEqual(self.broker.publish('shipment:1', 'eta', {}), 0)
+
+    async def test_slow_subscriber_drops_its_oldest_messages(self):
+        subscription = self.broker.subscribe('shipment:1')
+        for number in range(3):
+            self.broker.publish('shipment:1', 'tracking', {'number': number}, event_id=number + 1)
+        await asyncio.sleep(0)
+
+        self.assertEqual(subscription.dropped, 1)
+        self.assertEqual((await subscription.get())['id'], 2)
+        self.assertEqual((await subscription.get())['id'], 3)
+
+    def test_events_with_an_id_move_the_stamp(self):
+        self.assertIsNone(self.broker.stamp('shipment:1'))
+
+        self.broker.publish('shipment:1', 'tracking', {}, event_id=1)
+        stamp = self.broker.stamp('shipment:1')
+        self.assertIsNotNone(stamp)
+        # Without subscribers too: the watchers may be on another process
+        self.broker.publish('shipment:1', 'eta', {})
+        self.assertEqual(self.broker.stamp('shipment:1'), stamp)
+        self.broker.publish('shipment:1', 'tracking', {}, event_id=2)
+        self.assertNotEqual(self.broker.stamp('shipment:1'), stamp)
+        self.assertIsNone(self.broker.stamp('shipment:2'))
+
+
+# ==================== CACHE LAYER ====================
+
+@override_settings(CACHE_STATS_FLUSH_SECONDS=3600)
+class CacheLayerTests(SimpleTestCase):
+    def setUp(self):
+        reset_caches()
+        caching.reset_stats()
+
+    def test_namespaces_do_not_collide(self):
+        first = caching.NamespacedCache('first', 'default')
+        second = caching.NamespacedCache('second', 'default')
+
+        first.set('key', 1)
+        second.set('key', 2)
+
+        self.assertEqual((first.get('key'), second.get('key')), (1, 2))
+        self.assertEqual(caches['default'].get('first:key'), 1)
+        self.assertIs(get_cache('first'), get_cache('first'))
+        self.assertIsNot(get_cache('first'), get_cache('first', alias='sessions'))
+
+    def test_version_bump_drops_the_namespace(self):
+        caching.NamespacedCache('versioned', 'default').set('key', 'old shape')
+        caching.NamespacedCache('other', 'default').set('key', 'kept')
+
+        with override_settings(CACHE_NAMESPACE_VERSIONS={'versioned': 2}):
+            self.assertIsNone(caching.NamespacedCache('versioned', 'default').get('key'))
+            self.assertEqual(caching.NamespacedCache('other', 'default').get('key'), 'kept')
+
+    def test_statistics_accumulate_until_flushed(self):
+        cache = caching.NamespacedCache('counted', 'default')
+        cache.get('key')
+        cache.set('key', False)
+        self.assertIs(cache.get('key'), False)
+        cache.get_many(['key', 'missing'])
+        cache.delete('key')
+
+        # Counted in this process only until the next flush
+        self.assertIsNone(caches['default'].get(caching.STATS_KEY.format('default', 'counted', 'gets')))
+
+        totals = caching.stats()[('default', 'counted')]
+        self.assertEqual(
+            {field: totals[field] for field in ('gets', 'hits', 'misses', 'writes', 'deletes', 'operations')},
+            {'gets': 4, 'hits': 2, 'misses': 2, 'writes': 1, 'deletes': 1, 'operations': 5}
+        )
+        self.assertGreater(totals['time_ns'], 0)
+
+        # Flushes add to the shared totals
+        cache.get('key')
+        self.assertEqual(caching.stats()[('default', 'counted')]['gets'], 5)
+
+    @override_settings(CACHE_STATS_FLUSH_SECONDS=0)
+    def test_flush_runs_in_the_background_when_due(self):
+        with mock.patch.object(caching, 'flush_stats', wraps=caching.flush_stats) as flush:
+            caching.NamespacedCache('background', 'default').get('key')
+            # The flush thread releases the lock when it is done
+            self.assertTrue(caching._flushing.acquire(timeout=5))
+            caching._flushing.release()
+        flush.assert_called()
+        totals = caches['default'].get(caching.STATS_KEY.format('default', 'background', 'gets'))
+        self.assertEqual(totals, 1)
+
+    def test_evictions_counted_per_alias(self):
+        backend = cache_backends.LocMemCache('evictions-test', {
+            'KEY_PREFIX': 'evicting', 'OPTIONS': {'MAX_ENTRIES': 4, 'CULL_FREQUENCY': 2}
+        })
+        for number in range(10):
+            backend.set(f'key-{number}', number)
+
+        evictions = caching.stats()[('evicting', caching.EVICTIONS)]['evictions']
+        self.assertEqual(evictions, 10 - len(backend._cache))
+        self.assertGreater(evictions, 0)
+
+    def test_cache_stats_command(self):
+        cache = caching.NamespacedCache('reported', 'default')
+        cache.set('key', 1)
+        cache.get('key')
+        cache.get('missing')
+        caching.record_evictions('default', 3)
+
+        out = StringIO()
+        call_command('cache_stats', '--reset', stdout=out)
+
+        output = out.getvalue()
+        line = next(line for line in output.splitlines() if line.startswith('default/reported'))
+        self.assertEqual(line.split()[1:5], ['2', '50.0', '1', '0'])
+        self.assertIn('default: 3 evictions', output)
+        self.assertIn('Statistics cleared', output)
+        self.assertEqual(caching.stats(), {})
+
+
+# ==================== STALE-WHILE-REVALIDATE ====================
+
+class StaleWhileRevalidateTests(SimpleTestCase):
+    def setUp(self):
+        reset_caches()
+        self.cache = get_cache('swr-tests')
+        self.calls = 0
+        self.recomputed = threading.Event()
+
+    def compute(self, value='value', delay=0):
+        def compute():
+            time.sleep(delay)
+            self.calls += 1
+            self.recomputed.set()
+            return f'{value} {self.calls}'
+        return compute
+
+    def wait_until(self, condition):
+        # The background thread stores its result after compute() returns
+        for attempt in range(100):
+            if condition():
+                return
+            time.sleep(0.02)
+        self.fail('The background recomputation did not finish')
+
+    def test_fresh_entries_are_computed_once(self):
+        self.assertEqual(swr.get_or_compute(self.cache, 'key', self.compute(), 60, 120), 'value 1')
+        self.assertEqual(swr.get_or_compute(self.cache, 'key', self.compute(), 60, 120), 'value 1')
+        self.assertEqual(self.calls, 1)
+
+    def test_stale_entries_are_served_while_they_are_recomputed(self):
+        swr.get_or_compute(self.cache, 'key', self.compute(), 0, 120)
+        self.recomputed.clear()
+
+        self.assertEqual(swr.get_or_compute(self.cache, 'key', self.compute(), 0, 120), 'value 1')
+
+        self.assertTrue(self.recomputed.wait(5))
+        self.wait_until(lambda: self.cache.get(swr.LOCK_KEY.format('key')) is None)
+        self.assertEqual(self.cache.get('key')[0], 'value 2')
+
+    def test_concurrent_misses_compute_once(self):
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                swr.get_or_compute(self.cache, 'key', self.compute(delay=0.2), 60, 120)
+            ))
+            for thread in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, ['value 1'] * 5)
+        self.assertEqual(self.calls, 1)
+
+    def test_get_or_schedule_returns_none_until_computed(self):
+        self.assertIsNone(swr.get_or_schedule(self.cache, 'key', self.compute(), 60, 120))
+
+        self.assertTrue(self.recomputed.wait(5))
+        self.wait_until(lambda: self.cache.get('key') is not None)
+        self.assertEqual(swr.get_or_schedule(self.cache, 'key', self.compute(), 60, 120), 'value 1')
+
+    def test_failed_recomputation_keeps_the_stale_value(self):
+        swr.get_or_compute(self.cache, 'key', self.compute(), 0, 120)
+
+        def fail():
+            self.recomputed.set()
+            raise RuntimeError('analytics query failed')
+
+        self.recomputed.clear()
+        with self.assertLogs('common.swr', 'ERROR'):
+            swr.get_or_compute(self.cache, 'key', fail, 0, 120)
+            self.assertTrue(self.recomputed.wait(5))
+            self.wait_until(lambda: self.cache.get(swr.LOCK_KEY.format('key')) is None)
+
+        # Read the entry directly: a stale read would start another recomputation
+        self.assertEqual(self.cache.get('key')[0], 'value 1')
+
+
+# ==================== HOT QUERY INDEXES ====================
+
+class IndexAdvisorTests(TestCase):
+    def advise(self, *args):
+        out = StringIO()
+        call_command('index_advisor', *args, stdout=out)
+        return out.getvalue()
+
+    def test_hot_queries_use_indexes(self):
+        output = self.advise('--strict')
+
+        self.assertNotIn('FULL SCAN', output)
+        self.assertIn(f'{len(HOT_QUERIES)} hot queries on {connection.vendor}, 0 with full scans', output)
+
+    def test_unindexed_filters_are_flagged(self):
+        with mock.patch.dict(HOT_QUERIES, {'by description': lambda: Shipment.objects.filter(description='x')}):
+            self.assertIn('FULL SCAN  by description', self.advise())
+            with self.assertRaisesMessage(CommandError, 'Full table scans in: by description'):
+                self.advise('--strict')
+
+
+# ==================== CURSOR PAGINATION ====================
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        self.fixtures = make_fixtures(shipments=7)
+        # Ties on created_at: the id decides
+        moment = timezone.now()
+        Shipment.objects.filter(pk__in=[shipment.pk for shipment in self.fixtures.shipments[2:5]]).update(created_at=moment)
+        self.expected = list(Shipment.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+        self.paginator = CursorPaginator(Shipment.objects.all(), 3)
+
+    def ids(self, page):
+        return [shipment.pk for shipment in page]
+
+    def test_next_and_previous_cursors_walk_every_row_once(self):
+        pages = [self.paginator.page()]
+        while pages[-1].has_next:
+            pages.append(self.paginator.page(pages[-1].next_cursor))
+
+        self.assertEqual([pk for page in pages for pk in self.ids(page)], self.expected)
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertFalse(pages[0].has_previous)
+
+        back = self.paginator.page(pages[-1].previous_cursor)
+        self.assertEqual(self.ids(back), self.ids(pages[1]))
+        back = self.paginator.page(back.previous_cursor)
+        self.assertEqual(self.ids(back), self.ids(pages[0]))
+        self.assertFalse(back.has_previous)
+
+    def test_tampered_or_foreign_cursors_start_over(self):
+        cursor = self.paginator.page().next_cursor
+        first_page = self.expected[:3]
+
+        for bad in (cursor[:-1] + ('A' if cursor[-1] != 'A' else 'B'), 'garbage',
+                    signing.dumps(['next', [1]], salt=CURSOR_SALT),
+                    signing.dumps(['sideways', ['2020-01-01T00:00:00+00:00', 1]], salt=CURSOR_SALT),
+                    signing.dumps(['next', ['2020-01-01T00:00:00+00:00', 1]], salt='another.salt')):
+            self.assertIsNone(self.paginator.decode(bad))
+            self.assertEqual(self.ids(self.paginator.page(bad)), first_page)
+
+    def test_links_keep_the_filters(self):
+        page = self.paginator.page(query=QueryDict('status=pending&page=4'))
+
+        params = QueryDict(page.next_url[1:])
+        self.assertEqual(params['status'], 'pending')
+        self.assertNotIn('page', params)
+        self.assertEqual(self.ids(self.paginator.page(params[CURSOR_PARAM])), self.expected[3:6])
+
+    def test_cursor_past_rows_deleted_meanwhile_starts_over(self):
+        last_page = self.paginator.page(self.paginator.page(self.paginator.page().next_cursor).next_cursor)
+        cursor = self.paginator.page(last_page.previous_cursor).next_cursor
+        Shipment.objects.filter(pk=self.expected[-1]).delete()
+
+        self.assertEqual(self.ids(self.paginator.page(cursor)), self.expected[:3])
+
+
+# ==================== APPROXIMATE COUNTS ====================
+
+@override_settings(APPROX_COUNT_THRESHOLD=3, APPROX_COUNT_SAMPLE=4)
+class ApproximateCountTests(TestCase):
+    def setUp(self):
+        fixtures = make_fixtures(shipments=10)
+        Shipment.objects.filter(pk__in=[shipment.pk for shipment in fixtures.shipments[1::2]]).update(status='delivered')
+        self.delivered = Shipment.objects.filter(status='delivered')
+
+    def test_small_results_are_counted_exactly(self):
+        total = counting.count(self.delivered.filter(pk__lte=self.delivered.order_by('pk')[2].pk))
+        self.assertEqual((int(total), total.exact, str(total)), (3, True, '3'))
+        self.assertTrue(counting.count(Shipment.objects.all(), exact=True).exact)
+
+    def test_large_results_are_estimated_from_the_latest_rows(self):
+        # Do not start the background count: the estimate is what the first page shows
+        with mock.patch.object(swr, 'get_or_schedule', return_value=None):
+            total = counting.count(self.delivered)
+
+        # 2 delivered among the latest 4 shipments, out of 10
+        self.assertEqual((int(total), total.exact, str(total)), (5, False, '~5'))
+
+    @override_settings(APPROX_COUNT_SAMPLE=1)
+    def test_estimates_stay_above_the_exact_threshold(self):
+        with mock.patch.object(swr, 'get_or_schedule', return_value=None):
+            # The latest shipment is delivered: the sample holds no pending one
+            total = counting.count(Shipment.objects.filter(status='pending'))
+
+        self.assertEqual(str(total), '~4')
+
+    def test_maintained_counts_are_preferred(self):
+        counting.cache.set(counting._key(self.delivered), (42, time.time() + 60), 60)
+
+        self.assertEqual(str(counting.count(self.delivered)), '~42')
+
+    def test_request_asks_for_the_exact_count(self):
+        request = RequestFactory().get('/', {counting.EXACT_PARAM: '1'})
+
+        total = counting.request_counter(request)(self.delivered)
+
+        self.assertEqual((int(total), total.exact), (5, True))
+
+
+# ==================== FULL-TEXT SEARCH ====================
+
+@skipUnless(connection.vendor == 'sqlite', 'FTS5 search index')
+class SearchTriggerTests(TestCase):
+    def setUp(self):
+        self.fixtures = make_fixtures(shipments=0)
+
+    def found(self, query):
+        return list(search.matching(Shipment.objects.all(), query).values_list('recipient_name', flat=True))
+
+    def test_writes_are_indexed(self):
+        shipment = make_shipment(self.fixtures, recipient_name='Yasmine Belkacem')
+        self.assertEqual(self.found('belk'), ['Yasmine Belkacem'])
+
+        shipment.recipient_name = 'Karim Haddad'
+        shipment.save()
+
+        self.assertEqual(self.found('belk'), [])
+        self.assertEqual(self.found('hadd'), ['Karim Haddad'])
+
+    def test_triggers_dropped_by_a_table_rebuild_are_reported_and_recreated(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER search_shipments_ai')
+        make_shipment(self.fixtures, recipient_name='Yasmine Belkacem')
+        self.assertEqual(self.found('belk'), [])
+
+        warnings = checks.search_triggers_check(None, databases=['default'])
+        self.assertEqual([warning.id for warning in warnings], ['common.W001'])
+        self.assertIn('search_shipments_ai', warnings[0].msg)
+
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+
+        self.assertIn('Recreating missing triggers: search_shipments_ai', out.getvalue())
+        self.assertEqual(self.found('belk'), ['Yasmine Belkacem'])
+        self.assertEqual(checks.search_triggers_check(None, databases=['default']), [])
+
+
+# ==================== CODE AUTOCOMPLETE ====================
+
+class TypeaheadTests(TestCase):
+    def setUp(self):
+        self.fixtures = make_fixtures(shipments=2)
+        self.other = Client.objects.create(
+            name='Other', email='other@example.com', phone='1', address='a', city='Oran', postal_code='31000'
+        )
+        self.other_shipment = make_shipment(self.fixtures, client=self.other)
+
+    def codes(self, query, **options):
+        return [code for kind, code, pk in typeahead.suggest(query, **options)]
+
+    def test_prefixes_complete_in_order_across_kinds(self):
+        shipment_numbers = sorted(
+            shipment.shipment_number for shipment in [*self.fixtures.shipments, self.other_shipment]
+        )
+
+        self.assertEqual(self.codes('exp'), shipment_numbers)
+        self.assertEqual(self.codes(' e x p ', limit=2), shipment_numbers[:2])
+        self.assertEqual(self.codes('CLT'), sorted([self.fixtures.client.client_id, self.other.client_id]))
+        self.assertEqual(typeahead.suggest(self.other.client_id), [('client', self.other.client_id, self.other.pk)])
+        self.assertEqual(self.codes(''), [])
+
+    def test_client_suggestions_only_hold_their_own_codes(self):
+        codes = self.codes('EXP', client_id=self.other.pk)
+
+        self.assertEqual(codes, [self.other_shipment.shipment_number])
+
+    def test_rows_saved_in_this_process_are_indexed_on_commit(self):
+        self.codes('EXP')
+        with self.captureOnCommitCallbacks(execute=True):
+            shipment = make_shipment(self.fixtures)
+
+        self.assertIn(shipment.shipment_number, self.codes(shipment.shipment_number))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.is_active = False
+            self.other.save()
+            self.other_shipment.delete()
+
+        self.assertEqual(self.codes(self.other.client_id), [])
+        self.assertEqual(self.codes(self.other_shipment.shipment_number), [])
+
+    def test_rows_created_by_other_processes_are_picked_up_by_the_sync(self):
+        self.codes('EXP')
+        # No on_commit callback ran: as if another worker had saved it
+        shipment = make_shipment(self.fixtures)
+        self.assertEqual(self.codes(shipment.shipment_number), [])
+
+        typeahead._state['synced_at'] -= 60
+
+        self.assertEqual(self.codes(shipment.shipment_number), [shipment.shipment_number])
+
+    def test_old_codes_are_left_out(self):
+        Shipment.objects.filter(pk=self.other_shipment.pk).update(created_at=timezone.now() - timedelta(days=400))
+
+        self.assertNotIn(self.other_shipment.shipment_number, self.codes('EXP'))
+
+
+# ==================== LIST PROJECTIONS ====================
+
+class ProjectionTests(TestCase):
+    def setUp(self):
+        self.fixtures = make_fixtures(shipments=1)
+
+    def test_project_loads_only_the_listed_fields(self):
+        queryset = project(Shipment.objects.all(), ('shipment_number', 'client__name'))
+
+        with self.assertNumQueries(1):
+            shipment = queryset.get()
+            self.assertEqual((shipment.shipment_number, shipment.client.name), (
+                self.fixtures.shipments[0].shipment_number, 'Sahel Trading'
+            ))
+        self.assertIn('description', shipment.get_deferred_fields())
+        self.assertIn('address', shipment.client.get_deferred_fields())
+
+    def test_include_adds_fields_to_only_and_defer(self):
+        only = include(Shipment.objects.only('shipment_number'), ['created_at'])
+        deferred = include(Shipment.objects.defer('description', 'created_at'), ['created_at'])
+
+        self.assertNotIn('created_at', only.get().get_deferred_fields())
+        self.assertNotIn('created_at', deferred.get().get_deferred_fields())
+        self.assertIn('description', deferred.get().get_deferred_fields())
+        queryset = Shipment.objects.all()
+        self.assertIs(include(queryset, ['created_at']), queryset)
+
+
+# ==================== TOUR COUNTERS ====================
+
+class TourCounterTests(TestCase):
+    def setUp(self):
+        self.fixtures = make_fixtures(shipments=3)
+        self.tour = self.fixtures.tour
+
+    def stored(self):
+        return DeliveryTour.objects.filter(pk=self.tour.pk).values_list(*tour_counters.COUNTERS).get()
+
+    def counted(self):
+        tour = tour_counters.counter_values(DeliveryTour.objects.filter(pk=self.tour.pk)).get()
+        return tuple(getattr(tour, f'counted_{name}') for name in tour_counters.COUNTERS)
+
+    def reconcile(self, *args):
+        out = StringIO()
+        call_command('reconcile_tour_counters', *args, stdout=out)
+        return out.getvalue()
+
+    def test_signals_keep_the_counters_current(self):
+        first, second, third = self.fixtures.shipments
+        first.status = 'delivered'
+        first.save()
+        second.status = 'failed_delivery'
+        second.weight = Decimal('7.50')
+        second.save()
+        TourShipment.objects.filter(tour=self.tour, shipment=third).delete()
+        TourShipment.objects.create(tour=self.tour, shipment=make_shipment(self.fixtures), sequence=4)
+
+        self.assertEqual(self.stored(), (3, 1, 1, Decimal('12.50'), Decimal('0.300')))
+        self.assertEqual(self.stored(), self.counted())
+        self.assertIn('Fixed the counters of 0 tours', self.reconcile())
+
+    def test_reconcile_fixes_writes_that_bypass_the_signals(self):
+        Shipment.objects.filter(pk=self.fixtures.shipments[0].pk).update(status='delivered', weight=Decimal('1.00'))
+
+        self.assertIn(f'{self.tour.tour_number}: stored', self.reconcile('--dry-run'))
+        self.assertIn('Fixed the counters of 1 tours', self.reconcile())
+        self.assertEqual(self.stored(), self.counted())
+        self.assertEqual(self.stored()[1], 1)
+
+
+# ==================== CLIENT STATISTICS ====================
+
+class ClientStatsTests(TestCase):
+    def setUp(self):
+        self.fixtures = make_fixtures(shipments=3)
+        self.client_id = self.fixtures.client.pk
+
+    def assertStatsMatchData(self):
+        stats = client_stats.get_stats(self.client_id)
+        for name, value in client_stats.computed(self.client_id).items():
+            self.assertEqual(getattr(stats, name), value, name)
+
+    def reconcile(self):
+        out = StringIO()
+        call_command('reconcile_client_stats', stdout=out)
+        return out.getvalue()
+
+    def test_signals_keep_the_statistics_current(self):
+        shipments = self.fixtures.shipments
+        client_stats.get_stats(self.client_id)
+
+        shipments[0].status = 'delivered'
+        shipments[0].save()
+        shipments[1].status = 'failed_delivery'
+        shipments[1].save()
+        shipments[2].delete()
+        make_shipment(self.fixtures, status='in_transit')
+        invoice = Invoice.objects.create(
+            client=self.fixtures.client, due_date=date(2030, 1, 1), amount_ht=Decimal('100.00'),
+            tva_rate=Decimal('19.00'), status='issued'
+        )
+        Payment.objects.create(invoice=invoice, amount=Decimal('50.00'), payment_date=date(2030, 1, 1), payment_method='cash')
+        Invoice.objects.create(
+            client=self.fixtures.client, due_date=date(2030, 1, 1), amount_ht=Decimal('10.00'), tva_rate=Decimal('19.00')
+        )
+
+        self.assertStatsMatchData()
+        stats = client_stats.get_stats(self.client_id)
+        self.assertEqual((stats.total_shipments, stats.delivered_shipments, stats.failed_shipments), (3, 1, 1))
+        self.assertEqual((stats.open_invoices, stats.open_balance), (1, Decimal('69.00')))
+        self.assertIn('fixed the statistics of 0', self.reconcile())
+
+    def test_reconcile_fixes_writes_that_bypass_the_signals(self):
+        client_stats.get_stats(self.client_id)
+        Shipment.objects.filter(client_id=self.client_id).update(status='delivered')
+
+        output = self.reconcile()
+
+        self.assertIn(f'fixed {self.fixtures.client.client_id}', output)
+        self.assertIn('fixed the statistics of 1', output)
+        self.assertStatsMatchData()
+        self.assertEqual(client_stats.get_stats(self.client_id).delivered_shipments, 3)
+
+    def test_missing_rows_are_created_from_the_data(self):
+        ClientStats.objects.filter(client_id=self.client_id).delete()
+        make_shipment(self.fixtures)
+
+        self.assertEqual(client_stats.get_stats(self.client_id).total_shipments, 4)
+        self.assertStatsMatchData()
+
+
+# ==================== CLIENT LEDGER ====================
+
+class LedgerTests(TestCase):
+    def setUp(self):
+        self.fixtures = make_fixtures(shipments=0)
+        self.account = self.fixtures.client
+        self.invoice = Invoice.objects.create(
+            client=self.account, due_date=date(2030, 1, 1), amount_ht=Decimal('100.00'),
+            tva_rate=Decimal('19.00'), status='issued'
+        )
+
+    def entries(self):
+        return list(LedgerEntry.objects.filter(client=self.account).order_by('sequence').values_list(
+            'sequence', 'entry_type', 'debit', 'credit', 'balance'
+        ))
+
+    def pay(self, amount):
+        return Payment.objects.create(
+            invoice=self.invoice, amount=Decimal(amount), payment_date=date(2030, 1, 1), payment_method='cash'
+        )
+
+    def test_invoices_and_payments_post_their_differences(self):
+        self.pay('50.00')
+        self.invoice.refresh_from_db()
+        self.invoice.amount_ht = Decimal('200.00')
+        self.invoice.save()
+        unpaid = Invoice.objects.create(
+            client=self.account, due_date=date(2030, 1, 1), amount_ht=Decimal('10.00'),
+            tva_rate=Decimal('19.00'), status='issued'
+        )
+        unpaid.status = 'cancelled'
+        unpaid.save()
+
+        self.assertEqual(self.entries(), [
+            (1, 'invoice', Decimal('119.00'), Decimal('0.00'), Decimal('119.00')),
+            (2, 'payment', Decimal('0.00'), Decimal('50.00'), Decimal('69.00')),
+            (3, 'adjustment', Decimal('119.00'), Decimal('0.00'), Decimal('188.00')),
+            (4, 'invoice', Decimal('11.90'), Decimal('0.00'), Decimal('199.90')),
+            (5, 'adjustment', Decimal('0.00'), Decimal('11.90'), Decimal('188.00')),
+        ])
+        self.assertEqual(ledger.balance(self.account.pk), Decimal('188.00'))
+        self.assertEqual(ledger.verify(self.account.pk), [])
+
+    def test_deletions_post_reversals_that_outlive_the_rows(self):
+        payment = self.pay('50.00')
+
+        payment.delete()
+        Invoice.objects.get(pk=self.invoice.pk).delete()
+
+        self.assertEqual(ledger.balance(self.account.pk), Decimal('0.00'))
+        self.assertEqual(ledger.verify(self.account.pk), [])
+        self.assertFalse(LedgerEntry.objects.filter(Q(invoice__isnull=False) | Q(payment__isnull=False)).exists())
+        self.assertEqual(LedgerEntry.objects.filter(client=self.account).count(), 4)
+
+    def test_audit_ledger_reports_and_posts_what_bypassed_the_signals(self):
+        Invoice.objects.filter(pk=self.invoice.pk).update(amount_ttc=Decimal('150.00'))
+
+        out = StringIO()
+        call_command('audit_ledger', '--post-missing', stdout=out)
+
+        self.assertIn(f'{self.account.client_id}: invoice {self.invoice.invoice_number} billed 150.00, posted 119.00',
+                      out.getvalue())
+        self.assertEqual(ledger.verify(self.account.pk), [])
+        self.assertEqual(ledger.balance(self.account.pk), Decimal('150.00'))
+
+    def test_statement_opens_on_the_balance_before_the_period(self):
+        LedgerEntry.objects.filter(client=self.account).update(created_at=timezone.now() - timedelta(days=10))
+        ledger.adjust(self.account, Decimal('-19.00'), 'Goodwill')
+        today = timezone.localdate()
+
+        statement = ledger.statement(self.account, today - timedelta(days=1), today)
+
+        self.assertEqual(statement.opening_balance, Decimal('119.00'))
+        self.assertEqual([entry.description for entry in statement.entries], ['Goodwill'])
+        self.assertEqual((statement.total_credit, statement.closing_balance), (Decimal('19.00'), Decimal('100.00')))
+
+
+# ==================== HISTORY ARCHIVE ====================
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.fixtures = make_fixtures(shipments=2)
+        self.old, self.recent = self.fixtures.shipments
+        long_ago = timezone.now() - timedelta(days=400)
+        Shipment.objects.filter(pk=self.old.pk).update(status='delivered', actual_delivery=long_ago)
+        Shipment.objects.filter(pk=self.recent.pk).update(status='delivered', actual_delivery=timezone.now())
+        self.events = [
+            TrackingEvent.objects.create(shipment=self.old, status=status, location='Oran')
+            for status in ('pending', 'in_transit', 'delivered')
+        ]
+        for days_before, event in zip((2, 1, 0), self.events):
+            TrackingEvent.objects.filter(pk=event.pk).update(timestamp=long_ago - timedelta(days=days_before))
+        TrackingEvent.objects.create(shipment=self.recent, status='delivered', location='Oran')
+
+    def archive(self, *args):
+        out = StringIO()
+        call_command('archive_history', '--batch-size', '2', *args, stdout=out)
+        return out.getvalue()
+
+    def test_months_ago_clamps_to_the_end_of_the_month(self):
+        now = timezone.now().replace(year=2024, month=3, day=31)
+
+        self.assertEqual(archive.months_ago(1, now).date(), date(2024, 2, 29))
+        self.assertEqual(archive.months_ago(15, now).date(), date(2022, 12, 31))
+
+    def test_only_events_of_shipments_delivered_long_ago_move(self):
+        before = archive.tracking_history(self.old.pk)
+
+        self.assertIn('tracking_events: 3 rows would be archived', self.archive('--dry-run'))
+        self.assertIn('tracking_events: 3 rows archived', self.archive())
+
+        self.assertFalse(TrackingEvent.objects.filter(shipment=self.old).exists())
+        self.assertEqual(TrackingEvent.objects.filter(shipment=self.recent).count(), 1)
+        after = archive.tracking_history(self.old.pk)
+        self.assertEqual([{**row, 'archived': False} for row in after], before)
+        self.assertTrue(all(row['archived'] for row in after))
+
+    def test_history_reads_both_tables_latest_first(self):
+        self.archive()
+        middle = self.events[1]
+        list(archive.ARCHIVES['tracking_events'].restore(ArchivedTrackingEvent.objects.filter(pk=middle.pk)))
+        # Same time as the latest archived event: the higher id comes first
+        tie = TrackingEvent.objects.create(shipment=self.old, status='returned', location='Alger')
+        TrackingEvent.objects.filter(pk=tie.pk).update(
+            timestamp=ArchivedTrackingEvent.objects.get(pk=self.events[2].pk).timestamp
+        )
+
+        history = archive.tracking_history(self.old.pk)
+
+        self.assertEqual(
+            [(row['id'], row['archived']) for row in history],
+            [(tie.pk, False), (self.events[2].pk, True), (middle.pk, False), (self.events[0].pk, True)]
+        )
+        self.assertEqual(len(archive.tracking_history(self.old.pk, limit=2)), 2)
+
+    def test_restore_a_shipment(self):
+        self.archive()
+
+        output = self.archive('--restore', '--shipment', self.old.shipment_number)
+
+        self.assertIn('tracking_events: 3 rows restored', output)
+        self.assertEqual(
+            sorted(TrackingEvent.objects.filter(shipment=self.old).values_list('pk', flat=True)),
+            [event.pk for event in self.events]
+        )
+        self.assertFalse(ArchivedTrackingEvent.objects.exists())
+
+    def test_audit_history_follows_archived_entries(self):
+        entries = [
+            AuditLog.objects.create(action='update', model_name='Shipment', object_id=str(self.old.pk))
+            for entry in range(3)
+        ]
+        AuditLog.objects.create(action='update', model_name='Client', object_id=str(self.old.pk))
+        AuditLog.objects.filter(pk__in=[entry.pk for entry in entries[:2]]).update(
+            timestamp=timezone.now() - timedelta(days=400)
+        )
+
+        self.assertIn('audit_logs: 2 rows archived', self.archive('--table', 'audit_logs'))
+
+        history = archive.audit_history('Shipment', self.old.pk)
+        self.assertEqual(
+            [(row['id'], row['archived']) for row in history],
+            [(entries[2].pk, False), (entries[1].pk, True), (entries[0].pk, True)]
+        )
@@ -0,0 +1,116 @@
+"""
+Tour counters - common/tour_counters.py
+Shipment totals stored on DeliveryTour: total_shipments, delivered_count,
+failed_count, total_weight and total_volume.
+
+Lists and analytics read the columns instead of counting TourShipment rows
+per tour. They are kept current by signal handlers (common/signals.py) in
+the transaction of the write that changes them:
+- adding or removing a TourShipment adds or subtracts its shipment;
+- saving a shipment whose status, weight or volume changed applies the
+  difference to the tours it belongs to.
+
+Updates are increments (UPDATE ... SET n = n + 1), so concurrent writes on
+one tour add up instead of overwriting each other. Writes that bypass
+signals (QuerySet.update(), raw SQL) are corrected by
+`python manage.py reconcile_tour_counters`.
+"""
+
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, F, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from common.models import DeliveryTour, TourShipment
+
+COUNTERS = ('total_shipments', 'delivered_count', 'failed_count', 'total_weight', 'total_volume')
+
+# 'failed_delivery' is the status the driver portal records for a failed attempt
+FAILED_STATUSES = ('failed', 'failed_delivery')
+
+
+def contribution(status, weight, volume):
+    """Counter values of one shipment"""
+    return {
+        'total_shipments': 1,
+        'delivered_count': 1 if status == 'delivered' else 0,
+        'failed_count': 1 if status in FAILED_STATUSES else 0,
+        'total_weight': weight or Decimal('0'),
+        'total_volume': volume or Decimal('0'),
+    }
+
+
+def _apply(tours, delta, sign=1):
+    changes = {name: F(name) + sign * value for name, value in delta.items() if value}
+    if changes:
+        tours.update(**changes)
+
+
+def shipment_added(tour_id, shipment):
+    _apply(DeliveryTour.objects.filter(pk=tour_id), contribution(shipment.status, shipment.weight, shipment.volume))
+
+
+def shipment_removed(tour_id, shipment):
+    _apply(DeliveryTour.objects.filter(pk=tour_id), contribution(shipment.status, shipment.weight, shipment.volume), -1)
+
+
+def shipment_saved(shipment, previous):
+    """Apply a saved shipment's changes since `previous` (its counted values) to the tours holding it"""
+    current = {'status': shipment.status, 'weight': shipment.weight, 'volume': shipment.volume}
+    if not previous or len(previous) < len(current) or previous == current:
+        # New shipments have no tour yet; loaded without these fields: nothing to compare with
+        return
+
+    before = contribution(**previous)
+    after = contribution(**current)
+    delta = {name: after[name] - before[name] for name in COUNTERS}
+    _apply(DeliveryTour.objects.filter(tour_shipments__shipment_id=shipment.pk), delta)
+
+
+def counter_values(tours):
+    """The tours annotated with their counters recomputed from TourShipment rows (counted_*)"""
+    stops = TourShipment.objects.filter(tour=OuterRef('pk')).order_by().values('tour')
+
+    def total(expression, output_field):
+        return Coalesce(
+            Subquery(stops.annotate(value=expression).values('value'), output_field=output_field),
+            Value(0),
+            output_field=output_field
+        )
+
+    counter_decimal = DecimalField(max_digits=12, decimal_places=3)
+    return tours.annotate(
+        counted_total_shipments=total(Count('pk'), IntegerField()),
+        counted_delivered_count=total(Count('pk', filter=Q(shipment__status='delivered')), IntegerField()),
+        counted_failed_count=total(Count('pk', filter=Q(shipment__status__in=FAILED_STATUSES)), IntegerField()),
+        counted_total_weight=total(Sum('shipment__weight'), counter_decimal),
+        counted_total_volume=total(Sum('shipment__volume'), counter_decimal),
+    )
+
+
+def _differs(tour, name):
+    stored, counted = getattr(tour, name), getattr(tour, f'counted_{name}')
+    if isinstance(stored, Decimal):
+        # Sums of decimals come back as floats on some databases
+        places = Decimal(1).scaleb(stored.as_tuple().exponent)
+        return stored != Decimal(str(counted)).quantize(places)
+    return stored != counted
+
+
+def drifted(tours=None):
+    """Tours whose stored counters differ from their shipments, annotated with the right values"""
+    tours = counter_values(tours if tours is not None else DeliveryTour.objects.all())
+    for tour in tours.iterator():
+        if any(_differs(tour, name) for name in COUNTERS):
+            yield tour
+
+
+def reconcile(tours=None):
+    """Rewrite the counters of the tours that drifted; returns the number of tours fixed"""
+    fixed = 0
+    for tour in drifted(tours):
+        DeliveryTour.objects.filter(pk=tour.pk).update(**{
+            name: getattr(tour, f'counted_{name}') for name in COUNTERS
+        })
+        fixed += 1
+    return fixed
@@ -0,0 +1,88 @@
+"""
+Public tracking - common/tracking.py
+Compact status and timeline of a shipment, looked up by shipment number
+without logging in (common.views.public_tracking).
+
+Payloads are kept in the cache and rewritten whenever the shipment or one of
+its tracking events is saved (common/signals.py), so lookups of a parcel are
+answered from the cache for as long as it is being tracked. Unknown numbers
+are cached too, for a shorter time. The payload carries no sender or
+recipient details and no event notes.
+"""
+
+import re
+
+from django.conf import settings
+
+from common import archive
+from common.caching import get_cache
+from common.models import Shipment
+
+KEY = 'public:{}'
+UNKNOWN = 'unknown'
+
+cache = get_cache('tracking')
+
+# Shipment.save(): "EXP" followed by 12 hexadecimal digits
+NUMBER_RE = re.compile(r'EXP[0-9A-F]{12}')
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def normalize_number(number):
+    """Upper-cased shipment number, or None if it cannot be one"""
+    number = (number or '').strip().upper()
+    return number if NUMBER_RE.fullmatch(number) else None
+
+
+def build_payload(shipment):
+    # Archived events included (common/archive.py)
+    events = archive.tracking_history(shipment.pk, limit=_setting('PUBLIC_TRACKING_MAX_EVENTS', 20))
+    return {
+        'shipment_number': shipment.shipment_number,
+        'status': shipment.status,
+        'status_display': shipment.get_status_display(),
+        'destination': shipment.destination.city,
+        'estimated_delivery': shipment.estimated_delivery.isoformat() if shipment.estimated_delivery else None,
+        'delivered_at': shipment.actual_delivery.isoformat() if shipment.actual_delivery else None,
+        'events': [
+            {
+                'status': event['status'],
+                'location': event['location'],
+                'timestamp': event['timestamp'].isoformat(),
+            }
+            for event in events
+        ],
+    }
+
+
+def _store(number, shipment):
+    if shipment is None:
+        cache.set(KEY.format(number), UNKNOWN, _setting('PUBLIC_TRACKING_UNKNOWN_CACHE_SECONDS', 60))
+        return None
+    payload = build_payload(shipment)
+    cache.set(KEY.format(number), payload, _setting('PUBLIC_TRACKING_CACHE_SECONDS', 86400))
+    return payload
+
+
+def lookup(number):
+    """Public payload of a normalised shipment number (None if there is no such shipment)"""
+    payload = cache.get(KEY.format(number))
+    if payload is None:
+        shipment = Shipment.objects.select_related('destination').filter(shipment_number=number).first()
+        payload = _store(number, shipment)
+    return None if payload == UNKNOWN else payload
+
+
+def refresh(shipment_id):
+    """Rewrite the cached payload of a shipment after it or its tracking changed"""
+    shipment = Shipment.objects.select_related('destination').filter(pk=shipment_id).first()
+    if shipment is not None:
+        _store(shipment.shipment_number, shipment)
+
+
+def forget(number):
+    """The shipment was deleted: answer its number as unknown"""
+    _store(number, None)
@@ -0,0 +1,95 @@
+"""
+Trip reconstruction - common/trips.py
+Rebuilds a delivery tour from its GPS breadcrumbs (LocationPing) and derives
+the route data stored on DeliveryTour: distance, duration and fuel consumed
+"""
+
+from decimal import Decimal, ROUND_HALF_UP
+
+import numpy as np
+from django.conf import settings
+
+from common.models import DeliveryTour, LocationPing
+
+EARTH_RADIUS_KM = 6371.0088
+TWO_PLACES = Decimal('0.01')
+
+
+def cumulative_haversine_km(latitudes, longitudes):
+    """Cumulative great-circle distance (km) along a polyline of coordinates"""
+    lat = np.radians(np.asarray(latitudes, dtype=float))
+    lon = np.radians(np.asarray(longitudes, dtype=float))
+    if lat.size < 2:
+        return np.zeros(lat.size)
+
+    dlat = np.diff(lat)
+    dlon = np.diff(lon)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(dlon / 2) ** 2
+    segments = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+    return np.concatenate(([0.0], np.cumsum(segments)))
+
+
+def reconstruct_trip(tour):
+    """
+    Compute distance, duration and fuel for a tour from its breadcrumbs.
+    Returns None when the tour has fewer than two usable pings.
+    """
+    max_accuracy = getattr(settings, 'TRIP_MAX_PING_ACCURACY_M', 100)
+    max_speed = getattr(settings, 'TRIP_MAX_SPEED_KMH', 160)
+
+    pings = LocationPing.objects.filter(tour_id=tour.pk).order_by('recorded_at').values_list(
+        'latitude', 'longitude', 'accuracy', 'recorded_at'
+    )
+    rows = [
+        (float(lat), float(lon), ts.timestamp())
+        for lat, lon, accuracy, ts in pings
+        # An accuracy of 0 means the device did not report one
+        if not accuracy or accuracy <= max_accuracy
+    ]
+    if len(rows) < 2:
+        return None
+
+    data = np.array(rows, dtype=float)
+    seconds = data[:, 2]
+    segments = np.diff(cumulative_haversine_km(data[:, 0], data[:, 1]))
+
+    # Drop GPS jumps: segments implying an impossible speed are not driven distance
+    elapsed_hours = np.diff(seconds) / 3600.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        speeds = np.where(elapsed_hours > 0, segments / elapsed_hours, np.inf)
+    distance_km = float(segments[speeds <= max_speed].sum())
+    duration_hours = float(seconds[-1] - seconds[0]) / 3600.0
+
+    distance = Decimal(str(distance_km)).quantize(TWO_PLACES, rounding=ROUND_HALF_UP)
+    fuel_consumption = tour.vehicle.fuel_consumption or Decimal('0')
+    return {
+        'distance_km': distance,
+        'duration_hours': Decimal(str(duration_hours)).quantize(TWO_PLACES, rounding=ROUND_HALF_UP),
+        'fuel_consumed': (distance * fuel_consumption / 100).quantize(TWO_PLACES, rounding=ROUND_HALF_UP),
+        'ping_count': len(rows),
+    }
+
+
+def apply_trip(tour, save=True):
+    """Write the reconstructed route data on the tour; returns the trip summary"""
+    trip = reconstruct_trip(tour)
+    if trip is None:
+        return None
+
+    tour.distance_km = trip['distance_km']
+    tour.duration_hours = trip['duration_hours']
+    tour.fuel_consumed = trip['fuel_consumed']
+    if save:
+        tour.save(update_fields=['distance_km', 'duration_hours', 'fuel_consumed'])
+    return trip
+
+
+def reconstruct_tours(tour_ids):
+    """Reconstruct a batch of tours; returns (updated, skipped). Used by backfill workers."""
+    updated = skipped = 0
+    for tour in DeliveryTour.objects.select_related('vehicle').filter(id__in=tour_ids):
+        if apply_trip(tour) is None:
+            skipped += 1
+        else:
+            updated += 1
+    return updated, skipped
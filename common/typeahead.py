@@ -0,0 +1,208 @@
+"""
+Code autocomplete - common/typeahead.py
+Typeahead over shipment numbers (EXP...), client codes (CLT...) and invoice
+numbers (FAC...).
+
+Every process keeps the active codes in sorted in-memory lists and answers a
+prefix with a binary search, without a query per keystroke. Active codes are
+those of active clients and of the shipments and invoices created in the last
+TYPEAHEAD_DAYS days.
+
+- Rows saved in this process are added (or removed) as soon as they commit.
+- Rows created by other processes are picked up at most every
+  TYPEAHEAD_SYNC_SECONDS, by loading the rows above the highest primary key
+  already indexed (a primary key range, not a table scan).
+- Rows deleted elsewhere or older than TYPEAHEAD_DAYS are dropped by a full
+  reload every TYPEAHEAD_RELOAD_SECONDS.
+
+Every code is also listed under its client, so a client's suggestions come
+from their own (short) list and never include other clients' codes.
+"""
+
+import threading
+import time
+from bisect import bisect_left, insort
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from common.models import Client, Invoice, Shipment
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class PrefixIndex:
+    """Sorted codes of one kind, globally and per client (owner)"""
+
+    def __init__(self):
+        self.codes = []
+        self.entries = {}  # code -> (pk, owner)
+        self.by_owner = {}  # owner -> sorted codes
+        self.high_water = 0  # Highest primary key loaded from the database
+
+    def add(self, code, pk, owner):
+        if code in self.entries:
+            return
+        insort(self.codes, code)
+        self.entries[code] = (pk, owner)
+        insort(self.by_owner.setdefault(owner, []), code)
+
+    def remove(self, code):
+        entry = self.entries.pop(code, None)
+        if entry is None:
+            return
+        del self.codes[bisect_left(self.codes, code)]
+        owned = self.by_owner[entry[1]]
+        del owned[bisect_left(owned, code)]
+        if not owned:
+            del self.by_owner[entry[1]]
+
+    def complete(self, prefix, limit, owner=None):
+        """(code, pk) of up to `limit` codes starting with `prefix`, in order"""
+        codes = self.codes if owner is None else self.by_owner.get(owner, [])
+        matches = []
+        position = bisect_left(codes, prefix)
+        while position < len(codes) and len(matches) < limit and codes[position].startswith(prefix):
+            code = codes[position]
+            matches.append((code, self.entries[code][0]))
+            position += 1
+        return matches
+
+
+class Source:
+    """Where the codes of one kind come from"""
+
+    def __init__(self, kind, model, prefix, code_field, owner_field, active, is_active):
+        self.kind = kind
+        self.model = model
+        self.prefix = prefix
+        self.code_field = code_field
+        self.owner_field = owner_field
+        self.active = active  # () -> queryset of the active rows
+        self.is_active = is_active  # instance -> whether it belongs in the index
+
+    def rows(self, after=0):
+        queryset = self.active().filter(pk__gt=after).order_by()
+        return queryset.values_list(self.code_field, 'pk', self.owner_field).iterator()
+
+
+def _cutoff():
+    return timezone.now() - timedelta(days=_setting('TYPEAHEAD_DAYS', 365))
+
+
+def _recent(model):
+    return lambda: model.objects.filter(created_at__gte=_cutoff())
+
+
+def _is_recent(instance):
+    return instance.created_at >= _cutoff()
+
+
+SOURCES = {
+    Shipment: Source('shipment', Shipment, 'EXP', 'shipment_number', 'client_id',
+                     _recent(Shipment), _is_recent),
+    Client: Source('client', Client, 'CLT', 'client_id', 'pk',
+                   lambda: Client.objects.filter(is_active=True), lambda client: client.is_active),
+    Invoice: Source('invoice', Invoice, 'FAC', 'invoice_number', 'client_id',
+                    _recent(Invoice), _is_recent),
+}
+
+_lock = threading.Lock()
+_state = {
+    'indexes': None,  # kind -> PrefixIndex
+    'loaded_at': None,
+    'synced_at': None,
+}
+
+
+def _load():
+    indexes = {}
+    for source in SOURCES.values():
+        index = indexes[source.kind] = PrefixIndex()
+        # Bulk load: sort once instead of inserting in order
+        rows = sorted(source.rows())
+        index.codes = [code for code, pk, owner in rows]
+        for code, pk, owner in rows:
+            index.entries[code] = (pk, owner)
+            index.by_owner.setdefault(owner, []).append(code)
+            index.high_water = max(index.high_water, pk)
+    now = time.monotonic()
+    with _lock:
+        _state.update(indexes=indexes, loaded_at=now, synced_at=now)
+
+
+def _sync():
+    """Index the rows created by other processes since the last load"""
+    for source in SOURCES.values():
+        index = _state['indexes'][source.kind]
+        rows = list(source.rows(after=index.high_water))
+        with _lock:
+            for code, pk, owner in rows:
+                index.add(code, pk, owner)
+                index.high_water = max(index.high_water, pk)
+    _state['synced_at'] = time.monotonic()
+
+
+def _indexes():
+    now = time.monotonic()
+    loaded_at = _state['loaded_at']
+    if loaded_at is None or now - loaded_at >= _setting('TYPEAHEAD_RELOAD_SECONDS', 3600):
+        _load()
+    elif now - _state['synced_at'] >= _setting('TYPEAHEAD_SYNC_SECONDS', 5):
+        _sync()
+    return _state['indexes']
+
+
+def normalize(query):
+    """Upper-case code prefix without spaces"""
+    return ''.join((query or '').split()).upper()
+
+
+def suggest(query, limit=None, client_id=None, kinds=None):
+    """
+    Codes starting with `query`, as a list of (kind, code, pk). With a
+    client_id, only that client's codes; `kinds` restricts the kinds searched.
+    """
+    prefix = normalize(query)
+    limit = limit or _setting('TYPEAHEAD_LIMIT', 10)
+    if not prefix:
+        return []
+
+    indexes = _indexes()
+    suggestions = []
+    with _lock:
+        for source in SOURCES.values():
+            if kinds is not None and source.kind not in kinds:
+                continue
+            # Only the kinds whose code prefix is compatible with the query
+            if not (prefix.startswith(source.prefix) or source.prefix.startswith(prefix)):
+                continue
+            for code, pk in indexes[source.kind].complete(prefix, limit - len(suggestions), client_id):
+                suggestions.append((source.kind, code, pk))
+    return suggestions
+
+
+def refresh(instance):
+    """Add a saved row to this process's index, or drop it if it is no longer active"""
+    if _state['indexes'] is None:
+        return  # Not loaded yet: the first search loads it from the database
+    source = SOURCES[type(instance)]
+    code = getattr(instance, source.code_field)
+    owner = instance.pk if source.owner_field == 'pk' else getattr(instance, source.owner_field)
+    with _lock:
+        index = _state['indexes'][source.kind]
+        if source.is_active(instance):
+            index.add(code, instance.pk, owner)
+        else:
+            index.remove(code)
+
+
+def forget(model, code):
+    """Drop a deleted row's code from this process's index"""
+    if _state['indexes'] is None:
+        return
+    with _lock:
+        _state['indexes'][SOURCES[model].kind].remove(code)
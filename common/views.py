@@ -1,3 +1,34 @@
-from django.shortcuts import render
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import require_GET
 
-# Create your views here.
+from common import ratelimit, tracking
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+# ==================== PUBLIC TRACKING ====================
+
+@require_GET
+def public_tracking(request, shipment_number):
+    """Track a shipment by number without logging in (JSON, common/tracking.py)"""
+    window = _setting('PUBLIC_TRACKING_WINDOW_SECONDS', 60)
+    if ratelimit.hit('tracking-ip', ratelimit.client_ip(request), window) > _setting('PUBLIC_TRACKING_REQUESTS', 60):
+        response = JsonResponse({'error': 'Too many requests. Please try again later.'}, status=429)
+        response['Retry-After'] = str(window)
+        return response
+
+    number = tracking.normalize_number(shipment_number)
+    if number is None:
+        return JsonResponse({'error': 'Invalid shipment number'}, status=400)
+
+    payload = tracking.lookup(number)
+    if payload is None:
+        return JsonResponse({'error': 'Shipment not found'}, status=404)
+
+    response = JsonResponse(payload)
+    patch_cache_control(response, public=True, max_age=_setting('PUBLIC_TRACKING_MAX_AGE', 30))
+    return response
@@ -0,0 +1,111 @@
+import asyncio
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import AsyncClient, Client
+from django.urls import reverse
+from django.utils import timezone
+
+from authentication.models import User
+from common.models import LocationPing, TrackingEvent
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the driver JSON endpoints: sync views (WSGI handler) against their "
+        "async versions (ASGI handler), reporting requests per second and latency percentiles. "
+        "Run it against a development database: the rows it creates are deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help="Driver user to send the requests as")
+        parser.add_argument('--endpoint', choices=['location', 'status'], default='location')
+        parser.add_argument('--shipment', type=int, help="Shipment id (required for --endpoint status)")
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=50)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'], role='driver')
+        except User.DoesNotExist:
+            raise CommandError(f"No driver user named {options['username']!r}")
+        if not user.driver_profile_id:
+            raise CommandError("This user has no driver profile")
+
+        if options['endpoint'] == 'location':
+            sync_path = reverse('driver:update_location')
+            async_path = reverse('driver:update_location_async')
+            data = {'latitude': '36.752887', 'longitude': '3.042048', 'accuracy': '5'}
+        else:
+            if not options['shipment']:
+                raise CommandError("--shipment is required for the status endpoint")
+            sync_path = reverse('driver:update_shipment_status', args=[options['shipment']])
+            async_path = reverse('driver:update_shipment_status_async', args=[options['shipment']])
+            data = {'status': 'failed_delivery', 'notes': 'benchmark'}
+
+        total = max(1, options['requests'])
+        concurrency = max(1, options['concurrency'])
+        started_at = timezone.now()
+        last_event_id = TrackingEvent.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+        try:
+            results = [
+                ('sync (WSGI)',) + self.run_sync(user, sync_path, data, total, concurrency),
+                ('async (ASGI)',) + asyncio.run(self.run_async(user, async_path, data, total, concurrency)),
+            ]
+        finally:
+            LocationPing.objects.filter(driver_id=user.driver_profile_id, recorded_at__gte=started_at).delete()
+            TrackingEvent.objects.filter(id__gt=last_event_id, notes='benchmark').delete()
+
+        self.stdout.write(f"{total} requests, concurrency {concurrency}, endpoint {options['endpoint']}")
+        self.stdout.write(f"{'mode':<14}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+        for mode, elapsed, latencies, errors in results:
+            self.stdout.write(
+                f"{mode:<14}{total / elapsed:>10.1f}{percentile(latencies, 50) * 1000:>10.2f}"
+                f"{percentile(latencies, 99) * 1000:>10.2f}{errors:>8}"
+            )
+
+    def run_sync(self, user, path, data, total, concurrency):
+        local = threading.local()
+
+        def call(_):
+            if not hasattr(local, 'client'):
+                local.client = Client()
+                local.client.force_login(user)
+            begin = time.perf_counter()
+            response = local.client.post(path, data)
+            return time.perf_counter() - begin, response.status_code
+
+        begin = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            outcomes = list(executor.map(call, range(total)))
+            # Worker threads opened their own database connections
+            list(executor.map(lambda _: connections.close_all(), range(concurrency)))
+        elapsed = time.perf_counter() - begin
+        return elapsed, [latency for latency, _ in outcomes], sum(1 for _, code in outcomes if code != 200)
+
+    async def run_async(self, user, path, data, total, concurrency):
+        client = AsyncClient()
+        await client.aforce_login(user)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def call():
+            async with semaphore:
+                begin = time.perf_counter()
+                response = await client.post(path, data)
+                return time.perf_counter() - begin, response.status_code
+
+        begin = time.perf_counter()
+        outcomes = await asyncio.gather(*(call() for _ in range(total)))
+        elapsed = time.perf_counter() - begin
+        return elapsed, [latency for latency, _ in outcomes], sum(1 for _, code in outcomes if code != 200)
@@ -1,3 +1,80 @@
-from django.test import TestCase
+from decimal import Decimal
 
-# Create your tests here.
+from django.core.cache import caches
+from django.test import AsyncClient, TestCase, override_settings
+
+from authentication.models import User
+from authentication.tokens import issue_token
+from common.models import Driver, LocationPing, Shipment, TrackingEvent
+from common.tests import make_fixtures
+
+
+# ==================== ASYNC DRIVER API ====================
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class AsyncDriverApiTests(TestCase):
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.fixtures = make_fixtures()
+        self.user = User.objects.create_user(
+            'driver', password='pw', role='driver', driver_profile=self.fixtures.driver
+        )
+        self.token = issue_token(self.user)
+
+    def post(self, path, data):
+        return AsyncClient().post(path, data, headers={'authorization': f'Bearer {self.token}'})
+
+    async def test_location_update_records_position_and_breadcrumb(self):
+        response = await self.post('/driver/api/location/update/', {
+            'latitude': '36.75', 'longitude': '3.05', 'accuracy': '8'
+        })
+
+        self.assertEqual(response.status_code, 200)
+        driver = await Driver.objects.aget(pk=self.fixtures.driver.pk)
+        self.assertEqual(driver.current_latitude, Decimal('36.750000'))
+        ping = await LocationPing.objects.aget(driver=driver)
+        self.assertEqual(ping.tour_id, self.fixtures.tour.pk)
+        self.assertEqual(ping.accuracy, Decimal('8.00'))
+
+    async def test_location_update_rejects_invalid_coordinates(self):
+        response = await self.post('/driver/api/location/update/', {'latitude': 'north', 'longitude': '3'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(await LocationPing.objects.aexists())
+
+    async def test_status_update_marks_the_shipment_and_adds_a_tracking_event(self):
+        shipment = self.fixtures.shipments[0]
+
+        response = await self.post(f'/driver/api/shipments/{shipment.pk}/update-status/', {
+            'status': 'delivered', 'notes': 'Left at reception'
+        })
+
+        self.assertEqual(response.status_code, 200)
+        shipment = await Shipment.objects.aget(pk=shipment.pk)
+        self.assertEqual(shipment.status, 'delivered')
+        self.assertIsNotNone(shipment.actual_delivery)
+        event = await TrackingEvent.objects.aget(shipment=shipment)
+        self.assertEqual((event.status, event.notes), ('delivered', 'Left at reception'))
+
+    async def test_status_update_refuses_other_drivers_shipments_and_unknown_statuses(self):
+        other = await Shipment.objects.acreate(
+            client=self.fixtures.client, service_type=self.fixtures.service_type,
+            destination=self.fixtures.destination, weight=Decimal('1'), volume=Decimal('0.1'),
+            description='Not on the tour', sender_name='S', sender_phone='1', sender_address='A',
+            recipient_name='R', recipient_phone='2', recipient_address='B'
+        )
+        response = await self.post(f'/driver/api/shipments/{other.pk}/update-status/', {'status': 'delivered'})
+        self.assertEqual(response.status_code, 404)
+
+        shipment = self.fixtures.shipments[0]
+        response = await self.post(f'/driver/api/shipments/{shipment.pk}/update-status/', {'status': 'lost'})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_requests_without_credentials_are_refused(self):
+        response = await AsyncClient().post('/driver/api/location/update/', {'latitude': '36', 'longitude': '3'})
+        self.assertEqual(response.status_code, 401)
+
+        self.token = 'forged'
+        response = await self.post('/driver/api/location/update/', {'latitude': '36', 'longitude': '3'})
+        self.assertEqual(response.status_code, 401)
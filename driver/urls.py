@@ -23,4 +23,8 @@ urlpatterns = [
 
     # Location tracking
     path('location/update/', views.update_location, name='update_location'),
+
+    # Async JSON API (ASGI)
+    path('api/location/update/', views.update_location_async, name='update_location_async'),
+    path('api/shipments/<int:shipment_id>/update-status/', views.update_shipment_status_async, name='update_shipment_status_async'),
 ]
\ No newline at end of file
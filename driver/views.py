@@ -1,41 +1,30 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
 from django.http import JsonResponse
 from django.contrib import messages
+from django.db.models import Sum
 from django.utils import timezone
 from django.views.decorators.http import require_http_methods
 from django.core.paginator import Paginator
-from common.models import Driver, DeliveryTour, Shipment, TrackingEvent, Incident
+from common.models import Driver, DeliveryTour, Shipment, TrackingEvent, Incident, LocationPing
+from common.trips import apply_trip
+from common.geofence import aactive_tour_id, active_tour_id, aprocess_ping, invalidate_driver, process_ping
+from common import eta
+from authentication.decorators import role_required
 from authentication.models import User
 
 def get_driver_from_request(request):
     """Helper function to get driver from authenticated user"""
-    if not request.user.is_authenticated:
+    if not request.user.is_authenticated or request.user.role != 'driver':
         return None
-
-    try:
-        # Try matching by email first (most reliable)
-        return Driver.objects.get(email=request.user.email)
-    except Driver.DoesNotExist:
-        # If email doesn't work, try by name
-        try:
-            return Driver.objects.filter(
-                first_name__iexact=request.user.first_name,
-                last_name__iexact=request.user.last_name
-            ).first()
-        except:
-            return None
+    return request.user.driver_profile
 
 # ==================== DRIVER DASHBOARD ====================
 
+@role_required('driver')
 def driver_dashboard(request):
     """DR-01: View assigned tours"""
-    if not request.user.is_authenticated or request.user.role != 'driver':
-        return redirect('/auth/driver/login/')
-
-    # Get driver profile directly from user relationship
-    driver = request.user.driver_profile
-    if not driver:
-        return redirect('/auth/driver/login/?error=No+driver+profile+assigned')
+    driver = request.profile
 
     # Get active tours for this driver
     active_tours = DeliveryTour.objects.filter(
@@ -51,9 +40,13 @@ def driver_dashboard(request):
         tour_assignments__tour__date=today
     ).distinct()
 
-    # Performance metrics
-    delivered_count = todays_shipments.filter(status='delivered').count()
-    total_count = todays_shipments.count()
+    # Performance metrics (tour counters, common/tour_counters.py)
+    todays_totals = DeliveryTour.objects.filter(driver=driver, date=today).aggregate(
+        delivered=Sum('delivered_count'),
+        total=Sum('total_shipments')
+    )
+    delivered_count = todays_totals['delivered'] or 0
+    total_count = todays_totals['total'] or 0
     completion_rate = (delivered_count / total_count * 100) if total_count > 0 else 0
 
     context = {
@@ -76,14 +69,10 @@ def driver_dashboard(request):
 
 # ==================== TOUR MANAGEMENT ====================
 
+@role_required('driver')
 def tour_list(request):
     """DR-01: View assigned tours (all tours for driver)"""
-    if not request.user.is_authenticated or request.user.role != 'driver':
-        return redirect('/auth/driver/login/')
-
-    driver = request.user.driver_profile
-    if not driver:
-        return redirect('/auth/driver/login/?error=No+driver+profile+assigned')
+    driver = request.profile
 
     tours = DeliveryTour.objects.filter(driver=driver).order_by('-date')
 
@@ -92,14 +81,10 @@ def tour_list(request):
         'tours': tours
     })
 
+@role_required('driver')
 def tour_detail(request, tour_id):
     """DR-02: View shipments in tour"""
-    if not request.user.is_authenticated or request.user.role != 'driver':
-        return redirect('/auth/driver/login/')
-
-    driver = request.user.driver_profile
-    if not driver:
-        return redirect('/auth/driver/login/?error=No+driver+profile+assigned')
+    driver = request.profile
 
     tour = get_object_or_404(DeliveryTour, id=tour_id, driver=driver)
     # Get shipments for this tour through TourShipment relationship
@@ -111,14 +96,10 @@ def tour_detail(request, tour_id):
         'shipments': shipments
     })
 
+@role_required('driver')
 def start_tour(request, tour_id):
     """DR-03: Start tour"""
-    if not request.user.is_authenticated or request.user.role != 'driver':
-        return redirect('/auth/driver/login/')
-
-    driver = request.user.driver_profile
-    if not driver:
-        return redirect('/auth/driver/login/?error=No+driver+profile+assigned')
+    driver = request.profile
 
     tour = get_object_or_404(DeliveryTour, id=tour_id, driver=driver)
 
@@ -129,6 +110,8 @@ def start_tour(request, tour_id):
     tour.status = 'in_progress'
     tour.actual_start_time = timezone.now()
     tour.save()
+    invalidate_driver(driver.id, tour.id)
+    eta.invalidate_tour(tour.id)
 
     # Update all shipments to 'in_transit'
     for shipment in tour.shipments.all():
@@ -145,14 +128,10 @@ def start_tour(request, tour_id):
     messages.success(request, f"Tour {tour.tour_number} started successfully!")
     return redirect('driver:tour_detail', tour_id=tour_id)
 
+@role_required('driver')
 def complete_tour(request, tour_id):
     """DR-07: Close tour"""
-    if not request.user.is_authenticated or request.user.role != 'driver':
-        return redirect('/auth/driver/login/')
-
-    driver = request.user.driver_profile
-    if not driver:
-        return redirect('/auth/driver/login/?error=No+driver+profile+assigned')
+    driver = request.profile
 
     tour = get_object_or_404(DeliveryTour, id=tour_id, driver=driver)
 
@@ -162,24 +141,24 @@ def complete_tour(request, tour_id):
 
     tour.status = 'completed'
     tour.actual_end_time = timezone.now()
+    # Fill distance, duration and fuel from the GPS breadcrumbs of the tour
+    apply_trip(tour, save=False)
     tour.save()
+    invalidate_driver(driver.id, tour.id)
+    eta.invalidate_tour(tour.id)
 
     messages.success(request, f"Tour {tour.tour_number} completed successfully!")
     return redirect('driver:tour_list')
 
 # ==================== SHIPMENT STATUS UPDATES ====================
 
+@role_required('driver', api=True, device_token=True)
 def update_shipment_status(request, shipment_id):
     """DR-04: Update shipment status (delivered/failed)"""
-    if not request.user.is_authenticated or request.user.role != 'driver':
-        return JsonResponse({'error': 'Not authenticated'}, status=401)
-
     if request.method != 'POST':
         return JsonResponse({'error': 'Method not allowed'}, status=405)
 
-    driver = request.user.driver_profile
-    if not driver:
-        return JsonResponse({'error': 'Driver not found'}, status=404)
+    driver = request.profile
 
     # Get shipment through TourShipment relationship
     shipment = get_object_or_404(Shipment, id=shipment_id, tour_assignments__tour__driver=driver)
@@ -200,30 +179,28 @@ def update_shipment_status(request, shipment_id):
     # Update shipment status
     shipment.status = new_status
     if new_status == 'delivered':
-        shipment.actual_delivery_date = timezone.now()
+        shipment.actual_delivery = timezone.now()
     shipment.save()
 
     # Create tracking entry
     TrackingEvent.objects.create(
         shipment=shipment,
         status=new_status,
-        tour=tour,
         notes=notes
     )
 
+    # Remaining stops of the tour are now reached sooner
+    eta.on_shipment_status_change(shipment.id)
+
     return JsonResponse({
         'success': True,
-        'message': f'Shipment {shipment.tracking_number} marked as {new_status}'
+        'message': f'Shipment {shipment.shipment_number} marked as {new_status}'
     })
 
+@role_required('driver')
 def add_tracking_event(request, shipment_id):
     """DR-05: Add tracking event"""
-    if not request.user.is_authenticated or request.user.role != 'driver':
-        return redirect('/auth/driver/login/')
-
-    driver = request.user.driver_profile
-    if not driver:
-        return redirect('/auth/driver/login/?error=No+driver+profile+assigned')
+    driver = request.profile
 
     shipment = get_object_or_404(Shipment, id=shipment_id, tour_assignments__tour__driver=driver)
     tour_assignment = shipment.tour_assignments.filter(tour__driver=driver).first()
@@ -256,14 +233,10 @@ def add_tracking_event(request, shipment_id):
 
 # ==================== INCIDENT REPORTING ====================
 
+@role_required('driver')
 def report_incident(request, shipment_id=None):
     """DR-06: Report incident"""
-    if not request.user.is_authenticated or request.user.role != 'driver':
-        return redirect('/auth/driver/login/')
-
-    driver = request.user.driver_profile
-    if not driver:
-        return redirect('/auth/driver/login/?error=No+driver+profile+assigned')
+    driver = request.profile
 
     if request.method == 'POST':
         incident_type = request.POST.get('type')
@@ -304,31 +277,45 @@ def report_incident(request, shipment_id=None):
 
 # ==================== LOCATION TRACKING ====================
 
+@role_required('driver', api=True, device_token=True)
 def update_location(request):
     """Update driver's current location"""
-    if not request.user.is_authenticated or request.user.role != 'driver':
-        return JsonResponse({'error': 'Not authenticated'}, status=401)
-
     if request.method != 'POST':
         return JsonResponse({'error': 'Method not allowed'}, status=405)
 
-    driver = request.user.driver_profile
-    if not driver:
-        return JsonResponse({'error': 'Driver not found'}, status=404)
+    driver = request.profile
 
     try:
         latitude = float(request.POST.get('latitude'))
         longitude = float(request.POST.get('longitude'))
         accuracy = float(request.POST.get('accuracy', 0))
 
-        driver.current_latitude = latitude
-        driver.current_longitude = longitude
-        driver.location_accuracy = accuracy
-        driver.last_location_timestamp = timezone.now()
-        driver.save(update_fields=[
-            'current_latitude', 'current_longitude',
-            'location_accuracy', 'last_location_timestamp'
-        ])
+        now = timezone.now()
+        Driver.objects.filter(pk=driver.pk).update(
+            current_latitude=latitude,
+            current_longitude=longitude,
+            location_accuracy=accuracy,
+            last_location_timestamp=now
+        )
+
+        # Keep the breadcrumb trail used to reconstruct the tour afterwards
+        tour_id = active_tour_id(driver.id)
+        LocationPing.objects.create(
+            driver=driver,
+            tour_id=tour_id,
+            latitude=latitude,
+            longitude=longitude,
+            accuracy=accuracy,
+            recorded_at=now
+        )
+
+        # Automatic arrival/departure events at the tour stops
+        events = process_ping(driver.id, latitude, longitude, now, tour_id=tour_id)
+
+        # Refresh the ETAs of the remaining stops (immediately after an arrival/departure)
+        if events:
+            eta.invalidate_plan(tour_id)
+        eta.on_location_ping(driver.id, tour_id, latitude, longitude, now, force=bool(events))
 
         return JsonResponse({
             'success': True,
@@ -336,4 +323,92 @@ def update_location(request):
         })
 
     except (ValueError, TypeError):
-        return JsonResponse({'error': 'Invalid coordinates'}, status=400)
\ No newline at end of file
+        return JsonResponse({'error': 'Invalid coordinates'}, status=400)
+
+# ==================== ASYNC DRIVER API (ASGI) ====================
+# Async versions of the high-frequency JSON endpoints above, for the driver
+# app. Served through FinalProject/asgi.py they do not hold a worker thread
+# per request; the session/user lookup and the ORM calls are async.
+
+@role_required('driver', api=True, device_token=True)
+async def update_location_async(request):
+    """Update driver's current location (async)"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    driver_id = request.profile.id
+
+    try:
+        latitude = float(request.POST.get('latitude'))
+        longitude = float(request.POST.get('longitude'))
+        accuracy = float(request.POST.get('accuracy', 0))
+    except (ValueError, TypeError):
+        return JsonResponse({'error': 'Invalid coordinates'}, status=400)
+
+    now = timezone.now()
+    await Driver.objects.filter(pk=driver_id).aupdate(
+        current_latitude=latitude,
+        current_longitude=longitude,
+        location_accuracy=accuracy,
+        last_location_timestamp=now
+    )
+
+    tour_id = await aactive_tour_id(driver_id)
+    await LocationPing.objects.acreate(
+        driver_id=driver_id,
+        tour_id=tour_id,
+        latitude=latitude,
+        longitude=longitude,
+        accuracy=accuracy,
+        recorded_at=now
+    )
+
+    events = await aprocess_ping(driver_id, latitude, longitude, now, tour_id=tour_id)
+    if events:
+        # A cache call: kept off the event loop like the rest of the ping handling
+        await sync_to_async(eta.invalidate_plan)(tour_id)
+    await eta.aon_location_ping(driver_id, tour_id, latitude, longitude, now, force=bool(events))
+
+    return JsonResponse({
+        'success': True,
+        'message': 'Location updated successfully'
+    })
+
+@role_required('driver', api=True, device_token=True)
+async def update_shipment_status_async(request, shipment_id):
+    """DR-04: Update shipment status (delivered/failed) (async)"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    driver_id = request.profile.id
+
+    shipment = await Shipment.objects.filter(
+        id=shipment_id,
+        tour_assignments__tour__driver_id=driver_id
+    ).afirst()
+    if shipment is None:
+        return JsonResponse({'error': 'Shipment not found'}, status=404)
+
+    new_status = request.POST.get('status')
+    notes = request.POST.get('notes', '')
+
+    if new_status not in ['delivered', 'failed_delivery']:
+        return JsonResponse({'error': 'Invalid status'}, status=400)
+
+    shipment.status = new_status
+    if new_status == 'delivered':
+        shipment.actual_delivery = timezone.now()
+    await shipment.asave()
+
+    await TrackingEvent.objects.acreate(
+        shipment=shipment,
+        status=new_status,
+        notes=notes
+    )
+
+    await sync_to_async(eta.on_shipment_status_change)(shipment.id)
+
+    return JsonResponse({
+        'success': True,
+        'message': f'Shipment {shipment.shipment_number} marked as {new_status}'
+    })
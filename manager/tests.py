@@ -1,3 +1,24 @@
 from django.test import TestCase
 
-# Create your tests here.
+from authentication.models import User
+from common.tests import make_fixtures, make_shipment, page_queries
+
+
+class ManagerTestCase(TestCase):
+    def setUp(self):
+        self.fixtures = make_fixtures()
+        self.user = User(username='manager', role='manager')
+        self.user.set_unusable_password()
+        self.user.save()
+        self.client.force_login(self.user)
+
+
+# ==================== LIST PROJECTIONS ====================
+
+class ShipmentManagementTests(ManagerTestCase):
+    def test_queries_do_not_grow_with_the_rows(self):
+        queries = page_queries(self.client, '/manager/shipments/')
+        for shipment in range(5):
+            make_shipment(self.fixtures)
+
+        self.assertEqual(len(page_queries(self.client, '/manager/shipments/')), len(queries))
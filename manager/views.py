@@ -1,16 +1,26 @@
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.http import JsonResponse
 from django.contrib import messages
 from django.core.paginator import Paginator
-from django.db.models import Count, Sum, Q, Avg, Max
+from django.db.models import Count, Sum, Q, Avg, F
+from django.db.models.functions import Coalesce, TruncMonth
 from django.utils import timezone
 from datetime import timedelta, date
+from decimal import Decimal
 from common.models import (
     Shipment, Client, Driver, Invoice, Incident, DeliveryTour,
     Claim, ServiceType, Destination, Vehicle, TourShipment
 )
+from common import ledger, search, swr
+from common.pagination import paginate
+from common.projections import project
+from common.caching import get_cache
+from authentication.decorators import role_required
 from authentication.models import User
 
+dashboard_cache = get_cache('manager', alias='dashboards')
+
 def get_manager_from_request(request):
     """Helper function to get manager from authenticated user"""
     if not request.user.is_authenticated or request.user.role != 'manager':
@@ -19,11 +29,9 @@ def get_manager_from_request(request):
 
 # ==================== MANAGER DASHBOARD ====================
 
+@role_required('manager')
 def manager_dashboard(request):
     """MG-01 to MG-09: Comprehensive analytics dashboard"""
-    if not request.user.is_authenticated or request.user.role != 'manager':
-        return redirect('/auth/manager/login/')
-
     manager = request.user
 
     # Get comprehensive system stats
@@ -89,21 +97,40 @@ def get_system_stats():
 
 # ==================== COMMERCIAL ANALYTICS ====================
 
-def commercial_analytics(request):
-    """MG-01 to MG-04: Commercial analytics"""
-    if not request.user.is_authenticated or request.user.role != 'manager':
-        return redirect('/auth/manager/login/')
-
-    manager = request.user
-
-    # Date range for analytics (last 12 months by default)
+def get_analytics_range():
+    """Date range for analytics (last 12 months by default)"""
     end_date = timezone.now().date()
     # Calculate start date: 12 months ago, first day of that month
     if end_date.month >= 12:
         start_date = date(end_date.year - 1, 1, 1)
     else:
         start_date = date(end_date.year - 1, end_date.month + 1, 1)
+    return start_date, end_date
+
+def get_cached_analytics(name, compute):
+    """
+    Analytics data from the dashboards cache. Stale data is served while one
+    background recomputation runs (common/swr.py).
+    """
+    start_date, end_date = get_analytics_range()
+    return swr.get_or_compute(
+        dashboard_cache,
+        f'{name}:{end_date.isoformat()}',
+        lambda: compute(start_date, end_date),
+        soft_ttl=getattr(settings, 'ANALYTICS_CACHE_SOFT_SECONDS', 300),
+        hard_ttl=getattr(settings, 'ANALYTICS_CACHE_HARD_SECONDS', 3600)
+    )
+
+@role_required('manager')
+def commercial_analytics(request):
+    """MG-01 to MG-04: Commercial analytics"""
+    manager = request.user
 
+    context = get_cached_analytics('commercial', get_commercial_analytics)
+    return render(request, 'manager/commercial_analytics.html', context)
+
+def get_commercial_analytics(start_date, end_date):
+    """Commercial analytics data (plain values, cacheable)"""
     # MG-01 & MG-02: Shipments and revenue evolution
     monthly_data = []
     current_date = start_date
@@ -143,21 +170,21 @@ def commercial_analytics(request):
             current_date = date(current_date.year, current_date.month + 1, 1)
 
     # MG-03: Top clients by shipment volume and value
-    top_clients_volume = Client.objects.annotate(
+    top_clients_volume = list(Client.objects.annotate(
         shipment_count=Count('shipments')
-    ).order_by('-shipment_count')[:10]
+    ).order_by('-shipment_count')[:10])
 
-    top_clients_value = Client.objects.annotate(
+    top_clients_value = list(Client.objects.annotate(
         total_value=Sum('invoices__amount_ttc')
-    ).order_by('-total_value')[:10]
+    ).order_by('-total_value')[:10])
 
     # MG-04: Top destinations
-    top_destinations = Destination.objects.annotate(
+    top_destinations = list(Destination.objects.annotate(
         shipment_count=Count('shipment'),
         revenue=Sum('shipment__amount')
-    ).order_by('-shipment_count')[:10]
+    ).order_by('-shipment_count')[:10])
 
-    context = {
+    return {
         'monthly_data': monthly_data,
         'top_clients_volume': top_clients_volume,
         'top_clients_value': top_clients_value,
@@ -165,26 +192,28 @@ def commercial_analytics(request):
         'date_range': {'start': start_date, 'end': end_date}
     }
 
-    return render(request, 'manager/commercial_analytics.html', context)
-
 # ==================== OPERATIONAL ANALYTICS ====================
 
+@role_required('manager')
 def operational_analytics(request):
     """MG-05 to MG-09: Operational analytics"""
-    if not request.user.is_authenticated or request.user.role != 'manager':
-        return redirect('/auth/manager/login/')
-
     manager = request.user
 
-    # Date range for analytics (last 12 months by default)
-    end_date = timezone.now().date()
-    # Calculate start date: 12 months ago, first day of that month
-    if end_date.month >= 12:
-        start_date = date(end_date.year - 1, 1, 1)
-    else:
-        start_date = date(end_date.year - 1, end_date.month + 1, 1)
+    context = get_cached_analytics('operational', get_operational_analytics)
+    return render(request, 'manager/operational_analytics.html', context)
+
+def get_operational_analytics(start_date, end_date):
+    """Operational analytics data (plain values, cacheable)"""
+    # MG-05: Tours evolution (one grouped query over the period)
+    tours_by_month = {
+        (row['month'].year, row['month'].month): row
+        for row in DeliveryTour.objects.filter(date__range=[start_date, end_date])
+        .annotate(month=TruncMonth('date'))
+        .values('month')
+        .annotate(total=Count('id'), completed=Count('id', filter=Q(status='completed')))
+        .order_by()
+    }
 
-    # MG-05: Tours evolution
     monthly_tours = []
     current_date = start_date
     for i in range(12):
@@ -192,16 +221,9 @@ def operational_analytics(request):
             break
         month_date = current_date
 
-        tours_count = DeliveryTour.objects.filter(
-            date__year=month_date.year,
-            date__month=month_date.month
-        ).count()
-
-        completed_tours = DeliveryTour.objects.filter(
-            date__year=month_date.year,
-            date__month=month_date.month,
-            status='completed'
-        ).count()
+        month_totals = tours_by_month.get((month_date.year, month_date.month), {})
+        tours_count = month_totals.get('total', 0)
+        completed_tours = month_totals.get('completed', 0)
 
         monthly_tours.append({
             'month': month_date.strftime('%b %Y'),
@@ -231,26 +253,20 @@ def operational_analytics(request):
     # MG-07: Top drivers performance
     top_drivers_qs = Driver.objects.annotate(
         tours_completed=Count('tours', filter=Q(tours__status='completed')),
-        total_shipments=Count('tours__tour_shipments', distinct=True)
+        total_shipments=Sum('tours__total_shipments'),
+        shipments_delivered=Sum('tours__delivered_count')
     ).filter(total_shipments__gt=0).order_by('-total_shipments')[:10]
     
     # Convert to list and calculate success rate
     top_drivers = list(top_drivers_qs)
     for driver in top_drivers:
-        # Calculate delivered shipments for each driver
-        delivered_count = 0
-        for tour in driver.tours.all():
-            for tour_shipment in tour.tour_shipments.all():
-                if tour_shipment.shipment.status == 'delivered':
-                    delivered_count += 1
-        driver.shipments_delivered = delivered_count
         driver.success_rate = (driver.shipments_delivered / driver.total_shipments * 100) if driver.total_shipments > 0 else 0
 
 
     # MG-08: Incident-prone zones
-    incident_zones = Destination.objects.annotate(
+    incident_zones = list(Destination.objects.annotate(
         incident_count=Count('shipment__incidents')
-    ).filter(incident_count__gt=0).order_by('-incident_count')[:10]
+    ).filter(incident_count__gt=0).order_by('-incident_count')[:10])
 
     # MG-09: Peak activity periods (by hour of day)
     hourly_activity = []
@@ -265,7 +281,7 @@ def operational_analytics(request):
             'count': shipment_count
         })
 
-    context = {
+    return {
         'monthly_tours': monthly_tours,
         'delivery_success_rate': delivery_success_rate,
         'total_shipments': total_shipments,
@@ -276,24 +292,27 @@ def operational_analytics(request):
         'date_range': {'start': start_date, 'end': end_date}
     }
 
-    return render(request, 'manager/operational_analytics.html', context)
-
 # ==================== MANAGEMENT VIEWS ====================
 
+# Fields shown by manager/shipment_management.html (common/projections.py)
+SHIPMENT_MANAGEMENT_FIELDS = (
+    'shipment_number', 'status', 'weight', 'created_at',
+    'client__name', 'destination__city', 'destination__country', 'service_type__name',
+)
+
+@role_required('manager')
 def shipment_management(request):
     """View and manage all shipments"""
-    if not request.user.is_authenticated or request.user.role != 'manager':
-        return redirect('/auth/manager/login/')
-
     manager = request.user
 
-    shipments = Shipment.objects.select_related('client', 'destination', 'service_type').all()
+    shipments = Shipment.objects.all()
 
     # Filters
     status = request.GET.get('status')
     client_id = request.GET.get('client')
     date_from = request.GET.get('date_from')
     date_to = request.GET.get('date_to')
+    query = request.GET.get('search')
 
     if status:
         shipments = shipments.filter(status=status)
@@ -303,13 +322,13 @@ def shipment_management(request):
         shipments = shipments.filter(created_at__date__gte=date_from)
     if date_to:
         shipments = shipments.filter(created_at__date__lte=date_to)
+    if query:
+        shipments = search.matching(shipments, query)
 
-    shipments = shipments.order_by('-created_at')
+    shipments = project(shipments.order_by('-created_at'), SHIPMENT_MANAGEMENT_FIELDS)
 
     # Pagination
-    paginator = Paginator(shipments, 25)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator, page_obj = paginate(request, shipments, 25)
 
     # Filter options
     clients = Client.objects.all()
@@ -317,6 +336,8 @@ def shipment_management(request):
 
     return render(request, 'manager/shipment_management.html', {
         'page_obj': page_obj,
+        'object_list': page_obj.object_list,
+        'is_paginated': page_obj.has_other_pages(),
         'clients': clients,
         'statuses': statuses,
         'filters': {
@@ -327,35 +348,27 @@ def shipment_management(request):
         }
     })
 
+@role_required('manager')
 def client_management(request):
     """View and manage all clients"""
-    if not request.user.is_authenticated or request.user.role != 'manager':
-        return redirect('/auth/manager/login/')
-
     manager = request.user
 
     # Search functionality
     search_query = request.GET.get('search', '')
-    clients = Client.objects.annotate(
-        shipment_count=Count('shipments'),
-        total_spent=Sum('invoices__amount_ttc')
-    )
+    # Counters from the clients' statistics rows (common/client_stats.py), balance from their ledger
+    clients = ledger.with_balance(Client.objects.annotate(
+        shipment_count=Coalesce(F('stats__total_shipments'), 0),
+        total_spent=Coalesce(F('stats__total_invoiced'), Decimal('0'))
+    ))
 
-    # Filter by search query
+    # Filter by search query (full-text index, common/search.py)
     if search_query:
-        clients = clients.filter(
-            Q(name__icontains=search_query) |
-            Q(email__icontains=search_query) |
-            Q(phone__icontains=search_query) |
-            Q(client_id__icontains=search_query)
-        )
+        clients = search.matching(clients, search_query)
 
     clients = clients.order_by('-created_at')
 
     # Pagination
-    paginator = Paginator(clients, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator, page_obj = paginate(request, clients, 20)
 
     return render(request, 'manager/client_management.html', {
         'page_obj': page_obj,
@@ -364,48 +377,36 @@ def client_management(request):
         'is_paginated': page_obj.has_other_pages(),
     })
 
+@role_required('manager')
 def driver_management(request):
     """View and manage all drivers"""
-    if not request.user.is_authenticated or request.user.role != 'manager':
-        return redirect('/auth/manager/login/')
-
     manager = request.user
 
     drivers = Driver.objects.annotate(
         tour_count=Count('tours'),
-        total_shipments=Count('tours__tour_shipments', distinct=True)
+        total_shipments=Coalesce(Sum('tours__total_shipments'), 0),
+        delivery_count=Coalesce(Sum('tours__delivered_count'), 0)
     ).order_by('-hire_date')
 
-    # Calculate delivered shipments and success rates
-    for driver in drivers:
-        delivered_count = 0
-        total_count = 0
-        for tour in driver.tours.all():
-            for tour_shipment in tour.tour_shipments.all():
-                total_count += 1
-                if tour_shipment.shipment.status == 'delivered':
-                    delivered_count += 1
-        driver.delivery_count = delivered_count
-        driver.total_shipments = total_count
-        driver.success_rate = (driver.delivery_count / driver.total_shipments * 100) if driver.total_shipments > 0 else 0
-
     # Pagination
     paginator = Paginator(drivers, 20)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
 
+    # Success rates of the page's drivers
+    for driver in page_obj:
+        driver.success_rate = (driver.delivery_count / driver.total_shipments * 100) if driver.total_shipments > 0 else 0
+
     return render(request, 'manager/driver_management.html', {
         'page_obj': page_obj
     })
 
+@role_required('manager')
 def incident_management(request):
     """View and manage all incidents"""
-    if not request.user.is_authenticated or request.user.role != 'manager':
-        return redirect('/auth/manager/login/')
-
     manager = request.user
 
-    incidents = Incident.objects.select_related('client', 'shipment').all()
+    incidents = Incident.objects.select_related('shipment').all()
 
     # Filter by status
     status = request.GET.get('status')
@@ -415,26 +416,21 @@ def incident_management(request):
     incidents = incidents.order_by('-reported_date')
 
     # Pagination
-    paginator = Paginator(incidents, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator, page_obj = paginate(request, incidents, 20, ordering=('-reported_date', '-id'))
 
     return render(request, 'manager/incident_management.html', {
         'page_obj': page_obj,
+        'is_paginated': page_obj.has_other_pages(),
         'status_filter': status,
         'status_choices': Incident.STATUS_CHOICES
     })
 
+@role_required('manager')
 def tour_management(request):
     """View and manage all delivery tours"""
-    if not request.user.is_authenticated or request.user.role != 'manager':
-        return redirect('/auth/manager/login/')
-
     manager = request.user
 
-    tours = DeliveryTour.objects.select_related('driver', 'vehicle').annotate(
-        total_shipments=Count('tour_shipments')
-    ).all()
+    tours = DeliveryTour.objects.select_related('driver', 'vehicle').all()
 
     # Filters
     status = request.GET.get('status')
@@ -445,26 +441,21 @@ def tour_management(request):
     if date:
         tours = tours.filter(date=date)
 
-    tours = tours.order_by('-date', '-created_at')
-
     # Pagination
-    paginator = Paginator(tours, 15)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator, page_obj = paginate(request, tours, 15, ordering=('-date', '-id'))
 
     return render(request, 'manager/tour_management.html', {
         'page_obj': page_obj,
+        'is_paginated': page_obj.has_other_pages(),
         'status_choices': DeliveryTour.STATUS_CHOICES,
         'filters': {'status': status, 'date': date}
     })
 
 # ==================== REPORTS ====================
 
+@role_required('manager')
 def system_reports(request):
     """Generate various system reports"""
-    if not request.user.is_authenticated or request.user.role != 'manager':
-        return redirect('/auth/manager/login/')
-
     manager = request.user
 
     report_type = request.GET.get('type', 'summary')
@@ -472,9 +463,9 @@ def system_reports(request):
     if report_type == 'clients':
         # Client report
         clients = Client.objects.annotate(
-            shipment_count=Count('shipments'),
-            total_spent=Sum('invoices__amount_ttc'),
-            last_shipment_date=Max('shipments__created_at')
+            shipment_count=Coalesce(F('stats__total_shipments'), 0),
+            total_spent=Coalesce(F('stats__total_invoiced'), Decimal('0')),
+            last_shipment_date=F('stats__last_shipment_at')
         ).order_by('-total_spent')
 
         context = {
@@ -487,7 +478,7 @@ def system_reports(request):
         # Driver performance report
         drivers = Driver.objects.annotate(
             tours_completed=Count('tours', filter=Q(tours__status='completed')),
-            total_deliveries=Count('tours__tour_shipments')
+            total_deliveries=Coalesce(Sum('tours__total_shipments'), 0)
         ).order_by('-total_deliveries')
 
         context = {